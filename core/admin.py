@@ -0,0 +1,24 @@
+from django.contrib import admin
+
+from .models import TaskRun
+
+
+@admin.register(TaskRun)
+class TaskRunAdmin(admin.ModelAdmin):
+    list_display = ('func', 'status', 'started_at', 'queue_wait_ms', 'run_ms', 'db_queries', 'rss_growth_kb', 'has_profile')
+    list_filter = ('status', 'func', 'started_at')
+    search_fields = ('func', 'task_id', 'task_name')
+    date_hierarchy = 'started_at'
+    # Runs are recorded by core.task_metrics.measured_task, never edited by hand
+    readonly_fields = [field.name for field in TaskRun._meta.fields]
+
+    def has_profile(self, obj):
+        return bool(obj.profile)
+    has_profile.boolean = True
+    has_profile.short_description = 'Profiled'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
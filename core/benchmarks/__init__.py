@@ -0,0 +1,6 @@
+"""
+End-to-end benchmarks of the hot paths, run with `python manage.py run_benchmarks`.
+
+fixtures.py builds seeded synthetic data, scenarios.py measures it. The runner
+writes a JSON report that can be compared with the report of another commit.
+"""
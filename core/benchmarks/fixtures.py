@@ -0,0 +1,113 @@
+"""
+Seeded synthetic data for the benchmark suite. Every generator takes a numpy
+Generator so a given --seed always produces the same documents, vectors and rows.
+"""
+import uuid
+from io import BytesIO
+
+import numpy as np
+
+from actus.models import Actu
+from knowledge_base.bulk_load import copy_chunks
+from knowledge_base.models import DocumentChunk, KnowledgeDocument
+from push_notifications.models import ExpoPushToken, Notification, NotificationDelivery
+
+# Vocabulary of the synthetic French text (the station's own subjects: frequencies,
+# programmes, presenters, the towns along the motorways), so the lexical search leg
+# has real terms to match
+VOCABULARY = (
+    "radio fréquence 101.3 106.9 99.6 émetteur antenne direct écoute auditeur station MHz FM Abidjan "
+    "Singrobo Tiébissou Yamoussoukro Bouaké Toumodi autoroute route péage trafic bouchon "
+    "accident travaux déviation sécurité routière prudence vitesse météo pluie chauffeur "
+    "transporteur camion gare programme grille émission rubrique chronique journal flash "
+    "info matinale animateur animatrice présentateur invité interview rédaction jeu concert "
+    "musique dédicace podcast rediffusion horaire matin midi soir week-end lundi samedi "
+    "Autoroute Matin partenaire annonce communiqué abonnement application contact"
+).split()
+
+EMBEDDING_DIMENSIONS = DocumentChunk.EMBEDDING_DIMENSIONS
+PARAGRAPHS_PER_PAGE = 6
+WORDS_PER_PARAGRAPH = 70
+INSERT_BATCH_SIZE = 2000
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choice(VOCABULARY, size=words)).capitalize() + '.'
+
+
+def paragraphs(rng, pages):
+    return [sentence(rng, WORDS_PER_PARAGRAPH) for _ in range(pages * PARAGRAPHS_PER_PAGE)]
+
+
+def make_pdf(rng, pages):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate
+    from reportlab.lib.styles import getSampleStyleSheet
+
+    style = getSampleStyleSheet()['Normal']
+    story = []
+    for index, text in enumerate(paragraphs(rng, pages), start=1):
+        story.append(Paragraph(text, style))
+        if index % PARAGRAPHS_PER_PAGE == 0:
+            story.append(PageBreak())
+    output = BytesIO()
+    SimpleDocTemplate(output, pagesize=A4).build(story)
+    return output.getvalue()
+
+
+def make_docx(rng, pages):
+    import docx
+
+    document = docx.Document()
+    for text in paragraphs(rng, pages):
+        document.add_paragraph(text)
+    output = BytesIO()
+    document.save(output)
+    return output.getvalue()
+
+
+def random_unit_vectors(rng, count):
+    vectors = rng.standard_normal((count, EMBEDDING_DIMENSIONS)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_document(name, **fields):
+    """A COMPLETED document without a file, created without firing the processing signal."""
+    document = KnowledgeDocument(
+        original_filename=name, file=f'knowledge_base/{name}', status=KnowledgeDocument.Status.COMPLETED,
+        **fields)
+    KnowledgeDocument.objects.bulk_create([document])
+    return document
+
+
+def seed_chunks(rng, document, count):
+    """Adds `count` chunks with random unit embeddings (all three storage layouts filled)."""
+    for start in range(0, count, INSERT_BATCH_SIZE):
+        size = min(INSERT_BATCH_SIZE, count - start)
+        vectors = random_unit_vectors(rng, size)
+        texts = [sentence(rng, 40) for _ in range(size)]
+        copy_chunks(document, texts, vectors, is_searchable=document.status == KnowledgeDocument.Status.COMPLETED)
+
+
+def seed_tokens(count):
+    ExpoPushToken.objects.bulk_create(
+        [ExpoPushToken(token=f"ExponentPushToken[bench-{index:07d}]") for index in range(count)],
+        batch_size=INSERT_BATCH_SIZE)
+
+
+def seed_sent_deliveries(count):
+    """A notification already sent to `count` tokens, each delivery waiting for its receipt."""
+    seed_tokens(count)
+    notification = Notification.objects.create(title="Benchmark", body="Receipts", status='sent')
+    NotificationDelivery.objects.bulk_create([
+        NotificationDelivery(
+            notification=notification, expo_push_token=token,
+            push_ticket_id=str(uuid.uuid4()), status='sent_to_expo')
+        for token in ExpoPushToken.objects.all()
+    ], batch_size=INSERT_BATCH_SIZE)
+    return notification
+
+
+def seed_actus(rng, count):
+    # bulk_create: saving one by one would queue a push notification per Actu
+    Actu.objects.bulk_create([Actu(text=sentence(rng, 30)) for _ in range(count)], batch_size=INSERT_BATCH_SIZE)
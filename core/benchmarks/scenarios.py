@@ -0,0 +1,315 @@
+"""
+Benchmark scenarios. Each one seeds its own data (the runner flushes the database
+before each scenario) and returns {case: {metric: value}}; latencies are in milliseconds.
+"""
+import functools
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from core.fake_services.gemini import FakeGeminiServer
+from core.instrumentation import end_timings, start_timings
+from core.models import TaskRun
+from knowledge_base.models import DocumentChunk, KnowledgeDocument
+from knowledge_base.retrieval import (
+    MODE_HYBRID, STORAGE_BINARY, STORAGE_FULL, STORAGE_HALF, VECTOR_STORAGES, search_chunks, vector_search)
+from knowledge_base.vector_snapshot import clear_snapshot_cache, refresh_snapshot
+from push_notifications.models import ExpoPushToken, Notification, NotificationDelivery
+from push_notifications.services import check_expo_push_receipts, send_expo_push_messages
+from services.gemini_service import GEMINI_MODEL, HedgedGenerator, call_model
+
+from . import fixtures
+
+RECEIPT_BATCH_SIZE = 100  # As queued by poll_and_schedule_receipt_checks_task
+GEMINI_FALLBACK_MODEL = 'gemini-2.0-flash-lite'
+GEMINI_CLIENTS = 8  # Concurrent questions in gemini_answer
+
+
+def summarize(latencies_ms):
+    latencies = np.asarray(latencies_ms)
+    return {
+        'n': len(latencies),
+        'mean_ms': round(float(latencies.mean()), 3),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+    }
+
+
+def timed(func, *args, **kwargs):
+    """Runs func and returns (result, elapsed ms, Timings with its spans and DB activity)."""
+    timings, token = start_timings()
+    started = time.perf_counter()
+    try:
+        with connection.execute_wrapper(timings.db_wrapper):
+            result = func(*args, **kwargs)
+    finally:
+        end_timings(token)
+    return result, (time.perf_counter() - started) * 1000, timings
+
+
+def stage_ms(timings):
+    return {name: round(seconds * 1000, 3) for name, seconds in timings.spans.items()}
+
+
+def ingestion(rng, options):
+    """process_document on synthetic PDF and DOCX files of increasing size."""
+    from knowledge_base.tasks import process_document
+
+    builders = {'pdf': fixtures.make_pdf, 'docx': fixtures.make_docx}
+    results = {}
+    for pages in options['document_pages']:
+        for extension, build in builders.items():
+            content = build(rng, pages)
+            document = KnowledgeDocument(original_filename=f"bench-{pages}p.{extension}")
+            document.file.save(document.original_filename, ContentFile(content), save=False)
+            # bulk_create skips post_save, which would enqueue a second processing task
+            KnowledgeDocument.objects.bulk_create([document])
+
+            process_document(document.id)
+
+            document.refresh_from_db()
+            run = TaskRun.objects.filter(func='knowledge_base.tasks.process_document').latest('started_at')
+            results[f"{extension}_{pages}p"] = {
+                'bytes': len(content),
+                'status': document.status,
+                'chunks': document.chunks.count(),
+                'total_ms': round(run.run_ms, 3),
+                'stages_ms': run.stages,
+                'db_queries': run.db_queries,
+            }
+    return results
+
+
+def vector_query(rng, options):
+    """
+    Retrieval latency per storage layout as the corpus grows to each --chunk-counts size.
+    The in-process snapshot is rebuilt after each seeding (seeding doesn't change the
+    stamp it follows); recall@k of each layout is measured against the exact float32 scan.
+    """
+    document = fixtures.make_document('bench-corpus.pdf')
+    queries = fixtures.random_unit_vectors(rng, options['queries'])
+    questions = [fixtures.sentence(rng, 8) for _ in range(options['queries'])]
+    top_k = options['top_k']
+    results = {}
+    seeded = 0
+    with tempfile.TemporaryDirectory() as snapshot_dir, override_settings(KNOWLEDGE_VECTOR_SNAPSHOT_DIR=snapshot_dir):
+        for count in sorted(options['chunk_counts']):
+            fixtures.seed_chunks(rng, document, count - seeded)
+            seeded = count
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {DocumentChunk._meta.db_table}")
+            _, build_ms, _ = timed(refresh_snapshot, force=True)
+
+            exact = [{chunk.id for chunk in vector_search(query, top_k, storage=STORAGE_FULL)} for query in queries]
+            case = {'snapshot_build': {'ms': round(build_ms, 3)}}
+            for storage in VECTOR_STORAGES:
+                latencies = []
+                recalls = []
+                for query, expected in zip(queries, exact):
+                    found, elapsed, _ = timed(lambda: list(vector_search(query, top_k, storage=storage)))
+                    latencies.append(elapsed)
+                    recalls.append(len(expected & {chunk.id for chunk in found}) / max(len(expected), 1))
+                case[storage] = {**summarize(latencies), 'recall': round(float(np.mean(recalls)), 3)}
+            latencies = [timed(search_chunks, question, query, top_k, mode=MODE_HYBRID)[1]
+                         for question, query in zip(questions, queries)]
+            case['hybrid'] = summarize(latencies)
+            results[f"{count}_chunks"] = case
+        clear_snapshot_cache()
+    return results
+
+
+def filtered_query(rng, options):
+    """
+    Scoped retrieval (document category/tag/id filters) per storage layout, with and
+    without iterative HNSW scans, at each --chunk-counts size spread over 100 documents.
+    Recall is measured against an exact scan with the same filter.
+    """
+    documents = [
+        fixtures.make_document(
+            f'bench-scoped-{index}.pdf',
+            category='programmes' if index < 10 else 'general',
+            tags=['rare'] if index == 10 else [],
+        )
+        for index in range(100)
+    ]
+    filters = {
+        'unfiltered': {},
+        'category_10pct': {'category': 'programmes'},
+        'tag_1pct': {'tags': ['rare']},
+        'one_document': {'document_ids': [documents[50].id]},
+    }
+    queries = fixtures.random_unit_vectors(rng, options['queries'])
+    top_k = options['top_k']
+    results = {}
+    seeded = 0
+    for count in sorted(options['chunk_counts']):
+        added, remainder = divmod(count - seeded, len(documents))
+        for index, document in enumerate(documents):
+            fixtures.seed_chunks(rng, document, added + (index < remainder))
+        seeded = count
+        # Cases are labelled with the corpus size: nothing else may be searched
+        assert DocumentChunk.objects.count() == count, "filtered_query must start from an empty database"
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {DocumentChunk._meta.db_table}")
+
+        case = {}
+        for label, scope in filters.items():
+            exact = [{chunk.id for chunk in vector_search(query, top_k, storage=STORAGE_FULL, filters=scope)}
+                     for query in queries]
+            variants = {STORAGE_FULL: (STORAGE_FULL, True)}
+            for storage in (STORAGE_HALF, STORAGE_BINARY):
+                variants[storage] = (storage, True)
+                variants[f"{storage}_no_iterative_scan"] = (storage, False)
+            scope_results = {}
+            for name, (storage, iterative) in variants.items():
+                latencies = []
+                recalls = []
+                with override_settings(KNOWLEDGE_HNSW_ITERATIVE_SCAN=iterative):
+                    for query, expected in zip(queries, exact):
+                        chunks, elapsed_ms, _ = timed(vector_search, query, top_k, storage=storage, filters=scope)
+                        latencies.append(elapsed_ms)
+                        recalls.append(len(expected & {chunk.id for chunk in chunks}) / len(expected)
+                                       if expected else 1.0)
+                scope_results[name] = {**summarize(latencies), 'recall': round(float(np.mean(recalls)), 4)}
+            case[label] = scope_results
+        results[f"{count}_chunks"] = case
+    return results
+
+
+def broadcast(rng, options):
+    """send_expo_push_messages fan-out to every active token, against the fake Expo server."""
+    results = {}
+    for count in options['token_counts']:
+        ExpoPushToken.objects.all().delete()
+        fixtures.seed_tokens(count)
+        notification = Notification.objects.create(title="Benchmark", body="Fan-out")
+
+        _, elapsed_ms, timings = timed(send_expo_push_messages, notification.id)
+
+        notification.refresh_from_db()
+        results[f"{count}_tokens"] = {
+            'status': notification.status,
+            'total_ms': round(elapsed_ms, 3),
+            'stages_ms': stage_ms(timings),
+            'db_queries': timings.db_queries,
+            'messages_per_s': round(count / (elapsed_ms / 1000), 1),
+        }
+    return results
+
+
+def receipts(rng, options):
+    """check_expo_push_receipts over every pending delivery, in the batches the poller queues."""
+    results = {}
+    for count in options['token_counts']:
+        ExpoPushToken.objects.all().delete()
+        fixtures.seed_sent_deliveries(count)
+        delivery_ids = list(NotificationDelivery.objects.values_list('id', flat=True))
+
+        batch_latencies = []
+        db_queries = 0
+        started = time.perf_counter()
+        for start in range(0, len(delivery_ids), RECEIPT_BATCH_SIZE):
+            _, elapsed_ms, timings = timed(check_expo_push_receipts, delivery_ids[start:start + RECEIPT_BATCH_SIZE])
+            batch_latencies.append(elapsed_ms)
+            db_queries += timings.db_queries
+        total_ms = (time.perf_counter() - started) * 1000
+
+        results[f"{count}_deliveries"] = {
+            'total_ms': round(total_ms, 3),
+            'batch': summarize(batch_latencies),
+            'db_queries': db_queries,
+            'receipts_ok': NotificationDelivery.objects.filter(status='receipt_ok').count(),
+        }
+    return results
+
+
+def actu_feed(rng, options):
+    """GET /api/actus/actus/, first and last page, as the feed grows."""
+    client = Client()
+    results = {}
+    seeded = 0
+    for count in sorted(options['actu_counts']):
+        fixtures.seed_actus(rng, count - seeded)
+        seeded = count
+        last_page = -(-count // settings.REST_FRAMEWORK['PAGE_SIZE'])
+        case = {}
+        for label, page in (('first_page', 1), ('last_page', last_page)):
+            latencies = []
+            for _ in range(options['repeat']):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    client.get('/api/actus/actus/', {'page': page})
+                    latencies.append((time.perf_counter() - started) * 1000)
+            case[label] = {**summarize(latencies), 'db_queries': len(queries)}
+        results[f"{count}_actus"] = case
+    return results
+
+
+def gemini_answer(rng, options):
+    """
+    Answer latency against a fake Gemini where some calls are very slow, with a single
+    call per question and with hedging and the fallback model (HedgedGenerator).
+    """
+    from google import genai
+    from google.genai import types
+
+    configurations = {
+        'single_call': {'hedge': False, 'fallback_model': None},
+        'hedged': {'hedge': True, 'fallback_model': GEMINI_FALLBACK_MODEL},
+    }
+    results = {}
+    for name, configuration in configurations.items():
+        with FakeGeminiServer(
+                latency_ms=options['gemini_latency_ms'], jitter_ms=options['gemini_latency_ms'] / 2,
+                slow_rate=options['gemini_slow_rate'], slow_ms=options['gemini_slow_ms'],
+                model_latency_ms={GEMINI_FALLBACK_MODEL: options['gemini_latency_ms'] / 2},
+                seed=options['seed']) as fake:
+            client = genai.Client(api_key='benchmark', http_options=types.HttpOptions(base_url=fake.url))
+            generator = HedgedGenerator(
+                call=functools.partial(call_model, client=client), model=GEMINI_MODEL, **configuration)
+            def answer(_):
+                started = time.perf_counter()
+                generator.generate("Quelle est la fréquence de FER FM à Bouaké ?", "extrait")
+                return (time.perf_counter() - started) * 1000
+
+            with ThreadPoolExecutor(max_workers=GEMINI_CLIENTS) as clients:
+                # Until the generator has seen enough calls, hedges wait a fixed delay
+                list(clients.map(answer, range(generator.latencies.min_samples)))
+                before = generator.stats()
+                calls = fake.requests_received
+                latencies = list(clients.map(answer, range(options['gemini_requests'])))
+            stats = generator.stats()
+            generator.executor.shutdown(wait=False, cancel_futures=True)
+        answers = {source: stats.get(source, 0) - before.get(source, 0)
+                   for source in ('primary', 'hedge', 'fallback', 'extractive')}
+        hedges = stats.get('hedge_calls', 0) - before.get('hedge_calls', 0)
+        results[name] = {
+            **summarize(latencies),
+            'answers_by_source': answers,
+            'hedge_rate': round(hedges / len(latencies), 4),
+            'upstream_calls_per_answer': round((fake.requests_received - calls) / len(latencies), 3),
+            'hedge_delay_ms': stats['hedge_delay_ms'],
+        }
+    for quantile in ('p95_ms', 'p99_ms'):
+        results[f"{quantile[:-3]}_speedup"] = round(
+            results['single_call'][quantile] / results['hedged'][quantile], 2)
+    return results
+
+
+SCENARIOS = {
+    'ingestion': ingestion,
+    'vector_query': vector_query,
+    'filtered_query': filtered_query,
+    'broadcast': broadcast,
+    'receipts': receipts,
+    'actu_feed': actu_feed,
+    'gemini_answer': gemini_answer,
+}
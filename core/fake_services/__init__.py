@@ -0,0 +1,78 @@
+"""
+Local stand-ins for the external services the backend calls, so benchmarks and
+load tests can run offline without sending real push notifications.
+
+Each fake is an HTTP server on a local port running in a daemon thread:
+
+    with FakeExpoServer(latency_ms=50) as expo:
+        # point settings.EXPO_PUSH_HOST at expo.url
+        ...
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class JSONRequestHandler(BaseHTTPRequestHandler):
+    """Request handler exchanging JSON bodies; `self.fake` is the owning FakeServer."""
+    protocol_version = 'HTTP/1.1'  # Keep-alive, as the real services allow
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'null')
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def simulate_latency(self):
+        if self.fake.latency_ms:
+            time.sleep(self.fake.latency_ms / 1000)
+
+    def log_message(self, format, *args):
+        pass  # One line per request would drown the benchmark output
+
+
+class FakeServer:
+    """Serves `handler_class` on host:port (0 picks a free port) in a daemon thread."""
+    handler_class = JSONRequestHandler
+
+    def __init__(self, latency_ms=0, host='127.0.0.1', port=0):
+        self.latency_ms = latency_ms
+        self.host = host
+        self.port = port
+        self.httpd = None
+        self.lock = threading.Lock()  # Guards the counters updated by handler threads
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        self.httpd = ThreadingHTTPServer((self.host, self.port), self.handler_class)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self
+        self.port = self.httpd.server_address[1]
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,59 @@
+import random
+import uuid
+
+from . import FakeServer, JSONRequestHandler
+
+
+class ExpoHandler(JSONRequestHandler):
+    """The two Expo push API endpoints used by push_notifications.services."""
+
+    def do_POST(self):
+        payload = self.read_json()
+        self.simulate_latency()
+        if self.path.startswith('/--/api/v2/push/send'):
+            messages = payload if isinstance(payload, list) else [payload]
+            with self.fake.lock:
+                self.fake.messages_received += len(messages)
+                tickets = [self.fake.ticket() for _ in messages]
+            self.send_json({'data': tickets})
+        elif self.path.startswith('/--/api/v2/push/getReceipts'):
+            ids = payload.get('ids', [])
+            with self.fake.lock:
+                self.fake.receipts_requested += len(ids)
+                receipts = {ticket_id: self.fake.receipt() for ticket_id in ids}
+            self.send_json({'data': receipts})
+        else:
+            self.send_json({'errors': [{'code': 'NOT_FOUND', 'message': self.path}]}, status=404)
+
+
+class FakeExpoServer(FakeServer):
+    """
+    Accepts push messages and reports receipts like the Expo push API.
+    By default every message is accepted and delivered; `ticket_error_rate` and
+    `receipt_error_rate` make that share of tickets/receipts fail with
+    DeviceNotRegistered, as Expo reports uninstalled apps.
+    Point settings.EXPO_PUSH_HOST at `url` to use it.
+    """
+    handler_class = ExpoHandler
+
+    def __init__(self, *args, ticket_error_rate=0.0, receipt_error_rate=0.0, seed=0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ticket_error_rate = ticket_error_rate
+        self.receipt_error_rate = receipt_error_rate
+        self.random = random.Random(seed)
+        self.messages_received = 0
+        self.receipts_requested = 0
+
+    def device_not_registered(self):
+        return {'status': 'error', 'message': 'The recipient device is not registered with FCM.',
+                'details': {'error': 'DeviceNotRegistered'}}
+
+    def ticket(self):
+        if self.random.random() < self.ticket_error_rate:
+            return self.device_not_registered()
+        return {'status': 'ok', 'id': str(uuid.uuid4())}
+
+    def receipt(self):
+        if self.random.random() < self.receipt_error_rate:
+            return self.device_not_registered()
+        return {'status': 'ok'}
@@ -0,0 +1,89 @@
+import json
+import random
+import re
+import time
+from collections import Counter
+
+from . import FakeServer, JSONRequestHandler
+
+DEFAULT_ANSWER = (
+    "FER FM émet sur 101.3 MHz à Abidjan, 106.9 MHz à Singrobo et 99.6 MHz à Tiébissou. "
+    "Puis-je vous aider sur autre chose à propos de FER FM ?")
+
+
+class GeminiHandler(JSONRequestHandler):
+    """`models/<model>:generateContent` and `:streamGenerateContent?alt=sse` of the Gemini API."""
+
+    def do_POST(self):
+        self.read_json()
+        fake = self.fake
+        model = re.search(r'models/([^:/]+):', self.path)
+        model = model.group(1) if model else ''
+        with fake.lock:
+            fake.requests_received += 1
+            fake.requests_by_model[model] += 1
+            failed = fake.random.random() < fake.error_rate
+            delay_ms = fake.random.uniform(0, fake.jitter_ms)
+            if fake.random.random() < fake.slow_rate:
+                delay_ms += fake.slow_ms
+        # Time to first token
+        time.sleep((fake.model_latency_ms.get(model, fake.latency_ms) + delay_ms) / 1000)
+        if failed:
+            self.send_json({'error': {'code': 503, 'message': 'The model is overloaded.', 'status': 'UNAVAILABLE'}},
+                           status=503)
+        elif ':streamGenerateContent' in self.path:
+            self.stream_answer()
+        elif ':generateContent' in self.path:
+            self.send_json(self.response_payload(fake.answer))
+        else:
+            self.send_json({'error': {'code': 404, 'message': self.path, 'status': 'NOT_FOUND'}}, status=404)
+
+    def response_payload(self, text):
+        return {
+            'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}, 'finishReason': 'STOP'}],
+            'usageMetadata': {'candidatesTokenCount': len(text.split())},
+        }
+
+    def stream_answer(self):
+        # Server-sent events over chunked transfer encoding, one event per chunk of words
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        words = self.fake.answer.split(' ')
+        size = self.fake.stream_chunk_words
+        for start in range(0, len(words), size):
+            if start:
+                time.sleep(self.fake.stream_chunk_delay_ms / 1000)
+            text = ' '.join(words[start:start + size]) + ' '
+            event = f"data: {json.dumps(self.response_payload(text))}\r\n\r\n".encode()
+            self.wfile.write(f"{len(event):X}\r\n".encode() + event + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class FakeGeminiServer(FakeServer):
+    """
+    Answers every prompt with a fixed text after `latency_ms` (+ up to `jitter_ms`);
+    `model_latency_ms` overrides the latency of some models (e.g. a lighter one).
+    `slow_rate` of the calls take `slow_ms` more, the tail latency hedging cuts, and
+    `error_rate` of them fail with 503. Streamed answers arrive in chunks of
+    `stream_chunk_words` words, `stream_chunk_delay_ms` apart.
+    Point settings.GEMINI_BASE_URL at `url` to use it.
+    """
+    handler_class = GeminiHandler
+
+    def __init__(self, *args, jitter_ms=0, error_rate=0.0, slow_rate=0.0, slow_ms=0, model_latency_ms=None,
+                 stream_chunk_words=5, stream_chunk_delay_ms=20, answer=DEFAULT_ANSWER, seed=0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.model_latency_ms = model_latency_ms or {}
+        self.stream_chunk_words = stream_chunk_words
+        self.stream_chunk_delay_ms = stream_chunk_delay_ms
+        self.answer = answer
+        self.random = random.Random(seed)
+        self.requests_received = 0
+        self.requests_by_model = Counter()
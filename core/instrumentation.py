@@ -0,0 +1,97 @@
+"""
+Request and task performance instrumentation.
+
+`span(name)` times a block of code. The duration is recorded in the
+`ferfm_span_duration_seconds` Prometheus histogram and, while timings are being
+collected, in the current `Timings`: during an HTTP request they are exported as a
+`Server-Timing` header by core.middleware.PerformanceMiddleware, during a Django-Q
+task they are stored as the task's stages by core.task_metrics.measured_task.
+
+Metrics are exposed by the /metrics view (core/views.py). With several gunicorn
+workers, set PROMETHEUS_MULTIPROC_DIR (gunicorn.conf.py does) so every worker's
+samples are aggregated instead of whichever worker answers the scrape.
+"""
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import Counter, Histogram
+
+# Covers fast DB lookups up to slow Gemini calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REQUEST_DURATION = Histogram(
+    'ferfm_http_request_duration_seconds', 'HTTP request duration.',
+    ['method', 'route', 'status'], buckets=LATENCY_BUCKETS)
+SPAN_DURATION = Histogram(
+    'ferfm_span_duration_seconds', 'Duration of instrumented code spans.',
+    ['span'], buckets=LATENCY_BUCKETS)
+DB_QUERIES_PER_REQUEST = Histogram(
+    'ferfm_db_queries_per_request', 'Database queries executed per HTTP request.',
+    ['route'], buckets=(0, 1, 2, 5, 10, 20, 50, 100, 500))
+DB_TIME_PER_REQUEST = Histogram(
+    'ferfm_db_time_per_request_seconds', 'Time spent in database queries per HTTP request.',
+    ['route'], buckets=LATENCY_BUCKETS)
+REQUEST_ERRORS = Counter(
+    'ferfm_http_request_exceptions_total', 'Unhandled exceptions raised by views.', ['route'])
+
+
+class Timings:
+    """Accumulator of span durations and database activity for one request or task."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = OrderedDict()  # span name -> total seconds
+        self.db_queries = 0
+        self.db_seconds = 0.0
+
+    def add_span(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        """connection.execute_wrapper() hook counting and timing every query."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_queries += 1
+            self.db_seconds += time.perf_counter() - started
+
+    def server_timing(self):
+        """Formats the timings as a Server-Timing header value (durations in ms)."""
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.spans.items()]
+        entries.append(f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_queries} queries"')
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ', '.join(entries)
+
+
+_current_timings = ContextVar('timings', default=None)
+
+
+def start_timings():
+    """Starts collecting timings for the current request or task; returns (timings, reset token)."""
+    timings = Timings()
+    return timings, _current_timings.set(timings)
+
+
+def end_timings(token):
+    _current_timings.reset(token)
+
+
+def current_timings():
+    return _current_timings.get()
+
+
+@contextmanager
+def span(name):
+    """Times the enclosed block as `name` (see module docstring)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        SPAN_DURATION.labels(span=name).observe(elapsed)
+        timings = _current_timings.get()
+        if timings is not None:
+            timings.add_span(name, elapsed)
@@ -0,0 +1,83 @@
+import os
+import re
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Each scenario is run in a fresh interpreter so nothing is already imported.
+# 'web' creates the WSGI app and resolves the URLconf, as a gunicorn worker does on its first request.
+WEB_BOOT = (
+    "import os; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings');"
+    "from core.wsgi import application;"
+    "from django.urls import get_resolver; get_resolver().url_patterns"
+)
+# What a qcluster worker imports before running its first task
+QCLUSTER_BOOT = (
+    "import os; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings');"
+    "import django; django.setup();"
+    "import django_q.cluster, knowledge_base.tasks, push_notifications.tasks"
+)
+SCENARIOS = {
+    'web': ['-c', WEB_BOOT],
+    'qcluster': ['-c', QCLUSTER_BOOT],
+    'check': ['manage.py', 'check'],
+    'wait_for_db': ['manage.py', 'wait_for_db'],
+    'migrate': ['manage.py', 'migrate', '--plan'],
+    'showmigrations': ['manage.py', 'showmigrations'],
+}
+
+# "import time:      1234 |      56789 | package.module"
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+class Command(BaseCommand):
+    """
+    Measures process startup: wall clock per scenario, and a `python -X importtime` summary
+    (total import time and the slowest top-level imports) to spot heavy module-level imports.
+    """
+    help = 'Benchmarks startup time of the web process and management commands.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*',
+                            help=f"Scenarios to run (default: all): {', '.join(SCENARIOS)}")
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--top', type=int, default=8, help='Slowest top-level imports to list.')
+
+    def run_scenario(self, argv, importtime=False):
+        command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + argv
+        started = time.perf_counter()
+        result = subprocess.run(command, cwd=settings.BASE_DIR, env=os.environ.copy(),
+                                capture_output=True, text=True)
+        return time.perf_counter() - started, result
+
+    def handle(self, *args, **options):
+        unknown = set(options['scenarios']) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        for name in options['scenarios'] or SCENARIOS:
+            argv = SCENARIOS[name]
+            walls = []
+            for _ in range(options['repeat']):
+                wall, result = self.run_scenario(argv)
+                walls.append(wall)
+            status = 'ok' if result.returncode == 0 else f'exit {result.returncode}'
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{name}: wall min {min(walls):.2f}s / max {max(walls):.2f}s ({status})"))
+
+            _, result = self.run_scenario(argv, importtime=True)
+            top_level = []
+            total_us = 0
+            for line in result.stderr.splitlines():
+                match = IMPORTTIME_LINE.match(line)
+                if not match:
+                    continue
+                self_us, cumulative_us, indent, module = match.groups()
+                total_us += int(self_us)
+                if len(indent) == 1:  # imported directly, not as a dependency of another import
+                    top_level.append((int(cumulative_us), module))
+            self.stdout.write(f"  imports: {total_us / 1e6:.2f}s total")
+            for cumulative_us, module in sorted(top_level, reverse=True)[:options['top']]:
+                self.stdout.write(f"    {cumulative_us / 1e6:6.2f}s  {module}")
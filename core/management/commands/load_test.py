@@ -0,0 +1,153 @@
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarks.scenarios import summarize
+
+QUESTIONS_FILE = settings.BASE_DIR / 'knowledge_base' / 'benchmarks' / 'retrieval_questions.json'
+
+
+def query(session, base_url, rng, questions):
+    return session.post(f"{base_url}/api/knowledge/query/", json={'question': rng.choice(questions)})
+
+
+def register_token(session, base_url, rng, questions):
+    # A new device most of the time, an already registered one (update path) otherwise
+    device = uuid.uuid4().hex if rng.random() < 0.8 else f"loadtest-{rng.randrange(100)}"
+    return session.post(f"{base_url}/api/push_notifications/register-token/",
+                        json={'token': f"ExponentPushToken[{device}]"})
+
+
+def actus(session, base_url, rng, questions):
+    return session.get(f"{base_url}/api/actus/actus/", params={'page': rng.choice([1, 1, 1, 2, 3])})
+
+
+SCENARIOS = {
+    'query': query,
+    'register_token': register_token,
+    'actus': actus,
+}
+
+
+def parse_mix(value):
+    """'query=1,actus=5' -> {'query': 1.0, 'actus': 5.0}"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise CommandError(f"Unknown scenario '{name}' in --mix (choose from {', '.join(SCENARIOS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Command(BaseCommand):
+    """
+    Drives a running server with concurrent virtual users for --duration seconds and
+    reports throughput and latency percentiles per endpoint. Run it against a server
+    using the local stand-ins (python manage.py run_fake_services) so no query hits
+    Gemini and no notification reaches Expo. Requests are throttled per client IP
+    (API_ANON_THROTTLE_RATE, API_USER_THROTTLE_RATE); raise both on the server under test.
+    """
+    help = 'Load-tests the knowledge query, token registration and Actu feed endpoints.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=20, help='Virtual users.')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds.')
+        parser.add_argument('--warmup', type=float, default=5, help='Seconds of load not recorded.')
+        parser.add_argument('--mix', default='query=1,register_token=2,actus=7',
+                            help='Relative weight of each scenario.')
+        parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the report as JSON to this file.')
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options['mix'])
+        with open(QUESTIONS_FILE) as questions_file:
+            questions = [item['question'] for item in json.load(questions_file)]
+        base_url = options['base_url'].rstrip('/')
+        samples = []  # (scenario, status, latency ms), status 0 for connection errors/timeouts
+        lock = threading.Lock()
+        started = time.monotonic()
+        record_from = started + options['warmup']
+        stop_at = record_from + options['duration']
+
+        def virtual_user(index):
+            rng = random.Random(options['seed'] * 1000 + index)
+            names, weights = list(mix), list(mix.values())
+            with requests.Session() as session:
+                session.request = _with_timeout(session.request, options['timeout'])
+                while time.monotonic() < stop_at:
+                    name = rng.choices(names, weights)[0]
+                    request_started = time.monotonic()
+                    try:
+                        status = SCENARIOS[name](session, base_url, rng, questions).status_code
+                    except requests.RequestException:
+                        status = 0
+                    if request_started >= record_from:
+                        with lock:
+                            samples.append((name, status, (time.monotonic() - request_started) * 1000))
+
+        self.stdout.write(
+            f"{options['concurrency']} users against {base_url} for {options['warmup']:.0f}s warm-up "
+            f"+ {options['duration']:.0f}s...")
+        threads = [threading.Thread(target=virtual_user, args=(index,), daemon=True)
+                   for index in range(options['concurrency'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if not samples:
+            raise CommandError("No request completed during the measured period.")
+
+        report = self.report(samples, time.monotonic() - record_from, options)
+        for name, result in report['scenarios'].items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(
+                f"  {result['requests']} requests, {result['throughput_rps']} req/s, "
+                f"{result['errors']} errors, statuses {result['statuses']}")
+            self.stdout.write(
+                f"  latency ms: p50 {result['latency']['p50_ms']}  p95 {result['latency']['p95_ms']}  "
+                f"p99 {result['latency']['p99_ms']}")
+        total = report['total']
+        self.stdout.write(self.style.SUCCESS(
+            f"Total: {total['requests']} requests, {total['throughput_rps']} req/s, {total['errors']} errors"))
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                json.dump(report, report_file, indent=2, sort_keys=True)
+
+    def report(self, samples, elapsed, options):
+        by_scenario = defaultdict(list)
+        for sample in samples:
+            by_scenario[sample[0]].append(sample)
+
+        def summary(group):
+            statuses = Counter(str(status) for _, status, _ in group)
+            return {
+                'requests': len(group),
+                'throughput_rps': round(len(group) / elapsed, 2),
+                'errors': sum(1 for _, status, _ in group if not 200 <= status < 300),
+                'statuses': dict(statuses),
+                'latency': summarize([latency for _, _, latency in group]),
+            }
+
+        return {
+            'parameters': {name: options[name] for name in ('base_url', 'concurrency', 'duration', 'mix', 'seed')},
+            'elapsed_s': round(elapsed, 2),
+            'scenarios': {name: summary(group) for name, group in sorted(by_scenario.items())},
+            'total': summary(samples),
+        }
+
+
+def _with_timeout(request, timeout):
+    def request_with_timeout(method, url, **kwargs):
+        kwargs.setdefault('timeout', timeout)
+        return request(method, url, **kwargs)
+    return request_with_timeout
@@ -0,0 +1,58 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+SMAPS_FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty')
+
+
+def read_smaps_rollup(pid):
+    """Returns the memory counters (in kB) of a process from /proc/<pid>/smaps_rollup."""
+    values = {}
+    for line in Path(f'/proc/{pid}/smaps_rollup').read_text().splitlines():
+        name, _, rest = line.partition(':')
+        if name in SMAPS_FIELDS:
+            values[name] = int(rest.split()[0])
+    return values
+
+
+def child_pids(pid):
+    children = []
+    for task in Path(f'/proc/{pid}/task').iterdir():
+        children.extend(int(child) for child in (task / 'children').read_text().split())
+    return children
+
+
+class Command(BaseCommand):
+    """
+    Reports memory of a running gunicorn master and its workers (Linux only).
+    RSS counts shared pages in every process; PSS splits them between the processes
+    sharing them, so the PSS total is the real footprint. Run once with
+    GUNICORN_PRELOAD=False and once with the default preload to compare.
+    """
+    help = 'Reports RSS/PSS/shared/private memory of the gunicorn master and each worker.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pidfile', default='/tmp/gunicorn.pid')
+        parser.add_argument('--pid', type=int, help='Master PID (overrides --pidfile).')
+
+    def handle(self, *args, **options):
+        try:
+            master = options['pid'] or int(Path(options['pidfile']).read_text().strip())
+            processes = [('master', master)] + [('worker', pid) for pid in child_pids(master)]
+            rows = [(role, pid, read_smaps_rollup(pid)) for role, pid in processes]
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read gunicorn process memory: {e}")
+
+        self.stdout.write(f"{'role':<8}{'pid':>8}{'RSS MB':>10}{'PSS MB':>10}{'shared MB':>11}{'private MB':>12}")
+        for role, pid, mem in rows:
+            shared = mem['Shared_Clean'] + mem['Shared_Dirty']
+            private = mem['Private_Clean'] + mem['Private_Dirty']
+            self.stdout.write(
+                f"{role:<8}{pid:>8}{mem['Rss'] / 1024:>10.1f}{mem['Pss'] / 1024:>10.1f}"
+                f"{shared / 1024:>11.1f}{private / 1024:>12.1f}")
+        workers = [mem for role, _, mem in rows if role == 'worker']
+        if workers:
+            self.stdout.write(
+                f"mean worker RSS {sum(m['Rss'] for m in workers) / len(workers) / 1024:.1f} MB, "
+                f"mean worker private {sum(m['Private_Clean'] + m['Private_Dirty'] for m in workers) / len(workers) / 1024:.1f} MB, "
+                f"total PSS {sum(mem['Pss'] for _, _, mem in rows) / 1024:.1f} MB")
@@ -0,0 +1,148 @@
+import json
+import platform
+import subprocess
+import tempfile
+import time
+
+import django
+import numpy as np
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    override_settings, setup_databases, setup_test_environment, teardown_databases,
+    teardown_test_environment)
+from django.utils import timezone
+
+from core.benchmarks.scenarios import SCENARIOS
+from core.fake_services.expo import FakeExpoServer
+from knowledge_base.embedding_versions import clear_version_cache
+from knowledge_base.faq import clear_index_cache
+from knowledge_base.vector_snapshot import clear_snapshot_cache
+
+
+def flatten(results, prefix=''):
+    """{'a': {'b': 1}} -> {'a.b': 1}, numeric leaves only, for comparing reports."""
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{path}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+class Command(BaseCommand):
+    """
+    Runs the benchmark scenarios (core/benchmarks) in a throwaway test database, so
+    existing data is never touched. The database is flushed before each scenario, which
+    seeds its own fixtures from --seed: its results don't depend on the scenarios run
+    before it.
+    Push notifications go to a local fake Expo server. The JSON report records the
+    commit and environment; --compare prints the change of every metric against
+    the report of another run.
+    """
+    help = 'Benchmarks ingestion, retrieval, push fan-out, receipts, the Actu feed and Gemini answers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*',
+                            help=f"Scenarios to run (default: all): {', '.join(SCENARIOS)}")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', default='benchmark-report.json')
+        parser.add_argument('--compare', metavar='REPORT', help='Earlier report to compare against.')
+        parser.add_argument('--document-pages', type=int, nargs='+', default=[1, 10, 50])
+        parser.add_argument('--chunk-counts', type=int, nargs='+', default=[10_000],
+                            help='Corpus sizes for vector_query, e.g. 10000 100000 1000000.')
+        parser.add_argument('--token-counts', type=int, nargs='+', default=[10_000],
+                            help='Push token counts for broadcast/receipts, e.g. 10000 100000.')
+        parser.add_argument('--actu-counts', type=int, nargs='+', default=[100, 10_000])
+        parser.add_argument('--queries', type=int, default=100, help='Queries per vector_query case.')
+        parser.add_argument('--top-k', type=int, default=5)
+        parser.add_argument('--repeat', type=int, default=50, help='Requests per actu_feed case.')
+        parser.add_argument('--expo-latency-ms', type=float, default=0,
+                            help='Latency added by the fake Expo server to every call.')
+        parser.add_argument('--gemini-requests', type=int, default=200, help='Questions per gemini_answer case.')
+        parser.add_argument('--gemini-latency-ms', type=float, default=300)
+        parser.add_argument('--gemini-slow-rate', type=float, default=0.05,
+                            help='Share of fake Gemini calls taking --gemini-slow-ms more.')
+        parser.add_argument('--gemini-slow-ms', type=float, default=4000)
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or list(SCENARIOS)
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        report = {'meta': self.environment(options), 'results': {}}
+        verbosity = options['verbosity']
+        setup_test_environment()
+        old_config = setup_databases(verbosity=verbosity, interactive=False)
+        try:
+            with tempfile.TemporaryDirectory() as media_root, \
+                    FakeExpoServer(latency_ms=options['expo_latency_ms']) as expo, \
+                    override_settings(MEDIA_ROOT=media_root, EXPO_PUSH_HOST=expo.url):
+                report['meta']['postgres'] = connection.cursor().connection.info.server_version
+                for name in names:
+                    self.stdout.write(self.style.MIGRATE_HEADING(f"{name}..."))
+                    self.reset()
+                    started = time.perf_counter()
+                    # Each scenario gets the same seed, so adding one doesn't change the others' data
+                    report['results'][name] = SCENARIOS[name](np.random.default_rng(options['seed']), options)
+                    self.stdout.write(f"  done in {time.perf_counter() - started:.1f}s")
+        finally:
+            teardown_databases(old_config, verbosity=verbosity)
+            teardown_test_environment()
+
+        with open(options['output'], 'w') as report_file:
+            json.dump(report, report_file, indent=2, sort_keys=True)
+        self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        if options['compare']:
+            self.compare(options['compare'], report)
+        else:
+            for path, value in flatten(report['results']).items():
+                self.stdout.write(f"  {path}: {value}")
+
+    def reset(self):
+        """Empties the database and the in-process caches following it."""
+        call_command('flush', interactive=False, verbosity=0)
+        clear_version_cache()
+        clear_index_cache()
+        clear_snapshot_cache()
+
+    def environment(self, options):
+        try:
+            commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                                    capture_output=True, text=True).stdout.strip()
+        except OSError:
+            commit = ''
+        parameters = ('seed', 'document_pages', 'chunk_counts', 'token_counts', 'actu_counts',
+                      'queries', 'top_k', 'repeat', 'expo_latency_ms', 'gemini_requests', 'gemini_latency_ms',
+                      'gemini_slow_rate', 'gemini_slow_ms')
+        return {
+            'commit': commit,
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'machine': platform.machine(),
+            'embedding_backend': settings.KNOWLEDGE_EMBEDDING_BACKEND,
+            'vector_storage': settings.KNOWLEDGE_VECTOR_STORAGE,
+            'parameters': {name: options[name] for name in parameters},
+        }
+
+    def compare(self, baseline_path, report):
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)
+        self.stdout.write(
+            f"Compared with {baseline_path} (commit {baseline['meta'].get('commit') or '?'})")
+        if baseline['meta'].get('parameters') != report['meta']['parameters']:
+            self.stdout.write(self.style.WARNING("  Parameters differ, results may not be comparable."))
+        old = flatten(baseline['results'])
+        new = flatten(report['results'])
+        for path in sorted(old.keys() | new.keys()):
+            if path not in old or path not in new:
+                self.stdout.write(f"  {path}: {old.get(path, '-')} -> {new.get(path, '-')}")
+                continue
+            change = f"{(new[path] - old[path]) / old[path] * 100:+.1f}%" if old[path] else ''
+            self.stdout.write(f"  {path}: {old[path]} -> {new[path]} {change}")
@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.fake_services.expo import FakeExpoServer
+from core.fake_services.gemini import FakeGeminiServer
+
+
+class Command(BaseCommand):
+    """
+    Runs the local Gemini and Expo stand-ins until interrupted, for load tests:
+
+        python manage.py run_fake_services --gemini-latency-ms 800 --receipt-error-rate 0.05
+        GEMINI_BASE_URL=http://127.0.0.1:8091 EXPO_PUSH_HOST=http://127.0.0.1:8092 \\
+            gunicorn -c gunicorn.conf.py core.wsgi:application
+        python manage.py load_test
+    """
+    help = 'Serves fake Gemini and Expo push APIs with tunable latency and error rates.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--gemini-port', type=int, default=8091)
+        parser.add_argument('--gemini-latency-ms', type=float, default=500)
+        parser.add_argument('--gemini-jitter-ms', type=float, default=200)
+        parser.add_argument('--gemini-error-rate', type=float, default=0.0)
+        parser.add_argument('--gemini-slow-rate', type=float, default=0.0,
+                            help='Share of Gemini calls taking --gemini-slow-ms more (tail latency).')
+        parser.add_argument('--gemini-slow-ms', type=float, default=5000)
+        parser.add_argument('--stream-chunk-delay-ms', type=float, default=20)
+        parser.add_argument('--expo-port', type=int, default=8092)
+        parser.add_argument('--expo-latency-ms', type=float, default=50)
+        parser.add_argument('--ticket-error-rate', type=float, default=0.0,
+                            help='Share of push tickets failing with DeviceNotRegistered.')
+        parser.add_argument('--receipt-error-rate', type=float, default=0.0,
+                            help='Share of receipts failing with DeviceNotRegistered.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        gemini = FakeGeminiServer(
+            latency_ms=options['gemini_latency_ms'], jitter_ms=options['gemini_jitter_ms'],
+            error_rate=options['gemini_error_rate'], slow_rate=options['gemini_slow_rate'],
+            slow_ms=options['gemini_slow_ms'], stream_chunk_delay_ms=options['stream_chunk_delay_ms'],
+            seed=options['seed'], host=options['host'], port=options['gemini_port'])
+        expo = FakeExpoServer(
+            latency_ms=options['expo_latency_ms'], ticket_error_rate=options['ticket_error_rate'],
+            receipt_error_rate=options['receipt_error_rate'], seed=options['seed'],
+            host=options['host'], port=options['expo_port'])
+        with gemini, expo:
+            self.stdout.write(f"Fake Gemini: GEMINI_BASE_URL={gemini.url}")
+            self.stdout.write(f"Fake Expo:   EXPO_PUSH_HOST={expo.url}")
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                pass
+            self.stdout.write(
+                f"Served {gemini.requests_received} Gemini calls, {expo.messages_received} push messages, "
+                f"{expo.receipts_requested} receipts.")
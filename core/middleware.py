@@ -0,0 +1,49 @@
+import time
+
+from django.db import connection
+
+from .instrumentation import (
+    DB_QUERIES_PER_REQUEST, DB_TIME_PER_REQUEST, REQUEST_DURATION, REQUEST_ERRORS,
+    end_timings, start_timings)
+
+
+def route_label(request):
+    """Low-cardinality label for a request: the matched URL pattern, never the raw path."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.route or match.view_name or 'unknown'
+
+
+class PerformanceMiddleware:
+    """
+    Records per-request timings: total duration, database query count/time and the
+    spans opened while handling the request (embedding, vector_search, gemini_call, ...).
+    They are returned to the client in a `Server-Timing` header and recorded as
+    Prometheus histograms served at /metrics.
+    Place it first in MIDDLEWARE so the total covers the whole middleware stack.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings, token = start_timings()
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(timings.db_wrapper):
+                response = self.get_response(request)
+        finally:
+            end_timings(token)
+
+        route = route_label(request)
+        REQUEST_DURATION.labels(
+            method=request.method, route=route, status=response.status_code
+        ).observe(time.perf_counter() - started)
+        DB_QUERIES_PER_REQUEST.labels(route=route).observe(timings.db_queries)
+        DB_TIME_PER_REQUEST.labels(route=route).observe(timings.db_seconds)
+        response['Server-Timing'] = timings.server_timing()
+        return response
+
+    def process_exception(self, request, exception):
+        REQUEST_ERRORS.labels(route=route_label(request)).inc()
@@ -0,0 +1,104 @@
+# Generated by Django 5.0.6 on 2026-10-19 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="TaskRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "func",
+                    models.CharField(
+                        db_index=True, max_length=255, verbose_name="Function"
+                    ),
+                ),
+                (
+                    "task_id",
+                    models.CharField(
+                        blank=True, max_length=32, verbose_name="Django-Q Task ID"
+                    ),
+                ),
+                (
+                    "task_name",
+                    models.CharField(
+                        blank=True, max_length=100, verbose_name="Django-Q Task Name"
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("SUCCESS", "Success"),
+                            ("FAILED", "Failed"),
+                            ("TIMEOUT", "Timed out"),
+                        ],
+                        max_length=10,
+                        verbose_name="Status",
+                    ),
+                ),
+                (
+                    "enqueued_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Enqueued At"
+                    ),
+                ),
+                (
+                    "started_at",
+                    models.DateTimeField(db_index=True, verbose_name="Started At"),
+                ),
+                (
+                    "queue_wait_ms",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Queue Wait (ms)"
+                    ),
+                ),
+                ("run_ms", models.FloatField(verbose_name="Run Time (ms)")),
+                (
+                    "stages",
+                    models.JSONField(
+                        blank=True, default=dict, verbose_name="Stage Timings (ms)"
+                    ),
+                ),
+                (
+                    "db_queries",
+                    models.PositiveIntegerField(default=0, verbose_name="DB Queries"),
+                ),
+                ("db_ms", models.FloatField(default=0, verbose_name="DB Time (ms)")),
+                (
+                    "max_rss_kb",
+                    models.PositiveBigIntegerField(
+                        blank=True, null=True, verbose_name="Max RSS (KiB)"
+                    ),
+                ),
+                (
+                    "rss_growth_kb",
+                    models.PositiveBigIntegerField(
+                        default=0, verbose_name="RSS High-water Growth (KiB)"
+                    ),
+                ),
+                ("error", models.TextField(blank=True, verbose_name="Error")),
+                ("profile", models.TextField(blank=True, verbose_name="Profile")),
+            ],
+            options={
+                "verbose_name": "Task Run",
+                "verbose_name_plural": "Task Runs",
+                "ordering": ["-started_at"],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class TaskRun(models.Model):
+    """
+    One execution of a Django-Q task decorated with core.task_metrics.measured_task:
+    how long it waited in the queue and ran, where the time went, and the worker's memory.
+    """
+    class Status(models.TextChoices):
+        SUCCESS = 'SUCCESS', _('Success')
+        FAILED = 'FAILED', _('Failed')
+        TIMEOUT = 'TIMEOUT', _('Timed out')
+
+    func = models.CharField(_("Function"), max_length=255, db_index=True)
+    task_id = models.CharField(_("Django-Q Task ID"), max_length=32, blank=True)
+    task_name = models.CharField(_("Django-Q Task Name"), max_length=100, blank=True)
+    status = models.CharField(_("Status"), max_length=10, choices=Status.choices)
+    enqueued_at = models.DateTimeField(_("Enqueued At"), null=True, blank=True)
+    started_at = models.DateTimeField(_("Started At"), db_index=True)
+    queue_wait_ms = models.FloatField(_("Queue Wait (ms)"), null=True, blank=True)
+    run_ms = models.FloatField(_("Run Time (ms)"))
+    stages = models.JSONField(_("Stage Timings (ms)"), default=dict, blank=True)  # e.g. {'extract': 812.4, 'embed': 4210.0}
+    db_queries = models.PositiveIntegerField(_("DB Queries"), default=0)
+    db_ms = models.FloatField(_("DB Time (ms)"), default=0)
+    # Worker process RSS high-water mark after the task, and how much the task raised it
+    max_rss_kb = models.PositiveBigIntegerField(_("Max RSS (KiB)"), null=True, blank=True)
+    rss_growth_kb = models.PositiveBigIntegerField(_("RSS High-water Growth (KiB)"), default=0)
+    error = models.TextField(_("Error"), blank=True)
+    profile = models.TextField(_("Profile"), blank=True)  # cProfile stats, only for slow runs
+
+    class Meta:
+        verbose_name = _("Task Run")
+        verbose_name_plural = _("Task Runs")
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"{self.func} ({self.status}, {self.run_ms:.0f} ms)"
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres', # Full-text search used by knowledge_base retrieval
     "rest_framework",
     "rest_framework.authtoken",
     "corsheaders",
@@ -52,6 +53,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.PerformanceMiddleware', # First, so its timings cover the whole stack
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -63,6 +65,12 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'core.urls'
 
+# /metrics (core/views.py) answers these addresses, unless the request was relayed by a
+# proxy (X-Forwarded-For), and requests carrying "Authorization: Bearer <METRICS_TOKEN>".
+# Anything else gets a 404.
+METRICS_ALLOWED_IPS = os.environ.get("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",")
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -155,8 +163,9 @@ REST_FRAMEWORK = {
     ],
     "DEFAULT_THROTTLE_RATES": {
         # "anon": "10/hour",
-        "anon": "1000/minute",
-        "user": "100/minute"
+        "anon": os.environ.get("API_ANON_THROTTLE_RATE", "1000/minute"),  # Raise for load tests
+        # UserRateThrottle also applies this rate to anonymous clients (keyed by IP)
+        "user": os.environ.get("API_USER_THROTTLE_RATE", "100/minute"),
         # "user_day": "10000/day",  # UPDATED
         # "user_minute": "200/minute",  # UPDATED
     },
@@ -175,6 +184,128 @@ SPECTACULAR_SETTINGS = {
 
 
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
+# Gemini API endpoint; unset uses Google's. Load tests point it at a local stand-in
+# (python manage.py run_fake_services).
+GEMINI_BASE_URL = os.environ.get("GEMINI_BASE_URL") or None
+# Answers (services/gemini_service.HedgedGenerator): past the deadline the question is
+# answered with an extract of the retrieved chunks. A second, identical call is sent
+# when the first is slower than GEMINI_HEDGE_QUANTILE of recent calls, and the lighter
+# fallback model is asked GEMINI_FALLBACK_RESERVE_MS before the deadline ('' disables it).
+GEMINI_ANSWER_DEADLINE_MS = int(os.environ.get("GEMINI_ANSWER_DEADLINE_MS", 8000))
+GEMINI_HEDGE_ENABLED = os.environ.get("GEMINI_HEDGE_ENABLED", "True") == "True"
+GEMINI_HEDGE_QUANTILE = float(os.environ.get("GEMINI_HEDGE_QUANTILE", 0.95))
+# Hedge delay until 20 calls were observed, and its lower bound
+GEMINI_HEDGE_INITIAL_DELAY_MS = int(os.environ.get("GEMINI_HEDGE_INITIAL_DELAY_MS", 3000))
+GEMINI_HEDGE_MIN_DELAY_MS = int(os.environ.get("GEMINI_HEDGE_MIN_DELAY_MS", 250))
+GEMINI_FALLBACK_MODEL = os.environ.get("GEMINI_FALLBACK_MODEL", "gemini-2.0-flash-lite")
+GEMINI_FALLBACK_RESERVE_MS = int(os.environ.get("GEMINI_FALLBACK_RESERVE_MS", 2500))
+# Answer calls in flight per process, hedges and abandoned calls included
+GEMINI_MAX_CONCURRENT_CALLS = int(os.environ.get("GEMINI_MAX_CONCURRENT_CALLS", 32))
+
+# Expo push API host; unset uses https://exp.host. Benchmarks and load tests point it at
+# a local stand-in (python manage.py run_fake_services).
+EXPO_PUSH_HOST = os.environ.get("EXPO_PUSH_HOST") or None
+
+# Knowledge base embeddings
+EMBEDDING_MODEL_NAME = os.environ.get("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+# 'torch' (sentence-transformers) or 'onnx' (ONNX Runtime export of the same model,
+# produced with `python manage.py export_onnx_embedding_model`)
+KNOWLEDGE_EMBEDDING_BACKEND = os.environ.get("KNOWLEDGE_EMBEDDING_BACKEND", "torch")
+KNOWLEDGE_ONNX_MODEL_DIR = os.environ.get(
+    "KNOWLEDGE_ONNX_MODEL_DIR", str(BASE_DIR / "models" / "onnx" / EMBEDDING_MODEL_NAME))
+# Use the int8 dynamically-quantised export (smaller and faster on CPU)
+KNOWLEDGE_ONNX_QUANTIZED = os.environ.get("KNOWLEDGE_ONNX_QUANTIZED", "True") == "True"
+# Chunking of processed documents: 'structured' (headings/paragraphs/pages, sized in
+# model tokens, see knowledge_base/chunking.py) or 'recursive' (previous 1000-character
+# splitter). Compare both with: python manage.py compare_chunkers
+KNOWLEDGE_CHUNKER = os.environ.get("KNOWLEDGE_CHUNKER", "structured")
+# Tokens per chunk, including the 2 special tokens: all-MiniLM-L6-v2 reads 256 at most
+KNOWLEDGE_CHUNK_MAX_TOKENS = int(os.environ.get("KNOWLEDGE_CHUNK_MAX_TOKENS", 256))
+# Overlap between the pieces of a paragraph too long for one chunk
+KNOWLEDGE_CHUNK_OVERLAP_TOKENS = int(os.environ.get("KNOWLEDGE_CHUNK_OVERLAP_TOKENS", 32))
+# Sections smaller than this are merged with the next one instead of forming their own chunk
+KNOWLEDGE_CHUNK_MIN_TOKENS = int(os.environ.get("KNOWLEDGE_CHUNK_MIN_TOKENS", 48))
+
+# Size limit of the extraction cache (text of already parsed files, keyed by content hash,
+# see knowledge_base/extraction_cache.py). Least recently used entries are evicted; 0 disables it.
+KNOWLEDGE_EXTRACTION_CACHE_MAX_MB = float(os.environ.get("KNOWLEDGE_EXTRACTION_CACHE_MAX_MB", 256))
+
+# Load the embedding model when the WSGI application is created instead of on the
+# first query (see core/wsgi.py). Management commands never load it.
+KNOWLEDGE_WARM_UP_ON_BOOT = os.environ.get("KNOWLEDGE_WARM_UP_ON_BOOT", "False") == "True"
+
+# Query embeddings in the API process: LRU cache size, and micro-batching of
+# concurrent questions (max batch size, max milliseconds to wait for a batch to fill)
+KNOWLEDGE_QUERY_CACHE_SIZE = int(os.environ.get("KNOWLEDGE_QUERY_CACHE_SIZE", 1024))
+KNOWLEDGE_QUERY_BATCH_SIZE = int(os.environ.get("KNOWLEDGE_QUERY_BATCH_SIZE", 32))
+KNOWLEDGE_QUERY_BATCH_WAIT_MS = float(os.environ.get("KNOWLEDGE_QUERY_BATCH_WAIT_MS", 5))
+# Seconds a request waits for its question's embedding before failing
+KNOWLEDGE_QUERY_ENCODE_TIMEOUT_SECONDS = float(os.environ.get("KNOWLEDGE_QUERY_ENCODE_TIMEOUT_SECONDS", 30))
+
+# Knowledge base retrieval
+# 'vector' (pgvector cosine only), 'lexical' (Postgres full-text only)
+# or 'hybrid' (both legs fused with Reciprocal Rank Fusion)
+KNOWLEDGE_RETRIEVAL_MODE = os.environ.get("KNOWLEDGE_RETRIEVAL_MODE", "hybrid")
+# Vector storage used for search: 'full' (float32), 'half' (float16 halfvec, HNSW),
+# 'binary' (bit Hamming pre-filter, then exact rescoring of the shortlist) or 'snapshot'
+# (in-process numpy scan of a memory-mapped copy of the embeddings, for small corpora)
+KNOWLEDGE_VECTOR_STORAGE = os.environ.get("KNOWLEDGE_VECTOR_STORAGE", "full")
+KNOWLEDGE_BINARY_RESCORE_CANDIDATES = int(os.environ.get("KNOWLEDGE_BINARY_RESCORE_CANDIDATES", 100))
+# 'snapshot' storage: where the snapshots are written (shared by the workers of a host),
+# and how often each worker checks whether documents were processed since its snapshot
+KNOWLEDGE_VECTOR_SNAPSHOT_DIR = os.environ.get("KNOWLEDGE_VECTOR_SNAPSHOT_DIR", str(BASE_DIR / "var" / "vector_snapshot"))
+KNOWLEDGE_VECTOR_SNAPSHOT_REFRESH_SECONDS = float(os.environ.get("KNOWLEDGE_VECTOR_SNAPSHOT_REFRESH_SECONDS", 5))
+# Filtered queries continue HNSW scans until enough chunks pass the filters
+# (hnsw.iterative_scan, pgvector >= 0.8). Set to False on older pgvector.
+KNOWLEDGE_HNSW_ITERATIVE_SCAN = os.environ.get("KNOWLEDGE_HNSW_ITERATIVE_SCAN", "True") == "True"
+KNOWLEDGE_HYBRID_CANDIDATES = int(os.environ.get("KNOWLEDGE_HYBRID_CANDIDATES", 20))
+KNOWLEDGE_RRF_K = int(os.environ.get("KNOWLEDGE_RRF_K", 60))
+
+# Conversations (see knowledge_base/conversations.py): prompt budget for the summary
+# and recent turns, in estimated tokens; older turns are folded into the summary
+KNOWLEDGE_CONVERSATION_HISTORY_TOKENS = int(os.environ.get("KNOWLEDGE_CONVERSATION_HISTORY_TOKENS", 1200))
+KNOWLEDGE_CONVERSATION_RECENT_TURNS = int(os.environ.get("KNOWLEDGE_CONVERSATION_RECENT_TURNS", 6))
+KNOWLEDGE_CONVERSATION_SUMMARY_TOKENS = int(os.environ.get("KNOWLEDGE_CONVERSATION_SUMMARY_TOKENS", 300))
+# Rewrite follow-up questions as standalone questions before retrieval (one Gemini call)
+KNOWLEDGE_CONDENSE_QUESTIONS = os.environ.get("KNOWLEDGE_CONDENSE_QUESTIONS", "True") == "True"
+KNOWLEDGE_CONVERSATION_RETENTION_DAYS = int(os.environ.get("KNOWLEDGE_CONVERSATION_RETENTION_DAYS", 30))
+# Whether a question without "conversation_id" starts a stored conversation, unless the
+# request sets "start_conversation"
+KNOWLEDGE_CONVERSATION_START = os.environ.get("KNOWLEDGE_CONVERSATION_START", "True") == "True"
+
+# Identical first questions asked at the same time share one pipeline run, across
+# workers (Postgres advisory lock, see knowledge_base/coalescing.py)
+KNOWLEDGE_COALESCE_QUERIES = os.environ.get("KNOWLEDGE_COALESCE_QUERIES", "True") == "True"
+KNOWLEDGE_COALESCE_WAIT_SECONDS = float(os.environ.get("KNOWLEDGE_COALESCE_WAIT_SECONDS", 30))
+KNOWLEDGE_COALESCE_WINDOW_SECONDS = float(os.environ.get("KNOWLEDGE_COALESCE_WINDOW_SECONDS", 2))
+# Precomputed answers to frequent questions (knowledge_base/faq.py): a first question
+# without filters at least this similar (cosine) to an entry gets its answer
+KNOWLEDGE_FAQ_ENABLED = os.environ.get("KNOWLEDGE_FAQ_ENABLED", "True") == "True"
+KNOWLEDGE_FAQ_MATCH_THRESHOLD = float(os.environ.get("KNOWLEDGE_FAQ_MATCH_THRESHOLD", 0.9))
+KNOWLEDGE_FAQ_REFRESH_SECONDS = float(os.environ.get("KNOWLEDGE_FAQ_REFRESH_SECONDS", 5))
+# Run time of one regenerate_faq_answers task, below the Django Q timeout
+KNOWLEDGE_FAQ_TASK_SECONDS = int(os.environ.get("KNOWLEDGE_FAQ_TASK_SECONDS", 60))
+
+# Blue/green migrations of the embedding model (python manage.py embedding_migration,
+# see knowledge_base/embedding_versions.py): chunks are re-embedded in the background,
+# throttled, and queries switch to the new model once every chunk has its vector
+KNOWLEDGE_REEMBED_BATCH_SIZE = int(os.environ.get("KNOWLEDGE_REEMBED_BATCH_SIZE", 128))
+KNOWLEDGE_REEMBED_MAX_ROWS_PER_SECOND = float(os.environ.get("KNOWLEDGE_REEMBED_MAX_ROWS_PER_SECOND", 100))
+# Below the Django Q timeout; the task queues itself again until the backfill is done
+KNOWLEDGE_REEMBED_TASK_SECONDS = int(os.environ.get("KNOWLEDGE_REEMBED_TASK_SECONDS", 60))
+KNOWLEDGE_EMBEDDING_AUTO_ACTIVATE = os.environ.get("KNOWLEDGE_EMBEDDING_AUTO_ACTIVATE", "True") == "True"
+# API workers pick up a switch within this delay
+KNOWLEDGE_EMBEDDING_VERSION_CACHE_SECONDS = float(os.environ.get("KNOWLEDGE_EMBEDDING_VERSION_CACHE_SECONDS", 5))
+
+# Optional cross-encoder re-ranking of a wider candidate set
+KNOWLEDGE_RERANK_ENABLED = os.environ.get("KNOWLEDGE_RERANK_ENABLED", "False") == "True"
+KNOWLEDGE_RERANKER_MODEL = os.environ.get(
+    "KNOWLEDGE_RERANKER_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+KNOWLEDGE_RERANK_CANDIDATES = int(os.environ.get("KNOWLEDGE_RERANK_CANDIDATES", 50))
+KNOWLEDGE_RERANK_TOP_N = int(os.environ.get("KNOWLEDGE_RERANK_TOP_N", 3))
+KNOWLEDGE_RERANK_BATCH_SIZE = int(os.environ.get("KNOWLEDGE_RERANK_BATCH_SIZE", 16))
+# Hard per-request budget; past it the original ranking is used
+KNOWLEDGE_RERANK_BUDGET_MS = int(os.environ.get("KNOWLEDGE_RERANK_BUDGET_MS", 300))
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -206,3 +337,8 @@ Q_CLUSTER = {
         # Add other scheduled tasks here
     }
 }
+
+# Measured Django-Q tasks (core/task_metrics.py) are recorded as TaskRuns in the admin.
+# When set, they run under cProfile and runs slower than this keep their profile.
+TASK_PROFILE_THRESHOLD_MS = (
+    float(os.environ["TASK_PROFILE_THRESHOLD_MS"]) if os.environ.get("TASK_PROFILE_THRESHOLD_MS") else None)
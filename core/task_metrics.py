@@ -0,0 +1,122 @@
+"""
+Metrics for Django-Q tasks.
+
+Decorate a task function with `measured_task` to record every run as a TaskRun
+(core/models.py, listed in the admin): queue wait (enqueue -> start), run time,
+the spans opened by the task (core.instrumentation.span, e.g. extract/chunk/embed/save),
+database query count/time, the worker's memory high-water mark and whether the run
+failed or hit the Q_CLUSTER timeout.
+
+Set TASK_PROFILE_THRESHOLD_MS to run measured tasks under cProfile and keep the
+profile of runs slower than the threshold. Profiling slows tasks down, leave it
+unset unless investigating.
+"""
+import cProfile
+import functools
+import io
+import logging
+import pstats
+import time
+import traceback
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+from django.dispatch import receiver
+from django.utils import timezone
+from django_q.exceptions import TimeoutException
+from django_q.signals import pre_execute
+
+from .instrumentation import end_timings, start_timings
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+PROFILE_TOP_FUNCTIONS = 40
+
+# The Django-Q task package being executed by this worker, set just before the call
+_current_task = ContextVar('django_q_task', default=None)
+
+
+@receiver(pre_execute)
+def remember_task(sender, func, task, **kwargs):
+    _current_task.set(task)
+
+
+def max_rss_kb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KiB on Linux
+
+
+def format_profile(profiler):
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+    return output.getvalue()
+
+
+def measured_task(func):
+    """Records each run of the decorated Django-Q task as a TaskRun (see module docstring)."""
+    func_path = f"{func.__module__}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        from .models import TaskRun
+
+        # Consume the task package so a measured function called by this task isn't attributed to it
+        task = _current_task.get() or {}
+        _current_task.set(None)
+        threshold_ms = getattr(settings, 'TASK_PROFILE_THRESHOLD_MS', None)
+        profiler = cProfile.Profile() if threshold_ms is not None else None
+
+        started_at = timezone.now()
+        rss_before = max_rss_kb()
+        timings, token = start_timings()
+        status = TaskRun.Status.SUCCESS
+        error = ''
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(timings.db_wrapper):
+                if profiler is None:
+                    return func(*args, **kwargs)
+                return profiler.runcall(func, *args, **kwargs)
+        except TimeoutException:
+            status = TaskRun.Status.TIMEOUT
+            error = traceback.format_exc()
+            raise
+        except Exception:
+            status = TaskRun.Status.FAILED
+            error = traceback.format_exc()
+            raise
+        finally:
+            run_ms = (time.perf_counter() - started) * 1000
+            end_timings(token)
+            rss_after = max_rss_kb()
+            enqueued_at = task.get('started')  # Django-Q sets it when the task is enqueued
+            try:
+                TaskRun.objects.create(
+                    func=func_path,
+                    task_id=task.get('id', ''),
+                    task_name=task.get('name', ''),
+                    status=status,
+                    enqueued_at=enqueued_at,
+                    started_at=started_at,
+                    queue_wait_ms=(started_at - enqueued_at).total_seconds() * 1000 if enqueued_at else None,
+                    run_ms=run_ms,
+                    stages={name: round(seconds * 1000, 1) for name, seconds in timings.spans.items()},
+                    db_queries=timings.db_queries,
+                    db_ms=timings.db_seconds * 1000,
+                    max_rss_kb=rss_after,
+                    rss_growth_kb=rss_after - rss_before if rss_after is not None else 0,
+                    error=error,
+                    profile=format_profile(profiler) if profiler and run_ms >= threshold_ms else '',
+                )
+            except Exception as e:
+                # Metrics must never change the outcome of the task
+                logger.error(f"Could not record metrics for task {func_path}: {e}")
+
+    return wrapper
@@ -0,0 +1,225 @@
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from django_q.signals import pre_execute
+
+from services import gemini_service
+
+from .fake_services.gemini import DEFAULT_ANSWER, FakeGeminiServer
+from .instrumentation import end_timings, span, start_timings
+from .models import TaskRun
+from .task_metrics import measured_task
+
+
+class SpanTests(SimpleTestCase):
+    def test_spans_are_accumulated_into_server_timing(self):
+        timings, token = start_timings()
+        try:
+            with span('embedding'):
+                pass
+            with span('embedding'):
+                pass
+        finally:
+            end_timings(token)
+
+        header = timings.server_timing()
+        self.assertEqual(header.count('embedding;dur='), 1)
+        self.assertIn('db;dur=', header)
+        self.assertIn('total;dur=', header)
+
+
+class PerformanceMiddlewareTests(TestCase):
+    def test_server_timing_header_reports_db_queries(self):
+        response = self.client.get('/api/actus/actus/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="1 queries"')
+
+    def test_metrics_endpoint_exposes_request_histograms(self):
+        self.client.get('/api/actus/actus/')
+        response = self.client.get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('ferfm_http_request_duration_seconds_bucket', body)
+        self.assertIn('route="api/actus/actus/$"', body)
+        self.assertIn('ferfm_db_queries_per_request_bucket', body)
+
+    @override_settings(METRICS_ALLOWED_IPS=['127.0.0.1'], METRICS_TOKEN='scraper-token')
+    def test_metrics_endpoint_is_internal_only(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.7').status_code, 404)
+        # Relayed by the public proxy running on the same host
+        self.assertEqual(self.client.get('/metrics', HTTP_X_FORWARDED_FOR='203.0.113.7').status_code, 404)
+        self.assertEqual(self.client.get(
+            '/metrics', REMOTE_ADDR='203.0.113.7', HTTP_AUTHORIZATION='Bearer wrong').status_code, 404)
+
+        response = self.client.get('/metrics', REMOTE_ADDR='10.0.0.5', HTTP_AUTHORIZATION='Bearer scraper-token')
+        self.assertEqual(response.status_code, 200)
+
+
+@measured_task
+def staged_task(value):
+    with span('build'):
+        pass
+    with span('publish'):
+        return value * 2
+
+
+@measured_task
+def failing_task():
+    raise ValueError("boom")
+
+
+class MeasuredTaskTests(TestCase):
+    def test_records_queue_wait_and_stages(self):
+        enqueued_at = timezone.now() - timedelta(seconds=2)
+        task = {'id': 'abc123', 'name': 'alpha-bravo', 'started': enqueued_at}
+        pre_execute.send(sender='django_q', func=staged_task, task=task)
+
+        self.assertEqual(staged_task(21), 42)
+
+        run = TaskRun.objects.get()
+        self.assertEqual(run.func, 'core.tests.staged_task')
+        self.assertEqual(run.status, TaskRun.Status.SUCCESS)
+        self.assertEqual(run.task_id, 'abc123')
+        self.assertGreaterEqual(run.queue_wait_ms, 2000)
+        self.assertEqual(list(run.stages), ['build', 'publish'])
+        self.assertEqual(run.profile, '')
+
+    def test_direct_call_has_no_queue_wait(self):
+        staged_task(1)
+
+        run = TaskRun.objects.get()
+        self.assertIsNone(run.enqueued_at)
+        self.assertIsNone(run.queue_wait_ms)
+
+    def test_failure_is_recorded_and_reraised(self):
+        with self.assertRaises(ValueError):
+            failing_task()
+
+        run = TaskRun.objects.get()
+        self.assertEqual(run.status, TaskRun.Status.FAILED)
+        self.assertIn('boom', run.error)
+
+    @override_settings(TASK_PROFILE_THRESHOLD_MS=0)
+    def test_slow_runs_keep_their_profile(self):
+        staged_task(1)
+
+        self.assertIn('staged_task', TaskRun.objects.get().profile)
+
+
+class FakeGeminiTests(SimpleTestCase):
+    def setUp(self):
+        self.gemini = FakeGeminiServer().start()
+        self.addCleanup(self.gemini.stop)
+        for name, value in (('GEMINI_BASE_URL', self.gemini.url), ('GEMINI_API_KEY', 'test-key')):
+            patcher = mock.patch.object(gemini_service, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        gemini_service.reset_client()
+        self.addCleanup(gemini_service.reset_client)
+
+    def test_generate_answer_uses_the_stand_in(self):
+        self.assertEqual(gemini_service.generate_answer("Fréquence ?", ["101.3"]), DEFAULT_ANSWER)
+        self.assertEqual(self.gemini.requests_received, 1)
+
+    def test_condensing_is_bounded_by_the_answer_deadline(self):
+        self.assertEqual(gemini_service.condense_question("Et à Bouaké ?", '', [("Fréquence ?", "101.3")]),
+                         DEFAULT_ANSWER)
+
+        self.gemini.slow_rate, self.gemini.slow_ms = 1.0, 3000
+        started = time.monotonic()
+        condensed = gemini_service.condense_question(
+            "Et à Bouaké ?", '', [("Fréquence ?", "101.3")], deadline=started + 0.3)
+
+        self.assertIsNone(condensed)
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_streamed_answer_arrives_in_chunks(self):
+        chunks = [chunk.text for chunk in gemini_service.get_client().models.generate_content_stream(
+            model="gemini-2.0-flash", contents="Bonjour")]
+
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(''.join(chunks).strip(), DEFAULT_ANSWER)
+
+    def test_errors_fall_back_to_the_apology(self):
+        self.gemini.error_rate = 1.0
+        self.assertEqual(gemini_service.generate_answer("Fréquence ?", []), gemini_service.UNAVAILABLE_ANSWER)
+        # The primary call, its hedge and the fallback model, each sent as soon as the previous failed
+        self.assertEqual(self.gemini.requests_received, 3)
+        self.assertEqual(self.gemini.requests_by_model[gemini_service.GEMINI_MODEL], 2)
+
+
+class HedgedGeneratorTests(SimpleTestCase):
+    def generator(self, delays_ms, **options):
+        """A generator whose n-th call answers f"answer {n}" after delays_ms[n] (an exception is raised)."""
+        calls = []
+
+        def call(model, prompt, timeout_ms):
+            index = len(calls)
+            calls.append(model)
+            delay = delays_ms[index]
+            if isinstance(delay, Exception):
+                raise delay
+            time.sleep(delay / 1000)
+            return f"answer {index}"
+
+        generator = gemini_service.HedgedGenerator(call=call, **options)
+        self.addCleanup(generator.executor.shutdown, wait=False)
+        return generator, calls
+
+    def timed(self, generator):
+        started = time.monotonic()
+        result = generator.generate("prompt", "extract")
+        return result, (time.monotonic() - started) * 1000
+
+    def test_slow_call_is_hedged(self):
+        generator, calls = self.generator([2000, 10], hedge_initial_delay_ms=50, hedge_min_delay_ms=0)
+
+        (answer, source), elapsed_ms = self.timed(generator)
+
+        self.assertEqual((answer, source), ("answer 1", 'hedge'))
+        self.assertLess(elapsed_ms, 1000)
+        self.assertEqual(generator.stats()['hedge_rate'], 1.0)
+
+    def test_hedge_delay_follows_recent_latencies(self):
+        generator, _ = self.generator([], hedge_initial_delay_ms=3000, hedge_min_delay_ms=250)
+        self.assertEqual(generator.hedge_delay_ms(), 3000)
+        for ms in range(1, 101):
+            generator.latencies.record(ms * 10)
+        self.assertEqual(generator.hedge_delay_ms(), 960)
+        for _ in range(200):
+            generator.latencies.record(100)
+        self.assertEqual(generator.hedge_delay_ms(), 250)
+
+    def test_failed_call_is_retried_without_waiting_for_the_hedge_delay(self):
+        generator, calls = self.generator([RuntimeError("503"), 10], hedge_initial_delay_ms=2000)
+
+        (answer, source), elapsed_ms = self.timed(generator)
+
+        self.assertEqual(source, 'hedge')
+        self.assertLess(elapsed_ms, 1000)
+        self.assertEqual(generator.stats()['primary_errors'], 1)
+
+    def test_fallback_model_is_asked_near_the_deadline(self):
+        generator, calls = self.generator(
+            [2000, 10], hedge=False, fallback_model='lite', deadline_ms=600, fallback_reserve_ms=400)
+
+        (answer, source), elapsed_ms = self.timed(generator)
+
+        self.assertEqual((source, calls), ('fallback', [gemini_service.GEMINI_MODEL, 'lite']))
+        self.assertLess(elapsed_ms, 500)
+
+    def test_extractive_answer_at_the_deadline(self):
+        generator, _ = self.generator([2000, 2000], hedge_initial_delay_ms=50, deadline_ms=200)
+
+        (answer, source), elapsed_ms = self.timed(generator)
+
+        self.assertEqual((answer, source), ("extract", 'extractive'))
+        self.assertLess(elapsed_ms, 1000)
+        answer = gemini_service.extractive_answer(["Autoroute Matin, de 6h à 11h. " * 40, "Singrobo : 106.9 MHz"])
+        self.assertIn("Singrobo : 106.9 MHz", answer)
+        self.assertLess(len(answer), 1000)
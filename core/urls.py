@@ -18,6 +18,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from core.views import metrics_view
 from drf_spectacular.views import (
     SpectacularAPIView,
     SpectacularRedocView,
@@ -26,6 +27,8 @@ from drf_spectacular.views import (
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    # Prometheus metrics (request/span/DB histograms, see core/instrumentation.py)
+    path("metrics", metrics_view, name="metrics"),
     # API Schema:
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
     # Optional UI:
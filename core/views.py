@@ -0,0 +1,39 @@
+import os
+import secrets
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, REGISTRY, generate_latest
+from prometheus_client import multiprocess
+
+
+def metrics_allowed(request):
+    """
+    Internal scrapers only: a direct connection from settings.METRICS_ALLOWED_IPS (a
+    public proxy on the same host would pass as local, so relayed requests are refused),
+    or the settings.METRICS_TOKEN bearer token.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() == 'bearer' and secrets.compare_digest(credentials.encode(), token.encode()):
+            return True
+    if 'X-Forwarded-For' in request.headers:
+        return False
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ())
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint, not found for other clients than internal scrapers (see
+    metrics_allowed). In multiprocess mode (PROMETHEUS_MULTIPROC_DIR set, e.g. under
+    gunicorn) samples from all workers are aggregated.
+    """
+    if not metrics_allowed(request):
+        raise Http404
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -14,3 +14,12 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_wsgi_application()
+
+# Optionally load the embedding model before serving the first request
+# (heavy imports are otherwise deferred until first use, see knowledge_base/embeddings.py)
+from django.conf import settings
+
+if settings.KNOWLEDGE_WARM_UP_ON_BOOT:
+    from knowledge_base.embeddings import warm_up
+
+    warm_up()
@@ -0,0 +1,68 @@
+"""
+Production gunicorn configuration.
+
+The application (and the embedding model) is loaded once in the master process
+(`preload_app`), then workers are forked from it. The model weights are never written
+after loading, so their pages stay shared copy-on-write between all workers instead of
+each worker holding its own copy.
+
+Usage:
+    gunicorn -c gunicorn.conf.py core.wsgi:application
+
+Compare memory with and without preloading:
+    GUNICORN_PRELOAD=False gunicorn -c gunicorn.conf.py core.wsgi:application
+    python manage.py measure_worker_memory
+"""
+import gc
+import os
+import tempfile
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("GUNICORN_WORKERS", 3))
+# Threads let one worker serve concurrent requests, which the query embedding
+# micro-batcher (knowledge_base/embeddings.py) needs to form batches larger than 1
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+worker_class = "gthread"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+pidfile = os.environ.get("GUNICORN_PIDFILE", "/tmp/gunicorn.pid")
+preload_app = os.environ.get("GUNICORN_PRELOAD", "True") == "True"
+
+# Prometheus multiprocess mode: each worker writes its samples to this directory and
+# /metrics aggregates them (core/views.py). Must be set before prometheus_client is imported.
+os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="prometheus_multiproc_"))
+
+if preload_app:
+    # Load the models in the master while the app is preloaded (see core/wsgi.py). The
+    # warm-up encode bypasses the micro-batcher, so no thread is started before the fork
+    os.environ.setdefault("KNOWLEDGE_WARM_UP_ON_BOOT", "True")
+    # Each worker otherwise starts one torch/ONNX thread per core (and a single thread
+    # keeps torch from starting an OpenMP pool in the master during the warm-up)
+    os.environ.setdefault("OMP_NUM_THREADS", os.environ.get("GUNICORN_TORCH_THREADS", "1"))
+
+
+def pre_fork(server, worker):
+    # Move everything allocated so far (modules, model objects) to a permanent GC
+    # generation so the collector never touches those pages in the workers
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    if not server.cfg.preload_app:
+        return  # Nothing was loaded in the master
+    # Database connections and HTTP connection pools opened in the master
+    # must not be shared between processes
+    from django.db import connections
+
+    from services.gemini_service import reset_client
+
+    connections.close_all()
+    reset_client()
+    server.log.info(f"Worker {worker.pid} forked; DB connections and Gemini client reset.")
+
+
+def child_exit(server, worker):
+    # Drop the exited worker's live gauges from the aggregated metrics
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
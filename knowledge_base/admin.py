@@ -1,12 +1,15 @@
 from django.contrib import admin
-from .models import KnowledgeDocument, DocumentChunk
+from .embedding_versions import coverage
+from .faq import queue_regeneration
+from .models import (
+    Conversation, ConversationTurn, EmbeddingVersion, FaqEntry, KnowledgeDocument, DocumentChunk, ExtractedContent)
 
 # Register your models here.
 
 @admin.register(KnowledgeDocument)
 class KnowledgeDocumentAdmin(admin.ModelAdmin):
-    list_display = ('original_filename', 'status', 'uploaded_at', 'processed_at')
-    list_filter = ('status', 'uploaded_at')
+    list_display = ('original_filename', 'category', 'tags', 'status', 'uploaded_at', 'processed_at')
+    list_filter = ('status', 'category', 'uploaded_at')
     search_fields = ('original_filename',)
     readonly_fields = ('uploaded_at', 'processed_at', 'status', 'error_message')
     # We make status readonly here because it should be updated by the processing task
@@ -31,4 +34,83 @@ class DocumentChunkAdmin(admin.ModelAdmin):
     list_filter = ('document',)
     raw_id_fields = ('document',)
     readonly_fields = ('created_at', 'embedding') # Embedding is too large to display nicely
+    exclude = ('embedding_green', 'embedding_half_green', 'embedding_binary_green')  # Second embedding slot
     search_fields = ('text_content',)
+
+
+@admin.register(ExtractedContent)
+class ExtractedContentAdmin(admin.ModelAdmin):
+    """Extraction cache entries, filled by process_document (see extraction_cache.py)."""
+    list_display = ('content_hash', 'file_type', 'version', 'size_bytes', 'hits', 'created_at', 'last_used_at')
+    list_filter = ('file_type', 'version')
+    exclude = ('pages', 'segments')  # Whole documents, too large to display
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class ConversationTurnInline(admin.TabularInline):
+    model = ConversationTurn
+    fields = ('position', 'question', 'standalone_question', 'answer', 'tokens', 'created_at')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+
+@admin.register(Conversation)
+class ConversationAdmin(admin.ModelAdmin):
+    """Conversations of the query API, read-only (see conversations.py)."""
+    list_display = ('id', 'summarized_through', 'created_at', 'updated_at')
+    readonly_fields = ('summary', 'summarized_through', 'created_at', 'updated_at')
+    inlines = [ConversationTurnInline]
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(EmbeddingVersion)
+class EmbeddingVersionAdmin(admin.ModelAdmin):
+    """
+    Embedding models and their migrations, read-only: start, activate or cancel them
+    with the embedding_migration command (see embedding_versions.py).
+    """
+    list_display = ('model_name', 'backend', 'dimensions', 'slot', 'state', 'chunks_embedded',
+                    'rows_per_second', 'created_at', 'activated_at')
+    list_filter = ('state', 'slot')
+    readonly_fields = ('coverage',)
+
+    @admin.display(description="Chunks with a vector")
+    def coverage(self, obj):
+        embedded, total = coverage(obj)
+        return f"{embedded} / {total}"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(FaqEntry)
+class FaqEntryAdmin(admin.ModelAdmin):
+    """
+    Frequent questions answered offline (see faq.py). Answers are generated in the
+    background once an entry is added or its question changed.
+    """
+    list_display = ('question', 'source', 'enabled', 'asked', 'generated_at')
+    list_filter = ('source', 'enabled')
+    search_fields = ('question', 'answer')
+    fields = ('question', 'source', 'enabled', 'asked', 'answer', 'embedding_model', 'knowledge_base_version',
+              'generated_at')
+    readonly_fields = ('answer', 'embedding_model', 'knowledge_base_version', 'generated_at')
+
+    def save_model(self, request, obj, form, change):
+        if 'question' in form.changed_data:
+            # Not served until answered for the new question
+            obj.answer = ''
+            obj.knowledge_base_version = ''
+        super().save_model(request, obj, form, change)
+        queue_regeneration()
@@ -0,0 +1,250 @@
+"""
+Export and import of the processed knowledge base, to bring up a node without
+re-uploading and re-processing every document (python manage.py export_knowledge_base /
+import_knowledge_base).
+
+An archive is a tar file (gzipped when its name ends with .gz or .tgz) of:
+- documents.json: the completed documents (ids, metadata, scoping fields, file name),
+- chunks.jsonl: their searchable chunks, one JSON object per line (id, document, text, metadata),
+- embeddings.npy: the float32 (chunks, dimensions) array of the active embedding version,
+  row i being the embedding of line i of chunks.jsonl,
+- files/<document id>/<name>: the uploaded files, unless exported with include_files=False,
+- manifest.json: format, embedding model, counts and the SHA-256 of every other member.
+
+Imports check every checksum and the embedding model before writing anything, then
+insert the documents with bulk_create() (which sends no post_save, so nothing is queued
+for processing) and the chunks with binary COPY (see bulk_load.py), in one transaction.
+The half-precision and binary vectors are derived from the float32 embeddings, as
+process_document does, and the FAQ answers are regenerated once it commits.
+
+Into an empty knowledge base, the HNSW indexes are dropped and built once at the end
+rather than maintained row by row: DROP/CREATE INDEX in a transaction lock the chunks
+table (ACCESS EXCLUSIVE) until the import commits, so searches on the node wait for it.
+With `replace` (a node already answering questions) the indexes are kept and updated
+by the COPY: slower, but searches keep reading the previous knowledge base meanwhile.
+"""
+import hashlib
+import io
+import json
+import logging
+import tarfile
+import time
+from itertools import groupby
+from pathlib import PurePosixPath
+
+import numpy as np
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .bulk_load import copy_chunks
+from .embedding_versions import MIGRATING_STATES, active_embedding_version, create_slot_indexes, drop_slot_indexes
+from .faq import queue_regeneration
+from .models import DocumentChunk, EmbeddingVersion, KnowledgeDocument
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FORMAT = 1
+READ_BLOCK_SIZE = 1 << 20
+FETCH_BATCH_SIZE = 2000
+DOCUMENT_FIELDS = ['original_filename', 'category', 'tags']
+
+
+def _sha256(fileobj):
+    digest = hashlib.sha256()
+    for block in iter(lambda: fileobj.read(READ_BLOCK_SIZE), b''):
+        digest.update(block)
+    return digest.hexdigest()
+
+
+def _add_member(tar, members, name, payload):
+    info = tarfile.TarInfo(name)
+    info.size = len(payload)
+    info.mtime = int(time.time())
+    tar.addfile(info, io.BytesIO(payload))
+    members[name] = {'sha256': hashlib.sha256(payload).hexdigest(), 'size': len(payload)}
+
+
+def _write_mode(path):
+    return 'w:gz' if str(path).endswith(('.gz', '.tgz')) else 'w'
+
+
+def export_knowledge_base(path, include_files=True):
+    """
+    Writes the completed documents, their chunks and the active version's embeddings
+    to the archive `path`. Returns (documents, chunks) exported.
+    Raises ValueError if a chunk has no embedding in the active version.
+    """
+    version = active_embedding_version()
+    documents = list(KnowledgeDocument.objects.filter(status=KnowledgeDocument.Status.COMPLETED).order_by('id'))
+    rows = (
+        DocumentChunk.objects.filter(document__status=KnowledgeDocument.Status.COMPLETED, is_searchable=True)
+        .order_by('document_id', 'id')
+        .values_list('id', 'document_id', 'text_content', 'metadata', version.columns.full)
+    )
+    lines, vectors = [], []
+    for chunk_id, document_id, text, metadata, vector in rows.iterator(chunk_size=FETCH_BATCH_SIZE):
+        if vector is None:
+            raise ValueError(f"Chunk {chunk_id} has no {version.model_name} embedding; "
+                             f"finish the embedding migration before exporting.")
+        lines.append(json.dumps(
+            {'id': str(chunk_id), 'document': str(document_id), 'text': text, 'metadata': metadata},
+            ensure_ascii=False))
+        vectors.append(vector)
+    embeddings = np.array(vectors, dtype=np.float32).reshape(len(vectors), version.dimensions)
+
+    members = {}
+    with tarfile.open(path, _write_mode(path)) as tar:
+        exported = []
+        for document in documents:
+            member = None
+            if include_files and document.file and default_storage.exists(document.file.name):
+                member = f"files/{document.id}/{PurePosixPath(document.file.name).name}"
+                with default_storage.open(document.file.name, 'rb') as source:
+                    _add_member(tar, members, member, source.read())
+            elif include_files:
+                logger.warning(f"File of document {document.id} ({document.file.name}) not found, not exported.")
+            exported.append({
+                'id': str(document.id),
+                **{field: getattr(document, field) for field in DOCUMENT_FIELDS},
+                'valid_from': document.valid_from.isoformat() if document.valid_from else None,
+                'valid_until': document.valid_until.isoformat() if document.valid_until else None,
+                'uploaded_at': document.uploaded_at.isoformat(),
+                'processed_at': document.processed_at.isoformat() if document.processed_at else None,
+                'file_name': document.file.name,
+                'file': member,
+            })
+        _add_member(tar, members, 'documents.json', json.dumps(exported, ensure_ascii=False).encode())
+        _add_member(tar, members, 'chunks.jsonl', '\n'.join(lines).encode())
+        buffer = io.BytesIO()
+        np.save(buffer, embeddings)
+        _add_member(tar, members, 'embeddings.npy', buffer.getvalue())
+        manifest = {
+            'format': ARCHIVE_FORMAT,
+            'created_at': timezone.now().isoformat(),
+            'embedding': {'model_name': version.model_name, 'backend': version.backend,
+                          'dimensions': version.dimensions},
+            'documents': len(exported),
+            'chunks': len(lines),
+            'members': members,
+        }
+        _add_member(tar, {}, 'manifest.json', json.dumps(manifest, indent=2).encode())
+    logger.info(f"Exported {len(exported)} documents and {len(lines)} chunks to {path}.")
+    return len(exported), len(lines)
+
+
+def read_manifest(tar):
+    """The archive's manifest, after checking the SHA-256 of every member it lists."""
+    try:
+        manifest = json.load(tar.extractfile('manifest.json'))
+    except KeyError:
+        raise ValueError("Not a knowledge base archive: manifest.json is missing.")
+    if manifest.get('format') != ARCHIVE_FORMAT:
+        raise ValueError(f"Unsupported archive format {manifest.get('format')} (expected {ARCHIVE_FORMAT}).")
+    for name, expected in manifest['members'].items():
+        try:
+            fileobj = tar.extractfile(name)
+        except KeyError:
+            raise ValueError(f"The archive is incomplete: {name} is missing.")
+        if _sha256(fileobj) != expected['sha256']:
+            raise ValueError(f"Checksum mismatch for {name}: the archive is corrupted.")
+    return manifest
+
+
+def _check_compatible(manifest, version):
+    embedding = manifest['embedding']
+    if embedding['model_name'] != version.model_name or embedding['dimensions'] != version.dimensions:
+        raise ValueError(
+            f"The archive was embedded with {embedding['model_name']} ({embedding['dimensions']} dimensions), "
+            f"this node uses {version.model_name} ({version.dimensions} dimensions).")
+    if EmbeddingVersion.objects.filter(state__in=MIGRATING_STATES).exists():
+        raise ValueError("An embedding migration is in progress; finish or cancel it before importing.")
+
+
+def _load_document(fields, file_name):
+    return KnowledgeDocument(
+        id=fields['id'],
+        file=file_name,
+        status=KnowledgeDocument.Status.COMPLETED,
+        processed_at=parse_datetime(fields['processed_at']) if fields['processed_at'] else None,
+        valid_from=parse_date(fields['valid_from']) if fields['valid_from'] else None,
+        valid_until=parse_date(fields['valid_until']) if fields['valid_until'] else None,
+        **{field: fields[field] for field in DOCUMENT_FIELDS},
+    )
+
+
+def import_knowledge_base(path, replace=False):
+    """
+    Loads an archive written by export_knowledge_base(). The knowledge base must be
+    empty unless `replace`, which deletes the current documents in the same
+    transaction (see the module docstring for the locks). Returns (documents, chunks) imported.
+    Raises ValueError, before changing anything, if the archive is corrupted or was
+    embedded with another model than the active one.
+    """
+    version = active_embedding_version()
+    with tarfile.open(path, 'r:*') as tar:
+        manifest = read_manifest(tar)
+        _check_compatible(manifest, version)
+        exported = json.load(tar.extractfile('documents.json'))
+        lines = tar.extractfile('chunks.jsonl').read().decode()
+        chunks = [json.loads(line) for line in lines.split('\n')] if lines else []
+        embeddings = np.load(io.BytesIO(tar.extractfile('embeddings.npy').read()), allow_pickle=False)
+        if embeddings.shape != (len(chunks), version.dimensions):
+            raise ValueError(f"embeddings.npy has shape {embeddings.shape}, "
+                             f"expected ({len(chunks)}, {version.dimensions}).")
+
+        saved_files = []
+        try:
+            with transaction.atomic():
+                replacing = KnowledgeDocument.objects.exists()
+                if replacing:
+                    if not replace:
+                        raise ValueError("The knowledge base isn't empty; import with replace to overwrite it.")
+                    replaced_files = [name for name in KnowledgeDocument.objects.values_list('file', flat=True) if name]
+                    KnowledgeDocument.objects.all().delete()
+                    # The files go once the deletion is committed (new files never reuse their names)
+                    transaction.on_commit(lambda: [default_storage.delete(name) for name in replaced_files])
+
+                documents = {}
+                for fields in exported:
+                    file_name = fields['file_name']
+                    if fields['file']:
+                        file_name = default_storage.save(file_name, File(tar.extractfile(fields['file'])))
+                        saved_files.append(file_name)
+                    documents[fields['id']] = _load_document(fields, file_name)
+                # bulk_create() sends no post_save, so process_document isn't queued
+                KnowledgeDocument.objects.bulk_create(documents.values())
+                # ... but it stamps uploaded_at (auto_now_add), restored here
+                for fields in exported:
+                    documents[fields['id']].uploaded_at = parse_datetime(fields['uploaded_at'])
+                KnowledgeDocument.objects.bulk_update(documents.values(), ['uploaded_at'])
+
+                # Building the HNSW indexes once is faster than maintaining them for every COPY,
+                # but locks out searches until the commit
+                if not replacing:
+                    drop_slot_indexes(version)
+                start = 0
+                for document_id, rows in groupby(chunks, key=lambda chunk: chunk['document']):
+                    rows = list(rows)
+                    if document_id not in documents:
+                        raise ValueError(f"Chunk {rows[0]['id']} belongs to a document missing from the archive.")
+                    copy_chunks(
+                        documents[document_id],
+                        [row['text'] for row in rows],
+                        {version.slot: embeddings[start:start + len(rows)]},
+                        [row['metadata'] for row in rows],
+                        ids=[row['id'] for row in rows],
+                    )
+                    start += len(rows)
+                if not replacing:
+                    create_slot_indexes(version)
+                # bulk_create() sends no post_save either: answers of the previous knowledge base are stale
+                queue_regeneration()
+        except BaseException:
+            for name in saved_files:
+                default_storage.delete(name)
+            raise
+    logger.info(f"Imported {len(documents)} documents and {len(chunks)} chunks from {path}.")
+    return len(documents), len(chunks)
@@ -0,0 +1,197 @@
+"""
+Bulk loading of document chunks with COPY ... FROM STDIN (FORMAT binary).
+
+bulk_create() renders every embedding as SQL text: 384 floats per vector, converted to
+Python floats (.tolist()) then to decimal strings, twice (embedding and embedding_half),
+and parsed back by Postgres. copy_chunks() instead streams rows in Postgres' binary COPY
+format: the vectors are the float32/float16 bytes of the numpy array (big-endian, as
+pgvector's vector_recv/halfvec_recv read them) and the binary embedding is np.packbits
+of the signs, so no Python object is created per component.
+
+Chunks get the vectors of every live embedding version, each in its slot of columns
+(see embedding_versions.py); update_slot_vectors() fills one slot of existing chunks.
+
+Compare both paths with: python manage.py benchmark_chunk_load
+"""
+import io
+import json
+import struct
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .embeddings import binary_quantize
+from .models import SLOT_COLUMNS, DocumentChunk
+
+COPY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)  # Signature, flags, header extension
+COPY_TRAILER = struct.pack('>h', -1)
+POSTGRES_EPOCH = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+JSONB_VERSION = b'\x01'
+ROWS_PER_BLOCK = 256  # Rows encoded per block handed to the driver
+
+# Followed by the full, half and binary columns of each slot written
+COLUMNS = ('id', 'document_id', 'text_content', 'metadata', 'is_searchable', 'created_at')
+
+
+def _field(payload):
+    return struct.pack('>i', len(payload)) + payload
+
+
+def _null_field():
+    return struct.pack('>i', -1)
+
+
+def _vector_header(dimensions):
+    # vector/halfvec: int16 dimensions, int16 unused; bit: int32 length in bits
+    return struct.pack('>hh', dimensions, 0)
+
+
+def slot_embeddings(embeddings):
+    """{slot: (n, dimensions) array}; a bare array holds the active version's embeddings."""
+    if isinstance(embeddings, dict):
+        return embeddings
+    from .embedding_versions import active_embedding_version
+    return {active_embedding_version().slot: embeddings}
+
+
+def copy_columns(slots):
+    return COLUMNS + tuple(column for slot in slots for column in SLOT_COLUMNS[slot][:3])
+
+
+def encode_vectors(embeddings):
+    """Per row, the full, half and binary fields of an (n, dimensions) array, concatenated."""
+    embeddings = np.asarray(embeddings)
+    count, dimensions = embeddings.shape
+    full = embeddings.astype('>f4')
+    half = embeddings.astype('>f2')
+    bits = np.packbits(embeddings > 0, axis=1)  # Same bits as binary_quantize(), MSB first
+    vector_header = _vector_header(dimensions)
+    bit_header = struct.pack('>i', dimensions)
+    return [
+        _field(vector_header + full[index].tobytes())
+        + _field(vector_header + half[index].tobytes())
+        + _field(bit_header + bits[index].tobytes())
+        for index in range(count)
+    ]
+
+
+def _blocks(rows):
+    """The binary COPY stream of encoded rows, by blocks of ROWS_PER_BLOCK rows."""
+    yield COPY_SIGNATURE
+    for start in range(0, len(rows), ROWS_PER_BLOCK):
+        yield b''.join(rows[start:start + ROWS_PER_BLOCK])
+    yield COPY_TRAILER
+
+
+def encode_rows(document_id, texts, embeddings, metadata=None, is_searchable=True, ids=None):
+    """
+    Yields the binary COPY stream of the chunks, columns in copy_columns() order.
+    `embeddings` maps slots to their (n, dimensions) arrays; `ids` defaults to new UUIDs.
+    """
+    vectors = [encode_vectors(slot_vectors) for slot_vectors in embeddings.values()]
+    document = _field(uuid.UUID(str(document_id)).bytes)
+    searchable = _field(b'\x01' if is_searchable else b'\x00')
+    microseconds = (timezone.now() - POSTGRES_EPOCH) // timedelta(microseconds=1)
+    created_at = _field(struct.pack('>q', microseconds))
+    field_count = struct.pack('>h', len(COLUMNS) + 3 * len(vectors))
+
+    rows = []
+    for index, text in enumerate(texts):
+        chunk_metadata = metadata[index] if metadata is not None else None
+        rows.append(b''.join((
+            field_count,
+            _field(uuid.uuid4().bytes if ids is None else uuid.UUID(str(ids[index])).bytes),
+            document,
+            _field(text.encode()),
+            _null_field() if chunk_metadata is None else _field(
+                JSONB_VERSION + json.dumps(chunk_metadata, ensure_ascii=False).encode()),
+            searchable,
+            created_at,
+            *(slot_vectors[index] for slot_vectors in vectors),
+        )))
+    yield from _blocks(rows)
+
+
+class IteratorReader(io.RawIOBase):
+    """Read-only file object over an iterator of bytes, for cursor.copy_expert()."""
+
+    def __init__(self, blocks):
+        self._blocks = iter(blocks)
+        self._buffer = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while not self._buffer:
+            block = next(self._blocks, None)
+            if block is None:
+                return 0
+            self._buffer = memoryview(block)
+        size = min(len(target), len(self._buffer))
+        target[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def copy_chunks(document, texts, embeddings, metadata=None, is_searchable=True, ids=None):
+    """
+    Inserts one chunk per text with binary COPY. `embeddings` is the (n, dimensions)
+    array returned by the embedding backend, or {slot: array} to fill several slots.
+    `ids` keeps the chunks' ids (import_knowledge_base). Returns the number of rows inserted.
+    """
+    embeddings = slot_embeddings(embeddings)
+    columns = ', '.join(connection.ops.quote_name(column) for column in copy_columns(embeddings))
+    sql = f"COPY {DocumentChunk._meta.db_table} ({columns}) FROM STDIN WITH (FORMAT binary)"
+    stream = IteratorReader(encode_rows(document.pk, texts, embeddings, metadata, is_searchable, ids))
+    with connection.cursor() as cursor:
+        cursor.copy_expert(sql, stream)
+        return cursor.rowcount
+
+
+def update_slot_vectors(slot, ids, embeddings):
+    """
+    Sets the vectors of existing chunks in one slot: binary COPY into a temporary
+    table, then a single UPDATE ... FROM. Returns the number of chunks updated.
+    """
+    full, half, binary = SLOT_COLUMNS[slot][:3]
+    rows = [
+        struct.pack('>h', 4) + _field(uuid.UUID(str(chunk_id)).bytes) + vectors
+        for chunk_id, vectors in zip(ids, encode_vectors(embeddings))
+    ]
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Within an outer transaction, ON COMMIT DROP leaves the previous call's table
+        cursor.execute("DROP TABLE IF EXISTS pg_temp.chunk_vectors")
+        cursor.execute(
+            "CREATE TEMPORARY TABLE chunk_vectors (id uuid, full_vector vector, half_vector halfvec, "
+            "binary_vector varbit) ON COMMIT DROP")
+        cursor.copy_expert("COPY chunk_vectors FROM STDIN WITH (FORMAT binary)", IteratorReader(_blocks(rows)))
+        cursor.execute(
+            f"UPDATE {DocumentChunk._meta.db_table} AS chunk SET {full} = vectors.full_vector, "
+            f"{half} = vectors.half_vector, {binary} = vectors.binary_vector "
+            f"FROM chunk_vectors AS vectors WHERE chunk.id = vectors.id")
+        return cursor.rowcount
+
+
+def create_chunks(document, texts, embeddings, metadata=None, is_searchable=True, batch_size=100):
+    """The previous bulk_create() path, kept as the reference of benchmark_chunk_load."""
+    embeddings = slot_embeddings(embeddings)
+    chunks = []
+    for index, text in enumerate(texts):
+        chunk = DocumentChunk(
+            document=document,
+            text_content=text,
+            metadata=metadata[index] if metadata is not None else None,
+            is_searchable=is_searchable,
+        )
+        for slot, slot_vectors in embeddings.items():
+            full, half, binary = SLOT_COLUMNS[slot][:3]
+            setattr(chunk, full, slot_vectors[index].tolist())
+            setattr(chunk, half, slot_vectors[index].tolist())
+            setattr(chunk, binary, binary_quantize(slot_vectors[index]))
+        chunks.append(chunk)
+    DocumentChunk.objects.bulk_create(chunks, batch_size=batch_size)
+    return len(chunks)
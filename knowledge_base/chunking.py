@@ -0,0 +1,210 @@
+"""
+Chunking of extracted documents into the texts that get embedded.
+
+StructuredChunker (default) works on the Segments of extraction.py:
+- chunks never straddle a heading, except that a section too small to stand on its
+  own (< min_tokens) is merged with the next one, its heading kept inline;
+- each chunk starts with its heading path ("Programmes > Autoroute Matin"), so a
+  chunk taken out of its document still says what it is about;
+- sizes are counted in model tokens, so a chunk always fits the embedding model's
+  window (MAX_SEQUENCE_LENGTH word pieces for all-MiniLM-L6-v2) instead of being
+  silently truncated;
+- only a paragraph too long for one chunk is split (on lines, then sentences, then
+  words), and only its pieces overlap.
+
+split_recursive() is the previous character-based splitter, kept for comparison
+(see the compare_chunkers command) and as the KNOWLEDGE_CHUNKER='recursive' fallback.
+"""
+import re
+from collections import namedtuple
+from itertools import islice
+
+from django.conf import settings
+
+from .embeddings import MAX_SEQUENCE_LENGTH
+from .extraction import HEADING
+
+CHUNKER_STRUCTURED = 'structured'
+CHUNKER_RECURSIVE = 'recursive'
+CHUNKERS = (CHUNKER_STRUCTURED, CHUNKER_RECURSIVE)
+
+# Character-based splitter parameters
+RECURSIVE_CHUNK_SIZE = 1000  # Characters
+RECURSIVE_CHUNK_OVERLAP = 150  # Characters overlap between chunks
+
+SPECIAL_TOKENS = 2  # [CLS] and [SEP], added by the model to every input
+HEADING_PATH_SEPARATOR = ' > '
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?;:])\s+')
+
+TOKEN_COUNT_BATCH = 256  # Segments measured per count_tokens call
+
+Chunk = namedtuple('Chunk', ['text', 'metadata'])
+
+
+def split_recursive(text):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=RECURSIVE_CHUNK_SIZE,
+        chunk_overlap=RECURSIVE_CHUNK_OVERLAP,
+        length_function=len,
+    )
+    return text_splitter.split_text(text)
+
+
+class StructuredChunker:
+    """
+    `count_tokens(texts)` returns the number of model tokens of each text, without
+    special tokens (the embedding backends' count_tokens method).
+    """
+
+    def __init__(self, count_tokens, max_tokens=None, overlap_tokens=None, min_tokens=None):
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens or getattr(settings, 'KNOWLEDGE_CHUNK_MAX_TOKENS', MAX_SEQUENCE_LENGTH)
+        self.overlap_tokens = overlap_tokens if overlap_tokens is not None else getattr(
+            settings, 'KNOWLEDGE_CHUNK_OVERLAP_TOKENS', 32)
+        self.min_tokens = min_tokens if min_tokens is not None else getattr(
+            settings, 'KNOWLEDGE_CHUNK_MIN_TOKENS', 48)
+
+    def split(self, segments):
+        """
+        Returns the Chunks (text + metadata) of an iterable of extraction Segments, which is
+        consumed as it goes (extractors are generators).
+        """
+        self.chunks = []
+        self.headings = []  # (level, text) of the enclosing headings
+        self._start_chunk()
+        for segment, length in self._measured(segments):
+            if segment.kind == HEADING:
+                self._add_heading(segment, length)
+                continue
+            budget = self._budget()
+            row = (segment.metadata or {}).get('row')
+            if length <= budget:
+                self._add(segment.text, length, segment.page, row=row)
+                continue
+            # A paragraph longer than a chunk: pack its pieces, overlapping between chunks
+            paragraph_pieces = []
+            for text, piece_length, separator in self._pieces(segment.text, budget):
+                if self.tokens + piece_length > self._budget() and self.parts:
+                    self._flush()
+                    paragraph_pieces = self._carry_overlap(paragraph_pieces, segment.page)
+                self._add(text, piece_length, segment.page, separator if paragraph_pieces else None)
+                paragraph_pieces.append((text, piece_length, separator))
+        self._flush()
+        return self.chunks
+
+    def _measured(self, segments):
+        """(segment, tokens) of the non-empty segments, counted by batches."""
+        segments = (segment for segment in segments if segment.text.strip())
+        while batch := list(islice(segments, TOKEN_COUNT_BATCH)):
+            yield from zip(batch, self.count_tokens([segment.text for segment in batch]))
+
+    # --- Chunk being built ---
+
+    def _start_chunk(self):
+        self.parts = []
+        self.tokens = 0
+        self.pages = set()
+        self.rows = []  # Rows of tabular sources (CSV)
+        self.heading_path = None  # Fixed when the first text is added
+
+    def _path_text(self):
+        path = HEADING_PATH_SEPARATOR.join(text for _, text in self.headings)
+        if not path:
+            return '', 0
+        length = self.count_tokens([path])[0]
+        if length > self.max_tokens // 4 and len(self.headings) > 1:
+            # Deep or long paths would eat the chunk: keep the nearest heading only
+            path = self.headings[-1][1]
+            length = self.count_tokens([path])[0]
+        if length > self.max_tokens // 4:
+            return '', 0
+        return path, length
+
+    def _budget(self):
+        if self.heading_path is None:
+            self.heading_path = self._path_text()
+        return self.max_tokens - SPECIAL_TOKENS - self.heading_path[1]
+
+    def _add(self, text, length, page, separator=None, row=None):
+        """Adds text as a new part of the chunk, or appended to the last part with `separator`."""
+        self._budget()  # Fixes the heading path of a new chunk
+        if self.parts and self.tokens + length > self._budget():
+            self._flush()
+            self._budget()
+        if separator is not None and self.parts:
+            self.parts[-1] += separator + text
+        else:
+            self.parts.append(text)
+        self.tokens += length
+        if page is not None:
+            self.pages.add(page)
+        if row is not None:
+            self.rows.append(row)
+
+    def _add_heading(self, segment, length):
+        if self.tokens >= self.min_tokens:
+            self._flush()
+        elif self.parts:
+            # Section too small on its own: continue it with the next one, heading inline
+            self._add(segment.text, length, segment.page)
+        while self.headings and self.headings[-1][0] >= segment.level:
+            self.headings.pop()
+        self.headings.append((segment.level, segment.text))
+
+    def _carry_overlap(self, pieces, page):
+        """Starts the new chunk with the last pieces (up to overlap_tokens) of the paragraph being split."""
+        carried = []
+        total = 0
+        for text, length, separator in reversed(pieces):
+            if total + length > self.overlap_tokens:
+                break
+            carried.insert(0, (text, length, separator))
+            total += length
+        for index, (text, length, separator) in enumerate(carried):
+            self._add(text, length, page, separator if index else None)
+        return carried
+
+    def _flush(self):
+        if self.parts:
+            path, path_tokens = self.heading_path or ('', 0)
+            body = '\n\n'.join(self.parts)
+            metadata = {'chunk_index': len(self.chunks), 'tokens': self.tokens + path_tokens}
+            if self.pages:
+                metadata['pages'] = sorted(self.pages)
+            if self.rows:
+                metadata['rows'] = [min(self.rows), max(self.rows)]
+            if path:
+                metadata['headings'] = path.split(HEADING_PATH_SEPARATOR)
+            self.chunks.append(Chunk(f"{path}\n\n{body}" if path else body, metadata))
+        self._start_chunk()
+
+    # --- Splitting of long paragraphs ---
+
+    def _pieces(self, text, budget):
+        """
+        (text, tokens, separator) pieces of a long text, each within budget: lines, then
+        sentences, then words. `separator` joins a piece to the previous one.
+        """
+        for splitter, separator in ((str.splitlines, '\n'), (SENTENCE_BOUNDARY.split, ' ')):
+            pieces = [piece.strip() for piece in splitter(text) if piece.strip()]
+            if len(pieces) > 1:
+                for piece, length in zip(pieces, self.count_tokens(pieces)):
+                    if length <= budget:
+                        yield piece, length, separator
+                    else:
+                        yield from self._pieces(piece, budget)
+                return
+        yield from self._word_windows(text, budget)
+
+    def _word_windows(self, text, budget):
+        words = text.split()
+        window, window_tokens = [], 0
+        for word, length in zip(words, self.count_tokens(words)):
+            if window and window_tokens + length > budget:
+                yield ' '.join(window), window_tokens, ' '
+                window, window_tokens = [], 0
+            window.append(word)
+            window_tokens += length
+        if window:
+            yield ' '.join(window), window_tokens, ' '
@@ -0,0 +1,137 @@
+"""
+Single-flight coalescing of identical questions.
+
+During live shows many listeners ask the same question within seconds. Requests with
+the same normalised question, filters and knowledge base version share one run of the
+query pipeline (embedding, search, Gemini) and all receive its result:
+
+- within a gunicorn worker, threads asking the same question wait for the first one;
+- across workers, that first thread takes a Postgres advisory lock on the key. Workers
+  queueing on the lock read the result the holder stored as a CoalescedAnswer row
+  before releasing it, instead of running the pipeline again.
+
+Results are only reused by requests that were waiting for them, or that arrived
+settings.KNOWLEDGE_COALESCE_WINDOW_SECONDS at most before they were stored (tolerance
+for requests that missed the lock by a few milliseconds and for clock skew between
+hosts). This is not an answer cache: a new document, or switching to another embedding
+version, changes the key. A request that can't get the lock, or whose in-process leader
+hasn't finished, within KNOWLEDGE_COALESCE_WAIT_SECONDS runs the pipeline itself.
+"""
+import hashlib
+import json
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .models import CoalescedAnswer, KnowledgeDocument
+
+logger = logging.getLogger(__name__)
+
+# Stored results older than this are deleted whenever a new one is stored
+RETENTION = timedelta(minutes=1)
+
+
+def normalize_question(question):
+    return ' '.join(question.casefold().split())
+
+
+def knowledge_base_version():
+    """Stamp changing whenever a document finishes processing or a processed one is deleted."""
+    stamp = KnowledgeDocument.objects.filter(status=KnowledgeDocument.Status.COMPLETED).aggregate(
+        count=Count('id'), last=Max('processed_at'))
+    return f"{stamp['count']}:{stamp['last'].isoformat() if stamp['last'] else ''}"
+
+
+def coalesce_key(question, filters=None, embedding_version=None):
+    payload = json.dumps(
+        [normalize_question(question), filters or {}, knowledge_base_version(),
+         embedding_version.pk if embedding_version is not None else None],
+        sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """One instance per process (`single_flight` below); the advisory lock spans processes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executions = 0  # Pipeline runs, for tests and debugging
+
+    def run(self, key, compute):
+        """
+        Returns compute()'s JSON-serialisable result, shared with every concurrent call
+        with the same key. An exception raised by compute() is raised in all of them.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            # A hung leader mustn't hang its followers (the cross-worker wait is bounded by lock_timeout)
+            if not call.done.wait(getattr(settings, 'KNOWLEDGE_COALESCE_WAIT_SECONDS', 30)):
+                logger.warning(f"Gave up waiting for the in-flight query {key[:12]}, running it again.")
+                return self._execute(compute)
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_shared(key, compute)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _run_shared(self, key, compute):
+        started = timezone.now()
+        lock_id = int.from_bytes(bytes.fromhex(key[:16]), 'big', signed=True)
+        wait_seconds = getattr(settings, 'KNOWLEDGE_COALESCE_WAIT_SECONDS', 30)
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                # Session lock (kept after the block), the timeout only applies to taking it
+                cursor.execute("SELECT set_config('lock_timeout', %s, true)", [f'{int(wait_seconds * 1000)}ms'])
+                cursor.execute("SELECT pg_advisory_lock(%s)", [lock_id])
+        except OperationalError:
+            logger.warning(f"Gave up waiting for the in-flight query {key[:12]}, running it again.")
+            return self._execute(compute)
+
+        try:
+            window = timedelta(seconds=getattr(settings, 'KNOWLEDGE_COALESCE_WINDOW_SECONDS', 2))
+            shared = CoalescedAnswer.objects.filter(key=key, created_at__gte=started - window).first()
+            if shared is not None:
+                return shared.result
+            result = self._execute(compute)
+            now = timezone.now()
+            CoalescedAnswer.objects.bulk_create(
+                [CoalescedAnswer(key=key, result=result, created_at=now)],
+                update_conflicts=True, unique_fields=['key'], update_fields=['result', 'created_at'])
+            CoalescedAnswer.objects.filter(created_at__lt=now - RETENTION).delete()
+            return result
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", [lock_id])
+
+    def _execute(self, compute):
+        self.executions += 1
+        return compute()
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,133 @@
+"""
+Server-side conversation sessions for the query API.
+
+Every turn (question, answer) is stored. The prompt gets the conversation's rolling
+summary plus the most recent turns that fit in settings.KNOWLEDGE_CONVERSATION_HISTORY_TOKENS,
+so its size is bounded however long the chat. Once the turns not yet summarised
+outgrow that budget, the summarize_conversation task folds the oldest of them into
+the summary, off the request path. Follow-up questions are condensed into standalone
+questions (gemini_service.condense_question) before retrieval.
+
+Token counts are estimates: about 4 characters per Gemini token on French text.
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from .models import Conversation, ConversationTurn
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+WORDS_PER_TOKEN = 0.6
+# Turns left verbatim after the older ones are folded into the summary
+KEEP_RECENT_TURNS = 2
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def history_tokens():
+    return getattr(settings, 'KNOWLEDGE_CONVERSATION_HISTORY_TOKENS', 1200)
+
+
+def recent_turns():
+    return getattr(settings, 'KNOWLEDGE_CONVERSATION_RECENT_TURNS', 6)
+
+
+def summary_tokens():
+    return getattr(settings, 'KNOWLEDGE_CONVERSATION_SUMMARY_TOKENS', 300)
+
+
+def pending_turns(conversation):
+    """Turns not yet folded into the summary."""
+    return conversation.turns.filter(position__gt=conversation.summarized_through)
+
+
+def prompt_history(conversation):
+    """
+    (summary, [(question, answer), ...] oldest first) for the prompt: the summary and
+    the newest unsummarised turns that fit in the history budget.
+    """
+    budget = history_tokens() - estimate_tokens(conversation.summary)
+    history = []
+    turns = pending_turns(conversation).order_by('-position').values_list('question', 'answer', 'tokens')
+    for question, answer, tokens in turns[:recent_turns()]:
+        if tokens > budget:
+            break  # Older turns are left to the summary, once the summariser has caught up
+        history.append((question, answer))
+        budget -= tokens
+    history.reverse()
+    return conversation.summary, history
+
+
+def _create_turn(conversation, position, question, standalone_question, answer):
+    return ConversationTurn.objects.create(
+        conversation=conversation,
+        position=position,
+        question=question,
+        standalone_question=standalone_question or '',
+        answer=answer,
+        tokens=estimate_tokens(question) + estimate_tokens(answer),
+    )
+
+
+def start_conversation(question, answer):
+    """
+    Creates a conversation with its first turn, once that question was answered. No
+    lock nor aggregate: nobody else knows the conversation yet, and a single turn is
+    never summarised.
+    """
+    with transaction.atomic():
+        conversation = Conversation.objects.create()
+        _create_turn(conversation, 1, question, None, answer)
+    return conversation
+
+
+def record_turn(conversation, question, standalone_question, answer):
+    """Stores a turn. Returns True when the conversation should be summarised."""
+    with transaction.atomic():
+        # Serialises concurrent turns of one conversation for their positions
+        Conversation.objects.select_for_update().filter(pk=conversation.pk).update(updated_at=timezone.now())
+        position = (conversation.turns.aggregate(last=Max('position'))['last'] or 0) + 1
+        _create_turn(conversation, position, question, standalone_question, answer)
+    pending = pending_turns(conversation).aggregate(tokens=Sum('tokens'))
+    over_budget = estimate_tokens(conversation.summary) + (pending['tokens'] or 0) > history_tokens()
+    too_many = position - conversation.summarized_through > recent_turns()
+    return over_budget or too_many
+
+
+def fold_turns(conversation_id):
+    """
+    Folds the unsummarised turns, except the last KEEP_RECENT_TURNS, into the summary.
+    Gemini is called without holding any lock; if the conversation was summarised in the
+    meantime, the result is dropped. Returns True when the summary was updated.
+    """
+    from services.gemini_service import summarize_conversation
+
+    try:
+        conversation = Conversation.objects.get(pk=conversation_id)
+    except Conversation.DoesNotExist:
+        return False
+    pending = list(pending_turns(conversation).order_by('position'))
+    to_fold = pending[:-KEEP_RECENT_TURNS]
+    if not to_fold:
+        return False
+
+    max_words = int(summary_tokens() * WORDS_PER_TOKEN)
+    summary = summarize_conversation(
+        conversation.summary, [(turn.question, turn.answer) for turn in to_fold], max_words)
+    if summary is None:
+        return False
+    # The model doesn't always respect the length asked for
+    summary = summary[:summary_tokens() * CHARS_PER_TOKEN]
+    updated = Conversation.objects.filter(
+        pk=conversation.pk, summarized_through=conversation.summarized_through,
+    ).update(summary=summary, summarized_through=to_fold[-1].position)
+    if updated:
+        logger.info(f"Folded {len(to_fold)} turns into the summary of conversation {conversation.pk}.")
+    return bool(updated)
@@ -0,0 +1,321 @@
+"""
+Blue/green migrations of the embedding model.
+
+DocumentChunk has two slots of vector columns (models.SLOT_COLUMNS). The ACTIVE
+EmbeddingVersion serves queries from its slot while a new version is filled in the
+other one:
+
+1. start_migration() records the new model as BACKFILLING in the free slot and drops
+   that slot's indexes (they are cast to the previous occupant's dimensions).
+2. The reembed_chunks task runs backfill() in bounded steps: the slot is cleared of the
+   retired version's vectors, its HNSW indexes are created empty (they then grow with
+   each batch instead of being built in one long pass), and every chunk is embedded in
+   primary key order, throttled to settings.KNOWLEDGE_REEMBED_MAX_ROWS_PER_SECOND.
+   Meanwhile process_document writes the vectors of every live version, and a final
+   sweep embeds the chunks written before the migration was visible to it.
+3. Once every chunk has a vector in the slot, the version is READY and activate()
+   switches queries to it in one transaction (automatically unless
+   settings.KNOWLEDGE_EMBEDDING_AUTO_ACTIVATE is False). The previous version is RETIRED;
+   its vectors stay in place until the next migration reuses the slot.
+
+Chunk boundaries are not recomputed: they were sized with the tokenizer of the model
+that was active when the document was processed. Reprocess documents to re-chunk them.
+
+Without any EmbeddingVersion row, EMBEDDING_MODEL_NAME is the active version, in the blue slot.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .embeddings import EMBEDDING_MODEL_NAME, load_embedding_backend
+from .models import SLOT_BLUE, SLOT_GREEN, DocumentChunk, EmbeddingVersion
+
+logger = logging.getLogger(__name__)
+
+LIVE_STATES = (
+    EmbeddingVersion.State.ACTIVE, EmbeddingVersion.State.BACKFILLING, EmbeddingVersion.State.READY)
+MIGRATING_STATES = (EmbeddingVersion.State.BACKFILLING, EmbeddingVersion.State.READY)
+# First key of the advisory lock taken by backfill(), the second being the version id
+BACKFILL_LOCK_NAMESPACE = 0x45564552  # 'EVER'
+
+_cache_lock = threading.Lock()
+_cached_version = None
+_cached_until = 0.0
+
+
+def default_backend():
+    return getattr(settings, 'KNOWLEDGE_EMBEDDING_BACKEND', 'torch')
+
+
+def default_version():
+    """The implicit (unsaved) version used until an embedding migration is started."""
+    return EmbeddingVersion(
+        model_name=EMBEDDING_MODEL_NAME,
+        backend=default_backend(),
+        dimensions=DocumentChunk.EMBEDDING_DIMENSIONS,
+        slot=SLOT_BLUE,
+        state=EmbeddingVersion.State.ACTIVE,
+        slot_prepared=True,
+    )
+
+
+def active_embedding_version():
+    """
+    The version serving queries. Cached per process for
+    settings.KNOWLEDGE_EMBEDDING_VERSION_CACHE_SECONDS: API workers follow a switch
+    within that delay, both slots being searchable in the meantime.
+    """
+    global _cached_version, _cached_until
+    now = time.monotonic()
+    with _cache_lock:
+        if _cached_version is not None and now < _cached_until:
+            return _cached_version
+    version = EmbeddingVersion.objects.filter(state=EmbeddingVersion.State.ACTIVE).first() or default_version()
+    with _cache_lock:
+        _cached_version = version
+        _cached_until = now + getattr(settings, 'KNOWLEDGE_EMBEDDING_VERSION_CACHE_SECONDS', 5)
+    return version
+
+
+def clear_version_cache():
+    global _cached_version
+    with _cache_lock:
+        _cached_version = None
+
+
+def ensure_active_version():
+    """The active version, saving the implicit default one if needed."""
+    default = default_version()
+    version, _ = EmbeddingVersion.objects.get_or_create(
+        state=EmbeddingVersion.State.ACTIVE,
+        defaults={field: getattr(default, field)
+                  for field in ('model_name', 'backend', 'dimensions', 'slot', 'slot_prepared')},
+    )
+    return version
+
+
+def writing_versions():
+    """Versions whose slot new chunks must be written to: the active one and the one being migrated to."""
+    versions = list(EmbeddingVersion.objects.filter(state__in=LIVE_STATES).order_by('created_at'))
+    if not any(version.state == EmbeddingVersion.State.ACTIVE for version in versions):
+        versions.insert(0, default_version())
+    return versions
+
+
+def _slot_indexes(version):
+    columns = version.columns
+    return (
+        (columns.half_index, columns.half, f'halfvec({version.dimensions})', 'halfvec_cosine_ops'),
+        (columns.binary_index, columns.binary, f'bit({version.dimensions})', 'bit_hamming_ops'),
+    )
+
+
+def drop_slot_indexes(version):
+    # CONCURRENTLY can't run in a transaction (tests, or a caller's atomic block)
+    concurrently = '' if connection.in_atomic_block else ' CONCURRENTLY'
+    with connection.cursor() as cursor:
+        for name, _, _, _ in _slot_indexes(version):
+            cursor.execute(f"DROP INDEX{concurrently} IF EXISTS {name}")
+
+
+def create_slot_indexes(version):
+    """
+    (Re)creates the HNSW indexes of the version's slot. Their expressions cast the
+    untyped columns to the version's dimensions, as retrieval.vector_search() does.
+    """
+    drop_slot_indexes(version)
+    concurrently = '' if connection.in_atomic_block else ' CONCURRENTLY'
+    table = DocumentChunk._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.in_atomic_block:
+            # Deferred foreign key checks of the transaction's inserts would block CREATE INDEX
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        for name, column, cast, opclass in _slot_indexes(version):
+            cursor.execute(
+                f"CREATE INDEX{concurrently} {name} ON {table} USING hnsw (({column}::{cast}) {opclass}) "
+                f"WITH (m = 16, ef_construction = 64) WHERE is_searchable")
+
+
+def start_migration(model_name, backend=None, dimensions=None):
+    """
+    Records a new BACKFILLING version of `model_name` in the slot the active version
+    doesn't use. `dimensions` defaults to the size of the model's embeddings.
+    Raises ValueError while another migration is in progress.
+    """
+    backend = backend or default_backend()
+    active = ensure_active_version()
+    if EmbeddingVersion.objects.filter(state__in=MIGRATING_STATES).exists():
+        raise ValueError("An embedding migration is already in progress.")
+    if dimensions is None:
+        dimensions = len(load_embedding_backend(backend, model_name).encode(["FER FM"])[0])
+    version = EmbeddingVersion.objects.create(
+        model_name=model_name,
+        backend=backend,
+        dimensions=dimensions,
+        slot=SLOT_GREEN if active.slot == SLOT_BLUE else SLOT_BLUE,
+        state=EmbeddingVersion.State.BACKFILLING,
+    )
+    drop_slot_indexes(version)
+    logger.info(f"Started embedding migration to {version} ({dimensions} dimensions).")
+    return version
+
+
+def cancel_migration(version):
+    updated = EmbeddingVersion.objects.filter(pk=version.pk, state__in=MIGRATING_STATES).update(
+        state=EmbeddingVersion.State.CANCELLED, updated_at=timezone.now())
+    if not updated:
+        raise ValueError(f"{version} is not being migrated to.")
+    # Its vectors are left in place, nothing maintains the indexes anymore
+    drop_slot_indexes(version)
+
+
+def missing_vectors(version):
+    """Chunks without a vector in the version's slot."""
+    return DocumentChunk.objects.filter(**{f'{version.columns.full}__isnull': True})
+
+
+def coverage(version):
+    """(chunks with a vector in the version's slot, all chunks)."""
+    total = DocumentChunk.objects.count()
+    return total - missing_vectors(version).count(), total
+
+
+def activate(version):
+    """
+    Switches queries to `version` and retires the active one, in one transaction.
+    Raises ValueError unless the version is live and every chunk has its vector.
+    """
+    with transaction.atomic():
+        # Blocks chunk writes (process_document, deletions) until the switch is committed
+        with connection.cursor() as cursor:
+            cursor.execute(f"LOCK TABLE {DocumentChunk._meta.db_table} IN SHARE MODE")
+        version = EmbeddingVersion.objects.select_for_update().get(pk=version.pk)
+        if version.state not in MIGRATING_STATES:
+            raise ValueError(f"{version} can't be activated.")
+        if not version.slot_prepared or missing_vectors(version).exists():
+            raise ValueError(f"{version} doesn't have a vector for every chunk yet.")
+        now = timezone.now()
+        EmbeddingVersion.objects.select_for_update().filter(state=EmbeddingVersion.State.ACTIVE).update(
+            state=EmbeddingVersion.State.RETIRED, retired_at=now, updated_at=now)
+        version.state = EmbeddingVersion.State.ACTIVE
+        version.activated_at = now
+        version.save(update_fields=['state', 'activated_at', 'updated_at'])
+        # FAQ entries are matched with embeddings of the new model
+        from .faq import queue_regeneration
+        queue_regeneration()
+    clear_version_cache()
+    logger.info(f"Activated embedding version {version}.")
+    return version
+
+
+def _chunk_batch(version, batch_size, after):
+    chunks = missing_vectors(version).order_by('id')
+    if after is not None:
+        chunks = chunks.filter(id__gt=after)
+    return list(chunks.values_list('id', 'text_content')[:batch_size])
+
+
+def _prepare_slot(version, batch_size, deadline):
+    """Clears the slot of a retired version's vectors, then creates its empty indexes."""
+    columns = version.columns
+    cleared = {columns.full: None, columns.half: None, columns.binary: None}
+    while True:
+        chunks = DocumentChunk.objects.exclude(**{f'{columns.full}__isnull': True}).order_by('id')
+        if version.cursor is not None:
+            chunks = chunks.filter(id__gt=version.cursor)
+        ids = list(chunks.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        DocumentChunk.objects.filter(id__in=ids).update(**cleared)
+        version.cursor = ids[-1]
+        version.save(update_fields=['cursor', 'updated_at'])
+        if deadline is not None and time.monotonic() > deadline:
+            return False
+    create_slot_indexes(version)
+    version.slot_prepared = True
+    version.cursor = None
+    version.save(update_fields=['slot_prepared', 'cursor', 'updated_at'])
+    return True
+
+
+def _backfill(version, time_budget, progress):
+    from .bulk_load import update_slot_vectors
+
+    started = time.monotonic()
+    deadline = started + time_budget if time_budget else None
+    batch_size = getattr(settings, 'KNOWLEDGE_REEMBED_BATCH_SIZE', 128)
+    max_rate = getattr(settings, 'KNOWLEDGE_REEMBED_MAX_ROWS_PER_SECOND', 100)
+
+    if not version.slot_prepared and not _prepare_slot(version, batch_size, deadline):
+        return True
+    backend = load_embedding_backend(version.backend, version.model_name)
+
+    embedded = 0
+    while True:
+        if deadline is not None and time.monotonic() > deadline:
+            return True
+        chunks = _chunk_batch(version, batch_size, version.cursor)
+        if not chunks:
+            if version.cursor is None:
+                break
+            # End of the pass: one more from the start, for the chunks created behind the cursor
+            version.cursor = None
+            continue
+        ids = [chunk_id for chunk_id, _ in chunks]
+        update_slot_vectors(version.slot, ids, backend.encode([text for _, text in chunks]))
+        embedded += len(ids)
+        version.cursor = ids[-1]
+        version.chunks_embedded += len(ids)
+        if max_rate:
+            # Throttled so the re-embedding doesn't starve the API of database and CPU time
+            time.sleep(max(0.0, started + embedded / max_rate - time.monotonic()))
+        version.rows_per_second = embedded / max(time.monotonic() - started, 1e-6)
+        # Progress is saved unless the migration was cancelled meanwhile
+        if not EmbeddingVersion.objects.filter(pk=version.pk, state__in=LIVE_STATES).update(
+                cursor=version.cursor, chunks_embedded=version.chunks_embedded,
+                rows_per_second=version.rows_per_second, updated_at=timezone.now()):
+            logger.info(f"Embedding version {version.pk} is no longer live, backfill stopped.")
+            return False
+        if progress is not None:
+            progress(version)
+
+    if version.state == EmbeddingVersion.State.BACKFILLING:
+        EmbeddingVersion.objects.filter(pk=version.pk, state=version.state).update(
+            state=EmbeddingVersion.State.READY, updated_at=timezone.now())
+        version.state = EmbeddingVersion.State.READY
+        logger.info(f"Embedding version {version.pk} has a vector for every chunk ({version.chunks_embedded} embedded).")
+    if version.state == EmbeddingVersion.State.READY and getattr(
+            settings, 'KNOWLEDGE_EMBEDDING_AUTO_ACTIVATE', True):
+        try:
+            activate(version)
+        except ValueError as e:
+            # Chunks were written without this version's vectors in the meantime
+            logger.info(f"Activation postponed: {e}")
+            return True
+    return False
+
+
+def backfill(version_id, time_budget=None, progress=None):
+    """
+    Embeds the chunks missing from the version's slot, for at most `time_budget`
+    seconds (no limit by default); `progress(version)` is called after each batch.
+    Also completes ACTIVE versions, whose chunks can miss vectors written around a switch.
+    Returns True when work remains. Only one backfill runs per version at a time.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s, %s)", [BACKFILL_LOCK_NAMESPACE, version_id])
+        if not cursor.fetchone()[0]:
+            logger.info(f"Embedding version {version_id} is already being backfilled.")
+            return False
+    try:
+        version = EmbeddingVersion.objects.filter(pk=version_id, state__in=LIVE_STATES).first()
+        if version is None:
+            return False
+        return _backfill(version, time_budget, progress)
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s, %s)", [BACKFILL_LOCK_NAMESPACE, version_id])
@@ -0,0 +1,346 @@
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+import prometheus_client
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+# Make sure the model name matches one compatible with sentence-transformers
+# and that its dimensions match DocumentChunk.EMBEDDING_DIMENSIONS
+# e.g., 'all-MiniLM-L6-v2' (384 dims), 'all-mpnet-base-v2' (768 dims)
+EMBEDDING_MODEL_NAME = getattr(settings, 'EMBEDDING_MODEL_NAME', 'all-MiniLM-L6-v2')
+# all-MiniLM-L6-v2 was trained with 256 word pieces; longer inputs are truncated
+MAX_SEQUENCE_LENGTH = 256
+
+# Prometheus metrics of the API-side QueryEncoder (served at /metrics)
+QUERY_CACHE_LOOKUPS = prometheus_client.Counter(
+    'ferfm_query_embedding_cache_lookups_total', 'Question embedding cache lookups.', ['result'])
+QUERY_BATCH_SIZE = prometheus_client.Histogram(
+    'ferfm_query_embedding_batch_size', 'Questions encoded per micro-batch.',
+    buckets=(1, 2, 4, 8, 16, 32, 64))
+
+ONNX_MODEL_FILENAME = 'model.onnx'
+ONNX_QUANTIZED_MODEL_FILENAME = 'model_int8.onnx'
+ONNX_TOKENIZER_FILENAME = 'tokenizer.json'
+
+
+class SentenceTransformerBackend:
+    """Full-precision PyTorch model through sentence-transformers (reference implementation)."""
+    name = 'torch'
+
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device='cpu')
+
+    def encode(self, texts, batch_size=32):
+        return self.model.encode(
+            texts, batch_size=batch_size, show_progress_bar=False, convert_to_numpy=True)
+
+    def count_tokens(self, texts):
+        """Word pieces of each text, without special tokens or truncation (used to size chunks)."""
+        encoded = self.model.tokenizer(list(texts), add_special_tokens=False, truncation=False, verbose=False)
+        return [len(ids) for ids in encoded['input_ids']]
+
+
+class OnnxBackend:
+    """
+    ONNX Runtime export of the same model (see the export_onnx_embedding_model command),
+    optionally int8-quantised. Reproduces the sentence-transformers pipeline of
+    all-MiniLM-L6-v2: mean pooling over the attention mask followed by L2 normalisation.
+    """
+    name = 'onnx'
+
+    def __init__(self, model_dir=None, quantized=None):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_dir = Path(model_dir or settings.KNOWLEDGE_ONNX_MODEL_DIR)
+        if quantized is None:
+            quantized = getattr(settings, 'KNOWLEDGE_ONNX_QUANTIZED', True)
+        model_path = model_dir / (ONNX_QUANTIZED_MODEL_FILENAME if quantized else ONNX_MODEL_FILENAME)
+
+        self.tokenizer = Tokenizer.from_file(str(model_dir / ONNX_TOKENIZER_FILENAME))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQUENCE_LENGTH)
+        self.tokenizer.enable_padding()
+        # Same vocabulary without truncation/padding, to measure texts
+        self.counting_tokenizer = Tokenizer.from_file(str(model_dir / ONNX_TOKENIZER_FILENAME))
+        self.counting_tokenizer.no_truncation()
+        self.counting_tokenizer.no_padding()
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(
+            str(model_path), options, providers=['CPUExecutionProvider'])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {'input_ids': input_ids, 'attention_mask': attention_mask}
+        if 'token_type_ids' in self.input_names:
+            feeds['token_type_ids'] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+    def count_tokens(self, texts):
+        """Word pieces of each text, without special tokens or truncation (used to size chunks)."""
+        return [len(encoding.ids) for encoding in
+                self.counting_tokenizer.encode_batch(list(texts), add_special_tokens=False)]
+
+    def encode(self, texts, batch_size=32):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        embeddings = np.concatenate([
+            self._encode_batch(texts[start:start + batch_size])
+            for start in range(0, len(texts), batch_size)
+        ])
+        return embeddings[0] if single else embeddings
+
+
+def binary_quantize(embedding):
+    """
+    Sign-bit quantisation of an embedding as a '0'/'1' string for DocumentChunk.embedding_binary.
+    Matches pgvector's binary_quantize(): a bit is set when the component is > 0.
+    """
+    bits = (np.asarray(embedding) > 0).astype(np.uint8) + ord('0')
+    return bits.tobytes().decode('ascii')
+
+
+class QueryEncoder:
+    """
+    Thread-safe question encoder for the API process.
+    - An LRU cache returns embeddings of recently asked questions without touching the model.
+    - Concurrent cache misses are micro-batched: a background thread waits up to
+      `max_wait_ms` after the first pending question for others (up to `max_batch_size`)
+      and encodes them in a single forward pass.
+    Micro-batching only helps when a worker serves requests concurrently (threaded workers).
+    A request waits at most `timeout` seconds for its batch; if the batcher thread dies,
+    the questions queued for it fail at once.
+    """
+
+    def __init__(self, backend, cache_size=None, max_batch_size=None, max_wait_ms=None, timeout=None):
+        self.backend = backend
+        self.cache_size = cache_size if cache_size is not None else getattr(
+            settings, 'KNOWLEDGE_QUERY_CACHE_SIZE', 1024)
+        self.max_batch_size = max_batch_size or getattr(settings, 'KNOWLEDGE_QUERY_BATCH_SIZE', 32)
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else getattr(
+            settings, 'KNOWLEDGE_QUERY_BATCH_WAIT_MS', 5)) / 1000
+        self.timeout = timeout if timeout is not None else getattr(
+            settings, 'KNOWLEDGE_QUERY_ENCODE_TIMEOUT_SECONDS', 30)
+
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._pending = queue.Queue()
+        self._worker = None
+        self._worker_pid = None
+        self._worker_lock = threading.Lock()
+
+        # Metrics
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.batch_sizes = Counter()  # batch size -> number of batches encoded with that size
+
+    @staticmethod
+    def _key(question):
+        return ' '.join(question.split())
+
+    def _cache_get(self, key):
+        with self._cache_lock:
+            embedding = self._cache.get(key)
+            if embedding is None:
+                self.cache_misses += 1
+                QUERY_CACHE_LOOKUPS.labels(result='miss').inc()
+                return None
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            QUERY_CACHE_LOOKUPS.labels(result='hit').inc()
+            return embedding
+
+    def _cache_put(self, key, embedding):
+        if not self.cache_size:
+            return
+        with self._cache_lock:
+            self._cache[key] = embedding
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _ensure_worker(self):
+        # Threads do not survive fork(): (re)start the batcher in each worker process
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or self._worker_pid != os.getpid() or not self._worker.is_alive():
+                # After a fork, the queue (and its lock) is the parent's. In the same process,
+                # questions queued since the previous batcher died go to the new one
+                if self._worker_pid != os.getpid():
+                    self._pending = queue.Queue()
+                self._worker = threading.Thread(target=self._run, name='query-encoder', daemon=True)
+                self._worker_pid = os.getpid()
+                self._worker.start()
+
+    def _collect_batch(self):
+        batch = [self._pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _encode_batch(self, batch):
+        # Identical questions within a batch are encoded once
+        texts = list(dict.fromkeys(key for key, _ in batch))
+        try:
+            embeddings = self.backend.encode(texts, batch_size=len(texts))
+            by_text = {}
+            for text, embedding in zip(texts, embeddings):
+                embedding.flags.writeable = False  # shared between requests and the cache
+                by_text[text] = embedding
+                self._cache_put(text, embedding)
+            for key, future in batch:
+                future.set_result(by_text[key])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batch_sizes[len(texts)] += 1
+        QUERY_BATCH_SIZE.observe(len(texts))
+        logger.debug(f"Encoded a micro-batch of {len(texts)} questions ({len(batch)} requests).")
+
+    def _run(self):
+        batch = []
+        try:
+            while True:
+                batch = self._collect_batch()
+                self._encode_batch(batch)
+                batch = []
+        finally:
+            # Only reached if the thread dies: its requests fail now instead of at their timeout
+            logger.error("The query encoder thread stopped; failing its pending questions.")
+            error = RuntimeError("The query encoder stopped.")
+            while True:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                try:
+                    batch = [self._pending.get_nowait()]
+                except queue.Empty:
+                    break
+
+    def encode(self, question):
+        """Returns the (normalised, read-only) embedding of a single question."""
+        key = self._key(question)
+        embedding = self._cache_get(key)
+        if embedding is not None:
+            return embedding
+        self._ensure_worker()
+        future = Future()
+        self._pending.put((key, future))
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise TimeoutError(f"The question wasn't encoded within {self.timeout}s.")
+
+    def stats(self):
+        """Snapshot of cache and batching metrics."""
+        batches = sum(self.batch_sizes.values())
+        encoded = sum(size * count for size, count in self.batch_sizes.items())
+        return {
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'cache_entries': len(self._cache),
+            'batches': batches,
+            'mean_batch_size': encoded / batches if batches else 0.0,
+            'max_batch_size': max(self.batch_sizes, default=0),
+            'batch_size_counts': dict(sorted(self.batch_sizes.items())),
+        }
+
+
+EMBEDDING_BACKENDS = {
+    SentenceTransformerBackend.name: SentenceTransformerBackend,
+    OnnxBackend.name: OnnxBackend,
+}
+
+
+def load_embedding_backend(name=None, model_name=None):
+    """
+    Instantiates the embedding backend selected by settings.KNOWLEDGE_EMBEDDING_BACKEND
+    ('torch' or 'onnx'). Both expose encode(texts, batch_size) returning normalised float32 arrays.
+    `model_name` defaults to EMBEDDING_MODEL_NAME; the ONNX export only exists for that model.
+    """
+    name = name or getattr(settings, 'KNOWLEDGE_EMBEDDING_BACKEND', SentenceTransformerBackend.name)
+    model_name = model_name or EMBEDDING_MODEL_NAME
+    try:
+        backend_class = EMBEDDING_BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown embedding backend: {name}")
+    logger.info(f"Loading '{name}' embedding backend for {model_name}")
+    if backend_class is OnnxBackend:
+        if model_name != EMBEDDING_MODEL_NAME:
+            raise ValueError(f"No ONNX export of {model_name}, only of {EMBEDDING_MODEL_NAME}.")
+        return backend_class()
+    return backend_class(model_name)
+
+
+# One QueryEncoder per (backend, model): while an embedding migration is being switched
+# over, a process may serve questions with both versions for a few seconds.
+_query_encoders = {}
+_query_encoder_lock = threading.Lock()
+
+
+def get_query_encoder(model_name=None, backend=None):
+    """
+    Returns the process-wide QueryEncoder of a model, loading it on first use.
+    Nothing heavy is imported until then, so management commands and worker boot stay fast.
+    Raises if the model cannot be loaded; the next call retries.
+    """
+    key = (backend or getattr(settings, 'KNOWLEDGE_EMBEDDING_BACKEND', SentenceTransformerBackend.name),
+           model_name or EMBEDDING_MODEL_NAME)
+    encoder = _query_encoders.get(key)
+    if encoder is None:
+        with _query_encoder_lock:
+            encoder = _query_encoders.get(key)
+            if encoder is None:
+                encoder = _query_encoders[key] = QueryEncoder(load_embedding_backend(*key))
+    return encoder
+
+
+def warm_up():
+    """
+    Explicit warm-up hook: loads the query embedding model of the active embedding version
+    (and the re-ranker when enabled) and runs one encode so the first request does not pay for it.
+    Called from core/wsgi.py when settings.KNOWLEDGE_WARM_UP_ON_BOOT is set, which with
+    preload_app is in the gunicorn master: the encode goes straight to the backend so that
+    no micro-batcher thread is started before the workers are forked.
+    """
+    from .embedding_versions import active_embedding_version
+
+    started = time.perf_counter()
+    version = active_embedding_version()
+    get_query_encoder(version.model_name, version.backend).backend.encode(["FER FM"], batch_size=1)
+    if getattr(settings, 'KNOWLEDGE_RERANK_ENABLED', False):
+        from .reranking import get_reranker
+        get_reranker()
+    logger.info(f"Knowledge base models warmed up in {time.perf_counter() - started:.1f}s.")
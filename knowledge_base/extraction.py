@@ -0,0 +1,525 @@
+"""
+Structured text extraction for the chunker (chunking.py).
+
+Instead of one flat string, extractors yield Segments in reading order: headings
+(with their level) and blocks of body text (paragraphs, list runs, table rows), each
+with the page it comes from when the format has pages. This keeps the document
+structure the flat extract_text_from_* functions (used by the previous 'recursive'
+chunker) throw away.
+
+Extractors are plugins registered with @register_extractor: PDF, DOCX, HTML, CSV,
+Markdown and plain text. The one used for a file is chosen by sniffing its content
+(magic bytes, markup), the file extension only telling text formats apart. They read
+a binary file object and are generators: text formats are decoded and parsed
+incrementally, without a copy of the whole decoded file or a parse tree. The segments
+themselves are collected in a list (extraction_cache.get_extraction), so a document's
+extracted text is held in memory once while it is processed.
+
+Extraction results are cached by file content, see extraction_cache.py.
+"""
+import codecs
+import csv
+import io
+import logging
+import os
+import re
+import zipfile
+from collections import namedtuple
+from contextlib import contextmanager
+from html.parser import HTMLParser
+from io import BytesIO
+from statistics import median
+
+HEADING = 'heading'
+PARAGRAPH = 'paragraph'
+TABLE = 'table'
+
+# `level` is the heading level (1 = top) for headings, None otherwise; `page` is 1-based or
+# None; `metadata` is a dict of format-specific details (the row of a CSV line) or None
+Segment = namedtuple('Segment', ['kind', 'text', 'level', 'page', 'metadata'], defaults=(None,))
+
+DOCX_HEADING_STYLE = re.compile(r'^(?:Heading|Titre)\s*(\d)$', re.IGNORECASE)
+# "1.", "2.3", "2.3.1 " ... at the start of a heading line
+NUMBERED_HEADING = re.compile(r'^(\d+(?:\.\d+)*)\.?\s+\S')
+SENTENCE_END = ('.', '!', '?', ':', ';', '»', '"')
+MAX_PDF_HEADING_CHARS = 80
+MARKDOWN_HEADING = re.compile(r'^(#{1,6})\s+(.+?)(?:\s+#+)?$')
+
+SNIFF_BYTES = 4096  # Read from the start of a file to tell its type
+READ_CHARS = 64 * 1024  # HTML is parsed by blocks of this many characters
+# Text without blank lines would otherwise make one huge paragraph
+MAX_PARAGRAPH_CHARS = 20_000
+
+logger = logging.getLogger(__name__)
+
+
+def extract_text_from_pdf(file_content):
+    """Extracts text from PDF file content (bytes)."""
+    try:
+        return ''.join(pdf_pages(BytesIO(file_content)))
+    except Exception as e:
+        logger.error(f"Error extracting text from PDF: {e}")
+        raise # Re-raise to mark task as failed
+
+
+def extract_text_from_docx(file_content):
+    """Extracts text from DOCX file content (bytes)."""
+    try:
+        return docx_text(BytesIO(file_content))
+    except Exception as e:
+        logger.error(f"Error extracting text from DOCX: {e}")
+        raise # Re-raise to mark task as failed
+
+
+def docx_text(stream):
+    import docx # python-docx
+    text = ""
+    for para in docx.Document(stream).paragraphs:
+        text += para.text + "\n"
+    return text
+
+
+def docx_segments(stream):
+    """Yields the body of a DOCX file: headings from the paragraph styles, paragraphs, list runs and tables."""
+    import docx
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    document = docx.Document(stream)
+    list_items = []
+    for element in document.element.body.iterchildren():
+        tag = element.tag.rsplit('}', 1)[-1]
+        if tag == 'p':
+            paragraph = Paragraph(element, document)
+            text = paragraph.text.strip()
+            style = paragraph.style.name if paragraph.style is not None else ''
+            if style.startswith('List') and text:
+                list_items.append(text)  # Consecutive list items are kept together
+                continue
+            if list_items:
+                yield Segment(PARAGRAPH, '\n'.join(list_items), None, None)
+                list_items = []
+            if not text:
+                continue
+            match = DOCX_HEADING_STYLE.match(style)
+            if style == 'Title':
+                yield Segment(HEADING, text, 1, None)
+            elif match:
+                yield Segment(HEADING, text, int(match.group(1)), None)
+            else:
+                yield Segment(PARAGRAPH, text, None, None)
+        elif tag == 'tbl':
+            if list_items:
+                yield Segment(PARAGRAPH, '\n'.join(list_items), None, None)
+                list_items = []
+            rows = []
+            for row in Table(element, document).rows:
+                # Merged cells are repeated by python-docx, keep each once
+                cells = list(dict.fromkeys(cell.text.strip() for cell in row.cells))
+                if any(cells):
+                    rows.append(' | '.join(cells))
+            if rows:
+                yield Segment(TABLE, '\n'.join(rows), None, None)
+    if list_items:
+        yield Segment(PARAGRAPH, '\n'.join(list_items), None, None)
+
+
+def pdf_heading_level(line):
+    """Heading level of a PDF text line, or None for body text (PDFs carry no styles, so this is a heuristic)."""
+    if len(line) > MAX_PDF_HEADING_CHARS or line.endswith(SENTENCE_END) or line.endswith(','):
+        return None
+    match = NUMBERED_HEADING.match(line)
+    if match:
+        return match.group(1).count('.') + 1
+    letters = [char for char in line if char.isalpha()]
+    if len(letters) >= 3 and all(char.isupper() for char in letters):
+        return 1
+    return None
+
+
+def pdf_page_segments(text, page):
+    """Splits the text of one PDF page into headings and paragraphs."""
+    lines = [line.strip() for line in text.splitlines()]
+    widths = [len(line) for line in lines if line]
+    if not widths:
+        return
+    full_width = median(widths)
+    paragraph = []
+    for index, line in enumerate(lines):
+        if not line:
+            if paragraph:
+                yield Segment(PARAGRAPH, ' '.join(paragraph), None, page)
+                paragraph = []
+            continue
+        level = pdf_heading_level(line)
+        if level is not None and len(line) < full_width * 0.8:
+            if paragraph:
+                yield Segment(PARAGRAPH, ' '.join(paragraph), None, page)
+                paragraph = []
+            yield Segment(HEADING, line, level, page)
+            continue
+        paragraph.append(line)
+        # A short line ending a sentence is the last line of its paragraph
+        if line.endswith(SENTENCE_END) and len(line) < full_width * 0.8:
+            yield Segment(PARAGRAPH, ' '.join(paragraph), None, page)
+            paragraph = []
+    if paragraph:
+        yield Segment(PARAGRAPH, ' '.join(paragraph), None, page)
+
+
+def pdf_pages(stream):
+    """Raw text of each page of a PDF file (the slow part: pypdf parses every content stream)."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(stream)
+    return [page.extract_text() or '' for page in reader.pages]
+
+
+def pdf_pages_segments(pages):
+    """Headings and paragraphs of already extracted PDF pages."""
+    for page_number, text in enumerate(pages, start=1):
+        yield from pdf_page_segments(text, page_number)
+
+
+def pdf_segments(stream):
+    """Yields the headings and paragraphs of a PDF file, page by page."""
+    yield from pdf_pages_segments(pdf_pages(stream))
+
+
+# --- Text formats ---
+
+@contextmanager
+def open_text(stream):
+    """Decodes a binary stream incrementally: UTF-8 (BOM or not), or Windows-1252 when it isn't."""
+    head = stream.read(SNIFF_BYTES)
+    stream.seek(0)
+    encoding = 'utf-8-sig'
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+    except UnicodeDecodeError:
+        encoding = 'cp1252'
+    text = io.TextIOWrapper(stream, encoding=encoding, errors='replace', newline='')
+    try:
+        yield text
+    finally:
+        text.detach()  # The caller still owns the binary stream
+
+
+def line_segments(stream, markdown=False):
+    """Paragraphs separated by blank lines and, for Markdown, ATX headings ("## Title")."""
+    paragraph = []
+    size = 0
+    in_code = False
+    with open_text(stream) as text:
+        for line in text:
+            line = line.strip()
+            if markdown and line.startswith('```'):
+                in_code = not in_code
+            match = MARKDOWN_HEADING.match(line) if markdown and not in_code else None
+            if paragraph and (match or not line or size > MAX_PARAGRAPH_CHARS):
+                yield Segment(PARAGRAPH, '\n'.join(paragraph), None, None)
+                paragraph = []
+                size = 0
+            if match:
+                yield Segment(HEADING, match.group(2), len(match.group(1)), None)
+            elif line:
+                paragraph.append(line)
+                size += len(line)
+    if paragraph:
+        yield Segment(PARAGRAPH, '\n'.join(paragraph), None, None)
+
+
+def normalize_whitespace(text):
+    lines = (' '.join(line.split()) for line in text.split('\n'))
+    return '\n'.join(line for line in lines if line)
+
+
+class HTMLSegmentParser(HTMLParser):
+    """Turns HTML fed by blocks into Segments: h1-h6 headings, text blocks and tables."""
+    SKIPPED_TAGS = {'head', 'script', 'style', 'noscript', 'template', 'svg', 'nav', 'footer'}
+    BLOCK_TAGS = {
+        'p', 'div', 'section', 'article', 'main', 'aside', 'header', 'blockquote', 'pre', 'ul', 'ol',
+        'dl', 'figure', 'figcaption', 'address', 'form', 'hr',
+    }
+    LINE_TAGS = {'br', 'li', 'dt', 'dd'}  # Start a new line of the current block (list items stay together)
+    HEADING_TAGS = {'h1': 1, 'h2': 2, 'h3': 3, 'h4': 4, 'h5': 5, 'h6': 6}
+    ROWS_PER_SEGMENT = 50  # Long tables are emitted by parts
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.segments = []  # Parsed but not yet yielded
+        self.text = []
+        self.size = 0
+        self.skipping = 0
+        self.heading_level = None
+        self.rows = None  # Rows of the current table, None outside tables
+        self.cells = []
+
+    def pop_segments(self):
+        segments, self.segments = self.segments, []
+        return segments
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED_TAGS:
+            self.skipping += 1
+        elif self.skipping:
+            return
+        elif tag in self.LINE_TAGS:
+            self.text.append('\n')
+        elif tag == 'table':
+            self.flush()
+            self.rows = []
+        elif self.rows is not None:
+            if tag in ('td', 'th', 'tr'):
+                self.end_cell()
+        elif tag in self.HEADING_TAGS:
+            self.flush()
+            self.heading_level = self.HEADING_TAGS[tag]
+        elif tag in self.BLOCK_TAGS:
+            self.flush()
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED_TAGS:
+            self.skipping = max(self.skipping - 1, 0)
+        elif self.skipping:
+            return
+        elif tag == 'table' and self.rows is not None:
+            self.end_row()
+            self.flush_rows()
+            self.rows = None
+        elif self.rows is not None:
+            if tag in ('td', 'th'):
+                self.end_cell()
+            elif tag == 'tr':
+                self.end_row()
+        elif tag in self.HEADING_TAGS or tag in self.BLOCK_TAGS:
+            self.flush()
+
+    def handle_data(self, data):
+        if self.skipping:
+            return
+        self.text.append(data)
+        self.size += len(data)
+        if self.rows is None and self.heading_level is None and self.size > MAX_PARAGRAPH_CHARS:
+            self.flush()
+
+    def flush(self):
+        text = normalize_whitespace(''.join(self.text))
+        self.text = []
+        self.size = 0
+        if text:
+            kind = HEADING if self.heading_level else PARAGRAPH
+            self.segments.append(Segment(kind, text, self.heading_level, None))
+        self.heading_level = None
+
+    def end_cell(self):
+        cell = normalize_whitespace(''.join(self.text)).replace('\n', ' ')
+        self.text = []
+        self.size = 0
+        if cell:
+            self.cells.append(cell)
+
+    def end_row(self):
+        self.end_cell()
+        if self.cells:
+            self.rows.append(' | '.join(self.cells))
+            self.cells = []
+        if len(self.rows) >= self.ROWS_PER_SEGMENT:
+            self.flush_rows()
+
+    def flush_rows(self):
+        if self.rows:
+            self.segments.append(Segment(TABLE, '\n'.join(self.rows), None, None))
+        self.rows = []
+
+    def close(self):
+        super().close()
+        if self.rows is not None:
+            self.end_row()
+            self.flush_rows()
+            self.rows = None
+        self.flush()
+
+
+def html_segments(stream):
+    parser = HTMLSegmentParser()
+    with open_text(stream) as text:
+        for block in iter(lambda: text.read(READ_CHARS), ''):
+            parser.feed(block)
+            yield from parser.pop_segments()
+    parser.close()
+    yield from parser.pop_segments()
+
+
+def csv_segments(stream):
+    """
+    One TABLE segment per row, rendered with its column names ("Jour: Lundi | Heure: 06:00
+    | Émission: ...") so each row still reads on its own. The first row is the header.
+    """
+    with open_text(stream) as text:
+        sample = text.read(SNIFF_BYTES)
+        text.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t|')
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(text, dialect)
+        header = [name.strip() for name in next(reader, [])]
+        for row_number, row in enumerate(reader, start=1):
+            fields = [
+                f"{name}: {value.strip()}" if name else value.strip()
+                for name, value in zip(header + [''] * (len(row) - len(header)), row)
+                if value.strip()
+            ]
+            if fields:
+                yield Segment(TABLE, ' | '.join(fields), None, None, {'row': row_number})
+
+
+# --- Extractor registry ---
+
+EXTRACTORS = {}
+
+
+def register_extractor(cls):
+    """Class decorator adding an extractor plugin to the registry (replacing any of the same kind)."""
+    EXTRACTORS[cls.kind] = cls()
+    return cls
+
+
+class Extractor:
+    """
+    Base class of extractor plugins. detect_extractor() tries sniff() of every registered
+    extractor in registration order, then, for text content, picks the textual extractor
+    handling the file extension (plain text otherwise).
+    """
+    kind = None
+    mime_type = None
+    extensions = ()
+    textual = True  # Decoded text, told apart by extension when sniff() doesn't recognise it
+
+    def sniff(self, head, stream):
+        """Whether a file whose first SNIFF_BYTES bytes are `head` is of this format."""
+        return False
+
+    def segments(self, stream):
+        """Yields the Segments of a binary file object."""
+        raise NotImplementedError
+
+    def extract(self, stream):
+        """(pages, segments): raw text of each page for formats with pages ([] otherwise) and the Segments."""
+        return [], self.segments(stream)
+
+
+@register_extractor
+class PdfExtractor(Extractor):
+    kind = 'pdf'
+    mime_type = 'application/pdf'
+    extensions = ('.pdf',)
+    textual = False
+
+    def sniff(self, head, stream):
+        return b'%PDF-' in head[:1024]
+
+    def segments(self, stream):
+        return pdf_segments(stream)
+
+    def extract(self, stream):
+        pages = pdf_pages(stream)
+        # PDF segments only depend on the page texts, pypdf runs once
+        return pages, pdf_pages_segments(pages)
+
+
+@register_extractor
+class DocxExtractor(Extractor):
+    kind = 'docx'
+    mime_type = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+    extensions = ('.docx',)
+    textual = False
+
+    def sniff(self, head, stream):
+        if not head.startswith(b'PK\x03\x04'):
+            return False
+        try:
+            with zipfile.ZipFile(stream) as archive:
+                return 'word/document.xml' in archive.namelist()
+        except zipfile.BadZipFile:
+            return False
+        finally:
+            stream.seek(0)
+
+    def segments(self, stream):
+        return docx_segments(stream)
+
+    def extract(self, stream):
+        pages = [docx_text(stream)]
+        stream.seek(0)
+        return pages, self.segments(stream)
+
+
+HTML_START = re.compile(
+    rb'^\s*(?:<\?xml[^>]*>\s*)?(?:<!--.*?-->\s*)*<(?:!doctype\s+html|html|head|body)\b', re.IGNORECASE | re.DOTALL)
+
+
+@register_extractor
+class HtmlExtractor(Extractor):
+    kind = 'html'
+    mime_type = 'text/html'
+    extensions = ('.html', '.htm')
+
+    def sniff(self, head, stream):
+        return bool(HTML_START.match(head.removeprefix(codecs.BOM_UTF8)))
+
+    def segments(self, stream):
+        return html_segments(stream)
+
+
+@register_extractor
+class CsvExtractor(Extractor):
+    kind = 'csv'
+    mime_type = 'text/csv'
+    extensions = ('.csv', '.tsv')
+
+    def segments(self, stream):
+        return csv_segments(stream)
+
+
+@register_extractor
+class MarkdownExtractor(Extractor):
+    kind = 'markdown'
+    mime_type = 'text/markdown'
+    extensions = ('.md', '.markdown')
+
+    def segments(self, stream):
+        return line_segments(stream, markdown=True)
+
+
+@register_extractor
+class TextExtractor(Extractor):
+    kind = 'text'
+    mime_type = 'text/plain'
+    extensions = ('.txt',)
+
+    def segments(self, stream):
+        return line_segments(stream)
+
+
+def detect_extractor(stream, filename):
+    """The registered extractor for a binary file object, from its content and then its name."""
+    head = stream.read(SNIFF_BYTES)
+    stream.seek(0)
+    for extractor in EXTRACTORS.values():
+        if extractor.sniff(head, stream):
+            return extractor
+    extension = os.path.splitext(filename.lower())[1]
+    by_extension = next((extractor for extractor in EXTRACTORS.values() if extension in extractor.extensions), None)
+    if by_extension is not None and not by_extension.textual:
+        raise ValueError(f"{filename} is not a valid {by_extension.kind.upper()} file.")
+    if b'\x00' in head:
+        raise ValueError(f"Unsupported file type: {filename}")
+    return by_extension or EXTRACTORS[TextExtractor.kind]
+
+
+def extract_segments(file, filename):
+    """Segments of a document (bytes or binary file object)."""
+    stream = BytesIO(file) if isinstance(file, bytes) else file
+    return detect_extractor(stream, filename).segments(stream)
@@ -0,0 +1,133 @@
+"""
+Content-addressed cache of extracted documents (ExtractedContent rows).
+
+Parsing a PDF with pypdf is the slowest step of processing a document after
+embedding, and its result only depends on the file bytes and the extractor reading
+them. Entries are keyed by the SHA-256 of both, so reprocessing a document,
+re-uploading the same file under another name or changing the chunking parameters
+reuses them, while the same text uploaded as .csv and as .txt (told apart by extension,
+see extraction.detect_extractor) gets each its own segmentation. Each entry holds the
+raw text of every page (what the 'recursive' chunker reads) and the Segments the
+structured chunker reads.
+
+The cache is bounded by settings.KNOWLEDGE_EXTRACTION_CACHE_MAX_MB: after each store,
+least recently used entries are deleted until it fits again (0 disables the cache).
+Warm it for every uploaded document with: python manage.py warm_extraction_cache
+"""
+import hashlib
+import json
+import logging
+from collections import namedtuple
+from io import BytesIO
+
+from django.conf import settings
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .extraction import Segment, detect_extractor
+from .models import ExtractedContent
+
+logger = logging.getLogger(__name__)
+
+# Bump when extraction.py changes what it produces: entries of other versions are misses
+EXTRACTION_VERSION = 2
+
+HASH_BLOCK_BYTES = 1024 * 1024
+
+
+class Extraction(namedtuple('Extraction', ['pages', 'segments', 'cached'])):
+    @property
+    def text(self):
+        """
+        The flat text the extract_text_from_* functions return for PDF/DOCX, the
+        segments separated by blank lines for formats without pages.
+        """
+        if self.pages:
+            return ''.join(self.pages)
+        return '\n\n'.join(segment.text for segment in self.segments)
+
+
+def content_hash(stream, kind):
+    """SHA-256 of the `kind` of extractor reading a binary file object and of its content, read by blocks."""
+    digest = hashlib.sha256(f"{kind}\0".encode())
+    for block in iter(lambda: stream.read(HASH_BLOCK_BYTES), b''):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def extract(stream, extractor):
+    """(pages, segments) of a file, without the cache. The segments are collected: the file is closed before chunking."""
+    pages, segments = extractor.extract(stream)
+    return pages, list(segments)
+
+
+def encoded_size(value, limit):
+    """Size of `value` as stored in a JSONField, counted without building the string, up to just over `limit`."""
+    size = 0
+    for part in json.JSONEncoder(ensure_ascii=False).iterencode(value):
+        size += len(part.encode())
+        if size > limit:
+            break
+    return size
+
+
+def max_cache_bytes():
+    return int(getattr(settings, 'KNOWLEDGE_EXTRACTION_CACHE_MAX_MB', 256) * 1024 * 1024)
+
+
+def get_extraction(file, filename):
+    """
+    Extraction of a file (bytes or seekable binary file object), from the cache when the
+    same content was extracted before. Raises ValueError for unsupported content.
+    """
+    stream = BytesIO(file) if isinstance(file, bytes) else file
+    extractor = detect_extractor(stream, filename)
+    max_bytes = max_cache_bytes()
+    if max_bytes <= 0:
+        return Extraction(*extract(stream, extractor), cached=False)
+
+    key = content_hash(stream, extractor.kind)
+    entry = ExtractedContent.objects.filter(content_hash=key, version=EXTRACTION_VERSION).first()
+    if entry is not None:
+        ExtractedContent.objects.filter(content_hash=key).update(
+            hits=F('hits') + 1, last_used_at=timezone.now())
+        return Extraction(entry.pages, [Segment(*segment) for segment in entry.segments], cached=True)
+
+    pages, segments = extract(stream, extractor)
+    size = encoded_size([pages, segments], max_bytes)
+    if size <= max_bytes:
+        # Upsert: two workers extracting the same file at once both succeed
+        ExtractedContent.objects.bulk_create(
+            [ExtractedContent(content_hash=key, version=EXTRACTION_VERSION, file_type=extractor.kind,
+                              pages=pages, segments=segments, size_bytes=size, last_used_at=timezone.now())],
+            update_conflicts=True,
+            unique_fields=['content_hash'],
+            update_fields=['version', 'file_type', 'pages', 'segments', 'size_bytes', 'last_used_at'],
+        )
+        evict(max_bytes)
+    else:
+        logger.info(f"Extraction of {filename} is larger than the whole cache ({max_bytes} bytes), not cached.")
+    return Extraction(pages, segments, cached=False)
+
+
+def cache_size():
+    return ExtractedContent.objects.aggregate(total=Sum('size_bytes'))['total'] or 0
+
+
+def evict(max_bytes=None):
+    """Deletes least recently used entries until the cache fits in max_bytes. Returns the number deleted."""
+    max_bytes = max_cache_bytes() if max_bytes is None else max_bytes
+    total = cache_size()
+    if total <= max_bytes:
+        return 0
+    evicted = []
+    entries = ExtractedContent.objects.order_by('last_used_at').values_list('content_hash', 'size_bytes')
+    for key, size in entries.iterator():
+        if total <= max_bytes:
+            break
+        evicted.append(key)
+        total -= size
+    ExtractedContent.objects.filter(content_hash__in=evicted).delete()
+    logger.info(f"Evicted {len(evicted)} extraction cache entries.")
+    return len(evicted)
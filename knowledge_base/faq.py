@@ -0,0 +1,315 @@
+"""
+Precomputed answers to the frequent questions (FaqEntry).
+
+Most questions are about a few subjects: the frequency in a city, the programme
+schedule, how to reach the station. Their canonical questions are FaqEntry rows, added
+in the admin or mined from the first questions of conversations (python manage.py faq
+mine). regenerate_answers() answers them offline with the query pipeline (retrieval,
+then Gemini) whenever the knowledge base or the embedding model changes:
+process_document, document deletions and embedding version switches queue the
+regenerate_faq_answers task.
+
+The query view embeds the question as usual, then looks it up in an in-memory index of
+the current answers: the normalised embeddings of the entries as one numpy matrix,
+reloaded when the knowledge base or the entries change (checked every
+settings.KNOWLEDGE_FAQ_REFRESH_SECONDS). A first question without filters whose cosine
+similarity to an entry reaches settings.KNOWLEDGE_FAQ_MATCH_THRESHOLD gets that entry's
+answer, without retrieval or Gemini. Answers are only served while the knowledge base
+they were generated from is current.
+
+Similarity alone doesn't tell "fréquence à Abidjan" from "fréquence à Bouaké": the
+entities of the entry and of the question (capitalised words after the first one and
+numbers, plus the words capitalised in any entry, so that "bouaké" counts too) must
+appear in the other one. A question failing this check tries the next closest entries.
+"""
+import logging
+import re
+import threading
+import unicodedata
+import time
+from collections import Counter
+from datetime import timedelta
+
+import numpy as np
+import prometheus_client
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+from django_q.tasks import async_task
+
+from .coalescing import knowledge_base_version, normalize_question
+from .embedding_versions import active_embedding_version
+from .embeddings import get_query_encoder
+from .models import ConversationTurn, FaqEntry
+
+logger = logging.getLogger(__name__)
+
+# Key of the advisory lock taken by regenerate_answers()
+REGENERATE_LOCK_KEY = 0x46415131  # 'FAQ1'
+# Distinct questions considered by mine_questions(), most asked first
+MINED_CANDIDATES = 2000
+WORD_PATTERN = re.compile(r"\w+")
+
+FAQ_LOOKUPS = prometheus_client.Counter('ferfm_faq_lookups_total', 'FAQ answer lookups.', ['result'])
+
+_lock = threading.Lock()
+_index = None
+_next_check = 0.0
+
+
+def match_threshold():
+    return getattr(settings, 'KNOWLEDGE_FAQ_MATCH_THRESHOLD', 0.9)
+
+
+def _normalise(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.clip(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12, None)
+
+
+def _fold(word):
+    """Lowercase, without accents or plural mark: "Bouaké" and "bouake" are the same term."""
+    word = unicodedata.normalize('NFKD', word.casefold())
+    word = ''.join(char for char in word if not unicodedata.combining(char))
+    return word[:-1] if len(word) > 3 and word[-1] in 'sx' else word
+
+
+def terms(text):
+    return {_fold(word) for word in WORD_PATTERN.findall(text)}
+
+
+def entities(text):
+    """Folded words naming something: capitalised ones but the first, and numbers."""
+    words = WORD_PATTERN.findall(text)
+    return {_fold(word) for position, word in enumerate(words)
+            if any(char.isdigit() for char in word) or (position and word[0].isupper())}
+
+
+class FaqIndex:
+    """The current answers and their question embeddings, for one knowledge base and model."""
+
+    def __init__(self, stamp, model_name, questions, answers, embeddings):
+        self.stamp = stamp
+        self.model_name = model_name
+        self.questions = questions
+        self.answers = answers
+        self.embeddings = _normalise(embeddings)
+        self.terms = [terms(question) for question in questions]
+        self.entities = [entities(question) for question in questions]
+        self.known_entities = set().union(*self.entities)
+
+    def __len__(self):
+        return len(self.answers)
+
+    def same_subject(self, position, question):
+        """Whether the entry and the question name the same entities (cities, programmes, numbers)."""
+        question_terms = terms(question)
+        question_entities = entities(question) | (question_terms & self.known_entities)
+        return self.entities[position] <= question_terms and question_entities <= self.terms[position]
+
+    def match(self, question, question_embedding, threshold):
+        """
+        (position, similarity) of the closest entry about the same entities as `question`,
+        or None if none reaches `threshold`.
+        """
+        if not len(self):
+            return None
+        scores = self.embeddings @ _normalise(question_embedding)
+        for position in np.argsort(-scores, kind='stable'):
+            if scores[position] < threshold:
+                return None
+            if self.same_subject(position, question):
+                return int(position), float(scores[position])
+            logger.debug(f"FAQ entry \"{self.questions[position]}\" is close to \"{question}\" "
+                         f"but about something else.")
+        return None
+
+
+def _entries_stamp(kb_version, version):
+    entries = FaqEntry.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+    updated = entries['updated'].isoformat() if entries['updated'] else ''
+    return f"{kb_version}|{version.model_name}|{entries['count']}|{updated}"
+
+
+def load_index(stamp, kb_version, version):
+    rows = (
+        FaqEntry.objects.filter(enabled=True, knowledge_base_version=kb_version, embedding_model=version.model_name)
+        .exclude(answer='')
+        .values_list('question', 'answer', 'embedding')
+    )
+    questions, answers, embeddings = [], [], []
+    for question, answer, embedding in rows:
+        if embedding is None or len(embedding) != version.dimensions:
+            continue
+        questions.append(question)
+        answers.append(answer)
+        embeddings.append(embedding)
+    return FaqIndex(stamp, version.model_name, questions, answers,
+                    np.array(embeddings, dtype=np.float32).reshape(len(embeddings), version.dimensions))
+
+
+def current_index(version=None):
+    """
+    The index of the current answers, reloaded when the knowledge base or the entries
+    changed, or when it holds another model's embeddings than `version`'s.
+    """
+    global _index, _next_check
+    with _lock:
+        now = time.monotonic()
+        version = version or active_embedding_version()
+        # After a model switch, the question is embedded by the new model before this cache expires
+        if _index is not None and now < _next_check and _index.model_name == version.model_name:
+            return _index
+        kb_version = knowledge_base_version()
+        stamp = _entries_stamp(kb_version, version)
+        if _index is None or _index.stamp != stamp:
+            _index = load_index(stamp, kb_version, version)
+        _next_check = now + getattr(settings, 'KNOWLEDGE_FAQ_REFRESH_SECONDS', 5)
+        return _index
+
+
+def clear_index_cache():
+    global _index
+    with _lock:
+        _index = None
+
+
+def match_faq(question, question_embedding, version=None):
+    """The precomputed answer of the entry closest to the question, or None if none is close enough."""
+    index = current_index(version)
+    match = index.match(question, question_embedding, match_threshold())
+    FAQ_LOOKUPS.labels(result='miss' if match is None else 'hit').inc()
+    if match is None:
+        return None
+    position, similarity = match
+    logger.info(f"Answered from the FAQ entry \"{index.questions[position]}\" (similarity {similarity:.3f}).")
+    return index.answers[position]
+
+
+def stale_entries(kb_version, version):
+    """Enabled entries whose answer predates the knowledge base or the embedding model."""
+    return FaqEntry.objects.filter(enabled=True).exclude(
+        knowledge_base_version=kb_version, embedding_model=version.model_name)
+
+
+def _enqueue_regeneration():
+    async_task('knowledge_base.tasks.regenerate_faq_answers')
+
+
+def queue_regeneration():
+    """Queues the regenerate_faq_answers task once the current transaction commits, if there are entries."""
+    # Once per transaction, however many documents it deletes
+    if any(callback[1] is _enqueue_regeneration for callback in connection.run_on_commit):
+        return
+    if FaqEntry.objects.filter(enabled=True).exists():
+        transaction.on_commit(_enqueue_regeneration)
+
+
+def _answer(entry, version):
+    # Imported here: the view module imports this one
+    from services.gemini_service import generate_answer
+    from .views import retrieve_snippets
+
+    embedding = get_query_encoder(version.model_name, version.backend).encode(entry.question)
+    snippets = retrieve_snippets(entry.question, embedding, version=version)
+    # No extract of the snippets in place of an answer: the entry stays stale instead
+    return embedding, generate_answer(entry.question, snippets, extractive_fallback=False)
+
+
+def _regenerate(time_budget, progress):
+    deadline = time.monotonic() + time_budget if time_budget else None
+    failed = set()
+    while True:
+        version = active_embedding_version()
+        kb_version = knowledge_base_version()
+        entries = list(stale_entries(kb_version, version).exclude(pk__in=failed))
+        if not entries:
+            return False
+        for entry in entries:
+            if deadline is not None and time.monotonic() > deadline:
+                return True
+            embedding, answer = _answer(entry, version)
+            if not answer:
+                logger.warning(f"No answer generated for the FAQ entry \"{entry.question}\", it is not served.")
+                failed.add(entry.pk)
+                continue
+            # update(): an admin toggling `enabled` meanwhile isn't overwritten
+            now = timezone.now()
+            FaqEntry.objects.filter(pk=entry.pk, question=entry.question).update(
+                answer=answer, embedding=np.asarray(embedding).tolist(), embedding_model=version.model_name,
+                knowledge_base_version=kb_version, generated_at=now, updated_at=now)
+            if progress is not None:
+                progress(entry)
+        # The knowledge base may have changed during the run: loop until every entry is current
+
+
+def regenerate_answers(time_budget=None, progress=None):
+    """
+    Answers again the enabled entries answered from an older knowledge base or with
+    another embedding model. Returns True when entries remain after `time_budget`
+    seconds. One run at a time: a run started meanwhile returns at once, as the
+    running one picks up the changes. `progress` is called with each entry answered.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", [REGENERATE_LOCK_KEY])
+        if not cursor.fetchone()[0]:
+            logger.info("FAQ answers are already being regenerated.")
+            return False
+    try:
+        return _regenerate(time_budget, progress)
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", [REGENERATE_LOCK_KEY])
+
+
+def mine_questions(days=30, min_count=5, limit=20, threshold=None):
+    """
+    Groups the first questions of the conversations of the last `days` by embedding
+    similarity (`threshold`, default settings.KNOWLEDGE_FAQ_MATCH_THRESHOLD) and
+    records the most asked phrasing of each group asked at least `min_count` times, and
+    not already covered by an entry, as a MINED entry. Returns the new entries, at most
+    `limit`, most asked first; their answers are generated by regenerate_answers().
+    """
+    threshold = match_threshold() if threshold is None else threshold
+    since = timezone.now() - timedelta(days=days)
+    counts, phrasings = Counter(), {}
+    questions = ConversationTurn.objects.filter(position=1, created_at__gte=since).values_list('question', flat=True)
+    for question in questions.iterator():
+        key = normalize_question(question)
+        counts[key] += 1
+        phrasings.setdefault(key, question.strip())
+    candidates = counts.most_common(MINED_CANDIDATES)
+    if not candidates:
+        return []
+
+    version = active_embedding_version()
+    backend = get_query_encoder(version.model_name, version.backend).backend
+    embeddings = _normalise(backend.encode([phrasings[key] for key, _ in candidates]))
+    existing = list(FaqEntry.objects.values_list('question', flat=True))
+    covered = _normalise(backend.encode(existing)) if existing else np.empty((0, embeddings.shape[1]), np.float32)
+
+    # Greedy clustering, most asked first: a question joins the first group whose
+    # leading (most asked) phrasing is similar enough
+    leaders, totals = [], []
+    for row, (_, count) in enumerate(candidates):
+        if leaders:
+            scores = embeddings[leaders] @ embeddings[row]
+            best = int(np.argmax(scores))
+            if scores[best] >= threshold:
+                totals[best] += count
+                continue
+        leaders.append(row)
+        totals.append(count)
+
+    groups = sorted(zip(totals, leaders), reverse=True)
+    created = []
+    for total, row in groups:
+        if total < min_count or len(created) >= limit:
+            break
+        if len(covered) and float(np.max(covered @ embeddings[row])) >= threshold:
+            continue
+        created.append(FaqEntry.objects.create(
+            question=phrasings[candidates[row][0]], source=FaqEntry.Source.MINED, asked=total))
+        covered = np.vstack([covered, embeddings[row]])
+    logger.info(f"Mined {len(created)} FAQ questions from {sum(counts.values())} questions of the last {days} days.")
+    return created
@@ -0,0 +1,59 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.benchmarks.fixtures import make_document, random_unit_vectors, sentence
+from knowledge_base.bulk_load import copy_chunks, create_chunks
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    """
+    Inserts the same synthetic chunks (random unit embeddings, ~40-word texts) with
+    bulk_create() and with binary COPY, and reports rows/s for each. Every run happens
+    in a transaction that is rolled back, so the database is left unchanged.
+    By default chunks are searchable, so the times include maintaining the partial HNSW
+    indexes as process_document does; --unindexed inserts unsearchable chunks, which
+    the indexes skip, to compare the transfer and parsing cost alone.
+    """
+    help = 'Benchmarks inserting document chunks with bulk_create() against binary COPY.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per path, the best is reported.')
+        parser.add_argument('--unindexed', action='store_true')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def timed_load(self, load, texts, embeddings, metadata, searchable):
+        try:
+            with transaction.atomic():
+                document = make_document('benchmark_chunk_load.pdf')
+                started = time.perf_counter()
+                load(document, texts, embeddings, metadata, is_searchable=searchable)
+                elapsed = time.perf_counter() - started
+                raise Rollback
+        except Rollback:
+            return elapsed
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        rows = options['rows']
+        texts = [sentence(rng, 40) for _ in range(rows)]
+        embeddings = random_unit_vectors(rng, rows)
+        metadata = [{'chunk_index': index, 'pages': [index // 4 + 1]} for index in range(rows)]
+        searchable = not options['unindexed']
+
+        self.stdout.write(f"{rows} chunks, {'unindexed' if options['unindexed'] else 'indexed'}")
+        self.stdout.write(f"{'path':<14}{'best s':>9}{'rows/s':>10}")
+        results = {}
+        for name, load in (('bulk_create', create_chunks), ('binary COPY', copy_chunks)):
+            best = min(self.timed_load(load, texts, embeddings, metadata, searchable)
+                       for _ in range(options['repeat']))
+            results[name] = best
+            self.stdout.write(f"{name:<14}{best:>9.3f}{rows / best:>10.0f}")
+        self.stdout.write(f"speed-up: {results['bulk_create'] / results['binary COPY']:.1f}x")
@@ -0,0 +1,48 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from knowledge_base.embeddings import EMBEDDING_BACKENDS, load_embedding_backend
+
+SAMPLE_SENTENCES = [
+    "Quelle est la fréquence de FER FM à Singrobo ?",
+    "À quelle heure commence Autoroute Matin ?",
+    "FER FM informe, sensibilise et divertit les usagers de la route.",
+    "Info trafic : ralentissements sur l'autoroute du nord à hauteur de Tiébissou.",
+]
+
+
+class Command(BaseCommand):
+    """Compares embedding backends: single-query latency (API path) and batch throughput (ingestion path)."""
+    help = 'Benchmarks single-query latency and batch throughput of the embedding backends.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backends', nargs='+', default=list(EMBEDDING_BACKENDS), choices=EMBEDDING_BACKENDS)
+        parser.add_argument('--queries', type=int, default=200, help='Single-query encodes to time.')
+        parser.add_argument('--batch-size', type=int, default=32)
+        parser.add_argument('--batch-texts', type=int, default=1024, help='Texts encoded for the throughput run.')
+
+    def handle(self, *args, **options):
+        batch_texts = (SAMPLE_SENTENCES * (options['batch_texts'] // len(SAMPLE_SENTENCES) + 1))[:options['batch_texts']]
+        self.stdout.write(
+            f"{'backend':<8}{'load s':>8}{'p50 ms':>9}{'p95 ms':>9}{'texts/s':>10}")
+        for name in options['backends']:
+            started = time.perf_counter()
+            backend = load_embedding_backend(name)
+            load_seconds = time.perf_counter() - started
+
+            backend.encode(SAMPLE_SENTENCES[0])  # warm-up
+            latencies = []
+            for i in range(options['queries']):
+                started = time.perf_counter()
+                backend.encode(SAMPLE_SENTENCES[i % len(SAMPLE_SENTENCES)])
+                latencies.append((time.perf_counter() - started) * 1000)
+
+            started = time.perf_counter()
+            backend.encode(batch_texts, batch_size=options['batch_size'])
+            throughput = len(batch_texts) / (time.perf_counter() - started)
+
+            self.stdout.write(
+                f"{name:<8}{load_seconds:>8.1f}{np.percentile(latencies, 50):>9.2f}"
+                f"{np.percentile(latencies, 95):>9.2f}{throughput:>10.0f}")
@@ -0,0 +1,60 @@
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from knowledge_base.embedding_versions import active_embedding_version
+from knowledge_base.embeddings import load_embedding_backend
+from knowledge_base.retrieval import RETRIEVAL_MODES, search_chunks
+
+DEFAULT_QUESTIONS_FILE = Path(__file__).resolve().parents[2] / 'benchmarks' / 'retrieval_questions.json'
+
+
+class Command(BaseCommand):
+    """
+    Offline retrieval benchmark against the current knowledge base.
+    Each labelled question lists substrings the retrieved chunks should contain
+    (e.g. "106.9" for Singrobo); recall@k is the fraction of those found in the top-k chunks.
+    """
+    help = 'Reports recall@k and latency percentiles for each retrieval mode on a labelled question set.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', default=str(DEFAULT_QUESTIONS_FILE),
+                            help='JSON file of {"question": ..., "expected": [...]} entries.')
+        parser.add_argument('--top-k', type=int, default=5)
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Runs per question and mode, used for latency percentiles.')
+        parser.add_argument('--modes', nargs='+', default=list(RETRIEVAL_MODES), choices=RETRIEVAL_MODES)
+
+    def handle(self, *args, **options):
+        try:
+            labelled = json.loads(Path(options['questions']).read_text(encoding='utf-8'))
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read questions file: {e}")
+
+        version = active_embedding_version()
+        model = load_embedding_backend(version.backend, version.model_name)
+        # Embeddings are computed once up front: the benchmark measures retrieval only
+        embeddings = model.encode([item['question'] for item in labelled])
+        top_k = options['top_k']
+
+        self.stdout.write(f"{len(labelled)} questions, top_k={top_k}, repeat={options['repeat']}")
+        self.stdout.write(f"{'mode':<10}{'recall@k':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for mode in options['modes']:
+            recalls = []
+            latencies = []
+            for item, embedding in zip(labelled, embeddings):
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    chunks = search_chunks(item['question'], embedding, top_k, mode=mode)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                texts = ' '.join(chunk.text_content for chunk in chunks).lower()
+                expected = item['expected']
+                found = sum(1 for needle in expected if needle.lower() in texts)
+                recalls.append(found / len(expected))
+            self.stdout.write(
+                f"{mode:<10}{np.mean(recalls):>10.3f}"
+                f"{np.percentile(latencies, 50):>10.1f}{np.percentile(latencies, 95):>10.1f}"
+            )
@@ -0,0 +1,63 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from knowledge_base.embedding_versions import active_embedding_version
+from knowledge_base.models import DocumentChunk
+from knowledge_base.retrieval import STORAGE_FULL, VECTOR_STORAGES, vector_search
+
+
+class Command(BaseCommand):
+    """
+    Compares the float32 / halfvec / binary+rescoring layouts on the current chunks:
+    average stored bytes per vector, ANN index sizes, query latency and recall@k
+    against the exact float32 result (the full layout has no ANN index, so it is exact).
+    Uses the slot of the active embedding version.
+    """
+    help = 'Benchmarks storage size, query latency and recall of the vector storage layouts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--top-k', type=int, default=5)
+        parser.add_argument('--noise', type=float, default=0.05,
+                            help='Gaussian noise added to sampled chunk embeddings to form queries.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        table = DocumentChunk._meta.db_table
+        columns = active_embedding_version().columns
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT count(*), avg(pg_column_size({columns.full})), avg(pg_column_size({columns.half})), "
+                f"avg(pg_column_size({columns.binary})) FROM {table}")
+            count, full_bytes, half_bytes, binary_bytes = cursor.fetchone()
+            if not count:
+                raise CommandError("No document chunks to benchmark against.")
+            self.stdout.write(f"{count} chunks")
+            self.stdout.write(
+                f"bytes/vector: full={full_bytes:.0f} half={half_bytes or 0:.0f} binary={binary_bytes or 0:.0f}")
+            for index_name in (columns.half_index, columns.binary_index):
+                cursor.execute("SELECT pg_size_pretty(pg_relation_size(%s::regclass))", [index_name])
+                self.stdout.write(f"{index_name}: {cursor.fetchone()[0]}")
+
+        rng = np.random.default_rng(options['seed'])
+        sample = list(DocumentChunk.objects.order_by('?').values_list(columns.full, flat=True)[:options['queries']])
+        queries = [np.asarray(vector) + rng.normal(0, options['noise'], len(vector)) for vector in sample]
+        queries = [(query / np.linalg.norm(query)).astype(np.float32) for query in queries]
+        top_k = options['top_k']
+
+        exact = [{chunk.id for chunk in vector_search(query, top_k, storage=STORAGE_FULL)} for query in queries]
+        self.stdout.write(f"{'storage':<8}{'recall@k':>10}{'p50 ms':>9}{'p95 ms':>9}")
+        for storage in VECTOR_STORAGES:
+            latencies = []
+            recalls = []
+            for query, expected in zip(queries, exact):
+                started = time.perf_counter()
+                found = vector_search(query, top_k, storage=storage)
+                latencies.append((time.perf_counter() - started) * 1000)
+                recalls.append(len(expected & {chunk.id for chunk in found}) / max(len(expected), 1))
+            self.stdout.write(
+                f"{storage:<8}{np.mean(recalls):>10.3f}"
+                f"{np.percentile(latencies, 50):>9.2f}{np.percentile(latencies, 95):>9.2f}")
@@ -0,0 +1,94 @@
+import json
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from knowledge_base.chunking import (
+    CHUNKER_RECURSIVE, CHUNKER_STRUCTURED, SPECIAL_TOKENS, StructuredChunker, split_recursive)
+from knowledge_base.embeddings import MAX_SEQUENCE_LENGTH, load_embedding_backend
+from knowledge_base.extraction import detect_extractor
+from knowledge_base.extraction_cache import Extraction, extract
+from knowledge_base.models import KnowledgeDocument
+
+DEFAULT_QUESTIONS_FILE = Path(__file__).resolve().parents[2] / 'benchmarks' / 'retrieval_questions.json'
+
+
+class Command(BaseCommand):
+    """
+    Chunks the same documents with the structure-aware chunker and the previous
+    character-based splitter, then reports for each: chunk count, chunk sizes in model
+    tokens, how many chunks exceed the model window (their end is never embedded), and
+    retrieval quality on the labelled questions (recall@k as in benchmark_retrieval, and
+    MRR of the first chunk containing an expected answer). Everything is computed in
+    memory; the database is only read.
+    """
+    help = 'Compares the structured and recursive chunkers on chunk counts and retrieval quality.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='*', help='Document files (default: all uploaded documents).')
+        parser.add_argument('--questions', default=str(DEFAULT_QUESTIONS_FILE))
+        parser.add_argument('--top-k', type=int, default=5)
+
+    def load_documents(self, paths):
+        if paths:
+            return [(Path(path).name, Path(path).read_bytes()) for path in paths]
+        documents = []
+        for document in KnowledgeDocument.objects.exclude(file=''):
+            with document.file.open('rb') as file:
+                documents.append((document.original_filename, file.read()))
+        return documents
+
+    def chunk(self, chunker, documents, backend):
+        texts = []
+        for filename, content in documents:
+            stream = BytesIO(content)
+            extraction = Extraction(*extract(stream, detect_extractor(stream, filename)), cached=False)
+            if chunker == CHUNKER_STRUCTURED:
+                chunks = StructuredChunker(backend.count_tokens).split(extraction.segments)
+                texts.extend(chunk.text for chunk in chunks)
+            else:
+                texts.extend(split_recursive(extraction.text))
+        return texts
+
+    def handle(self, *args, **options):
+        try:
+            labelled = json.loads(Path(options['questions']).read_text(encoding='utf-8'))
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read questions file: {e}")
+        documents = self.load_documents(options['files'])
+        if not documents:
+            raise CommandError("No documents to chunk.")
+
+        backend = load_embedding_backend()
+        question_embeddings = backend.encode([item['question'] for item in labelled])
+        top_k = options['top_k']
+        window = MAX_SEQUENCE_LENGTH - SPECIAL_TOKENS
+
+        self.stdout.write(f"{len(documents)} documents, {len(labelled)} questions, top_k={top_k}")
+        self.stdout.write(
+            f"{'chunker':<12}{'chunks':>8}{'mean tok':>10}{'max tok':>9}{'over window':>13}"
+            f"{'recall@k':>10}{'MRR':>7}")
+        for chunker in (CHUNKER_RECURSIVE, CHUNKER_STRUCTURED):
+            texts = self.chunk(chunker, documents, backend)
+            if not texts:
+                self.stdout.write(f"{chunker:<12}{0:>8}")
+                continue
+            tokens = np.array(backend.count_tokens(texts))
+            scores = question_embeddings @ backend.encode(texts).T  # Embeddings are L2-normalised
+
+            recalls = []
+            reciprocal_ranks = []
+            for item, question_scores in zip(labelled, scores):
+                ranked = [texts[index].lower() for index in np.argsort(-question_scores)]
+                expected = [needle.lower() for needle in item['expected']]
+                top_text = ' '.join(ranked[:top_k])
+                recalls.append(sum(1 for needle in expected if needle in top_text) / len(expected))
+                first_hit = next((rank for rank, text in enumerate(ranked, start=1)
+                                  if any(needle in text for needle in expected)), None)
+                reciprocal_ranks.append(1 / first_hit if first_hit else 0.0)
+
+            self.stdout.write(
+                f"{chunker:<12}{len(texts):>8}{tokens.mean():>10.1f}{tokens.max():>9}"
+                f"{int((tokens > window).sum()):>13}{np.mean(recalls):>10.3f}{np.mean(reciprocal_ranks):>7.3f}")
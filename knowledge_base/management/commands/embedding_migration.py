@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand, CommandError
+from django_q.tasks import async_task
+
+from knowledge_base.embedding_versions import (
+    MIGRATING_STATES, activate, active_embedding_version, backfill, cancel_migration, coverage, start_migration)
+from knowledge_base.models import EmbeddingVersion
+
+
+class Command(BaseCommand):
+    """
+    Blue/green migration of the embedding model (see knowledge_base/embedding_versions.py).
+    `start` records the new model and queues the reembed_chunks task, which fills the
+    free slot while queries keep using the active model, then switches over; `run`
+    does the same work in the foreground. `status` reports coverage, throughput and
+    the remaining time of the migration in progress.
+    """
+    help = 'Starts, follows, activates or cancels a re-embedding of the chunks with a new model.'
+
+    def add_arguments(self, parser):
+        subcommands = parser.add_subparsers(dest='action', required=True)
+        start = subcommands.add_parser('start', help='Start re-embedding the chunks with a model.')
+        start.add_argument('model_name')
+        start.add_argument('--backend', help='Embedding backend (default: settings.KNOWLEDGE_EMBEDDING_BACKEND).')
+        start.add_argument('--dimensions', type=int, help='Embedding size (default: probed from the model).')
+        start.add_argument('--foreground', action='store_true', help='Backfill here instead of in Django Q.')
+        subcommands.add_parser('status', help='Show the active version and the migration in progress.')
+        subcommands.add_parser('run', help='Backfill the migration in progress in the foreground.')
+        subcommands.add_parser('activate', help='Switch queries to the migrated version.')
+        subcommands.add_parser('cancel', help='Cancel the migration in progress.')
+
+    def migrating_version(self):
+        version = EmbeddingVersion.objects.filter(state__in=MIGRATING_STATES).first()
+        if version is None:
+            raise CommandError("No embedding migration in progress.")
+        return version
+
+    def report(self, version):
+        embedded, total = coverage(version)
+        percent = 100 * embedded / total if total else 100.0
+        line = f"{version}: {embedded}/{total} chunks ({percent:.1f}%)"
+        if version.rows_per_second:
+            line += f", {version.rows_per_second:.1f} rows/s, ~{(total - embedded) / version.rows_per_second:.0f}s left"
+        self.stdout.write(line)
+
+    def run_backfill(self, version):
+        backfill(version.pk, progress=self.report)
+        version.refresh_from_db()
+        self.stdout.write(f"{version}")
+
+    def handle(self, *args, **options):
+        action = options['action']
+        try:
+            if action == 'start':
+                version = start_migration(options['model_name'], options['backend'], options['dimensions'])
+                self.stdout.write(f"Started {version}, {version.dimensions} dimensions.")
+                if options['foreground']:
+                    self.run_backfill(version)
+                else:
+                    async_task('knowledge_base.tasks.reembed_chunks', version.pk)
+            elif action == 'status':
+                active = active_embedding_version()
+                self.stdout.write(f"Active: {active.model_name} ({active.backend}, {active.dimensions} dimensions, "
+                                  f"{active.slot} slot)")
+                version = EmbeddingVersion.objects.filter(state__in=MIGRATING_STATES).first()
+                if version is not None:
+                    self.report(version)
+            elif action == 'run':
+                self.run_backfill(self.migrating_version())
+            elif action == 'activate':
+                self.stdout.write(f"Activated {activate(self.migrating_version())}.")
+            elif action == 'cancel':
+                version = self.migrating_version()
+                cancel_migration(version)
+                self.stdout.write(f"Cancelled the migration to {version.model_name}.")
+        except ValueError as e:
+            raise CommandError(str(e))
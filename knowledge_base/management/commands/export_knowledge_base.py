@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from knowledge_base.archive import export_knowledge_base
+
+
+class Command(BaseCommand):
+    """
+    Writes the processed knowledge base (documents, chunks, embeddings of the active
+    model and the uploaded files) to an archive that import_knowledge_base loads on
+    another node, see knowledge_base/archive.py.
+    """
+    help = 'Exports the processed documents, chunks and embeddings to an archive.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Archive to write (.tar, or .tar.gz to compress it).')
+        parser.add_argument('--without-files', action='store_true',
+                            help="Don't include the uploaded files (e.g. when the nodes share the media storage).")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            documents, chunks = export_knowledge_base(options['path'], include_files=not options['without_files'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(f"Exported {documents} documents and {chunks} chunks to {options['path']} "
+                          f"in {time.perf_counter() - started:.1f}s.")
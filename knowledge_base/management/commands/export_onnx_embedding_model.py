@@ -0,0 +1,75 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from knowledge_base.embeddings import (
+    EMBEDDING_MODEL_NAME, MAX_SEQUENCE_LENGTH, ONNX_MODEL_FILENAME,
+    ONNX_QUANTIZED_MODEL_FILENAME, ONNX_TOKENIZER_FILENAME, SentenceTransformerBackend)
+
+
+class Command(BaseCommand):
+    """
+    Exports the sentence-transformers embedding model to ONNX (fp32 and int8-quantised)
+    for the 'onnx' embedding backend. Run once per model; the output directory can be
+    baked into the image or mounted as a volume.
+    """
+    help = 'Exports the embedding model to ONNX Runtime format (fp32 + dynamic int8).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.KNOWLEDGE_ONNX_MODEL_DIR,
+                            help='Directory to write the ONNX models and tokenizer to.')
+        parser.add_argument('--opset', type=int, default=17)
+
+    def handle(self, *args, **options):
+        import torch
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        output = Path(options['output'])
+        output.mkdir(parents=True, exist_ok=True)
+
+        self.stdout.write(f"Loading {EMBEDDING_MODEL_NAME}...")
+        st_model = SentenceTransformerBackend().model
+        transformer = st_model[0].auto_model.eval()
+        tokenizer = st_model.tokenizer
+
+        dummy = tokenizer(["FER FM, la radio des routes"], return_tensors='pt',
+                          padding=True, truncation=True, max_length=MAX_SEQUENCE_LENGTH)
+        input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in dummy]
+        dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+        dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+
+        class TokenEmbeddings(torch.nn.Module):
+            # Calls the transformer by keyword so the export does not depend on its
+            # positional signature, and returns only the token embeddings to pool
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+
+            def forward(self, *inputs):
+                return self.model(**dict(zip(input_names, inputs))).last_hidden_state
+
+        fp32_path = output / ONNX_MODEL_FILENAME
+        self.stdout.write(f"Exporting to {fp32_path}...")
+        with torch.no_grad():
+            torch.onnx.export(
+                TokenEmbeddings(transformer),
+                tuple(dummy[name] for name in input_names),
+                str(fp32_path),
+                input_names=input_names,
+                output_names=['last_hidden_state'],
+                dynamic_axes=dynamic_axes,
+                opset_version=options['opset'],
+                dynamo=False,  # TorchScript exporter: no onnxscript dependency
+            )
+
+        int8_path = output / ONNX_QUANTIZED_MODEL_FILENAME
+        self.stdout.write(f"Quantising to {int8_path}...")
+        quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+
+        # The fast tokenizer's tokenizer.json is all the ONNX backend needs (no transformers import)
+        tokenizer.backend_tokenizer.save(str(output / ONNX_TOKENIZER_FILENAME))
+
+        for path in (fp32_path, int8_path):
+            self.stdout.write(f"  {path.name}: {path.stat().st_size / 1e6:.1f} MB")
+        self.stdout.write(self.style.SUCCESS(f"ONNX embedding model exported to {output}"))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from knowledge_base.coalescing import knowledge_base_version
+from knowledge_base.embedding_versions import active_embedding_version
+from knowledge_base.faq import mine_questions, queue_regeneration, regenerate_answers, stale_entries
+from knowledge_base.models import FaqEntry
+
+
+class Command(BaseCommand):
+    """
+    Manages the frequent questions answered offline (see knowledge_base/faq.py). `add`
+    and `mine` record questions and queue the regenerate_faq_answers task, which
+    answers them; `regenerate` answers the stale entries in the foreground instead.
+    """
+    help = 'Lists, adds, mines or regenerates the precomputed FAQ answers.'
+
+    def add_arguments(self, parser):
+        subcommands = parser.add_subparsers(dest='action', required=True)
+        subcommands.add_parser('list', help='List the entries and whether their answer is current.')
+        add = subcommands.add_parser('add', help='Add a curated question.')
+        add.add_argument('question')
+        mine = subcommands.add_parser('mine', help='Add the most asked first questions of the conversations.')
+        mine.add_argument('--days', type=int, default=30)
+        mine.add_argument('--min-count', type=int, default=5, help='Times a question must have been asked.')
+        mine.add_argument('--limit', type=int, default=20, help='Questions added at most.')
+        mine.add_argument('--threshold', type=float,
+                          help='Similarity grouping questions (default: settings.KNOWLEDGE_FAQ_MATCH_THRESHOLD).')
+        subcommands.add_parser('regenerate', help='Answer the stale entries now.')
+
+    def handle(self, *args, **options):
+        action = options['action']
+        if action == 'list':
+            stale = set(stale_entries(knowledge_base_version(), active_embedding_version()).values_list('pk', flat=True))
+            for entry in FaqEntry.objects.all():
+                state = 'disabled' if not entry.enabled else 'stale' if entry.pk in stale else 'current'
+                self.stdout.write(f"[{state}] {entry.question} ({entry.get_source_display()}, asked {entry.asked})")
+        elif action == 'add':
+            try:
+                FaqEntry.objects.create(question=options['question'].strip())
+            except IntegrityError:
+                raise CommandError("This question is already in the FAQ.")
+            queue_regeneration()
+            self.stdout.write("Added; its answer is being generated.")
+        elif action == 'mine':
+            entries = mine_questions(options['days'], options['min_count'], options['limit'], options['threshold'])
+            for entry in entries:
+                self.stdout.write(f"{entry.question} (asked {entry.asked})")
+            if entries:
+                queue_regeneration()
+            self.stdout.write(f"Added {len(entries)} questions.")
+        elif action == 'regenerate':
+            regenerate_answers(progress=lambda entry: self.stdout.write(f"Answered: {entry.question}"))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from knowledge_base.archive import import_knowledge_base
+
+
+class Command(BaseCommand):
+    """
+    Loads an archive written by export_knowledge_base, after checking its checksums
+    and that it was embedded with the active model. Nothing is re-processed: the node
+    answers questions about the imported documents as soon as the command returns.
+    """
+    help = 'Imports the documents, chunks and embeddings of a knowledge base archive.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--replace', action='store_true',
+                            help='Delete the current documents instead of refusing a non-empty knowledge base. '
+                                 'Searches keep being answered meanwhile; imports into an empty knowledge '
+                                 'base lock the chunks table until they complete.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            documents, chunks = import_knowledge_base(options['path'], replace=options['replace'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(f"Imported {documents} documents and {chunks} chunks from {options['path']} "
+                          f"in {time.perf_counter() - started:.1f}s.")
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from knowledge_base.extraction_cache import cache_size, evict, get_extraction, max_cache_bytes
+from knowledge_base.models import ExtractedContent, KnowledgeDocument
+
+
+class Command(BaseCommand):
+    """
+    Extracts every uploaded KnowledgeDocument into the extraction cache, so the next
+    reprocessing (after a chunking or embedding change, for instance) skips PDF/DOCX
+    parsing. Documents already cached are only touched (they become most recently used).
+    """
+    help = 'Fills the extraction cache with all uploaded documents.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true', help='Empty the cache first.')
+
+    def handle(self, *args, **options):
+        if max_cache_bytes() <= 0:
+            self.stdout.write(self.style.WARNING(
+                "The extraction cache is disabled (KNOWLEDGE_EXTRACTION_CACHE_MAX_MB=0)."))
+            return
+        if options['clear']:
+            deleted, _ = ExtractedContent.objects.all().delete()
+            self.stdout.write(f"Deleted {deleted} cache entries.")
+
+        extracted = cached = failed = 0
+        started = time.perf_counter()
+        for document in KnowledgeDocument.objects.exclude(file='').order_by('uploaded_at'):
+            try:
+                with document.file.open('rb') as file:
+                    extraction = get_extraction(file.read(), document.original_filename)
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"  {document}: {e}")
+                continue
+            if extraction.cached:
+                cached += 1
+            else:
+                extracted += 1
+                self.stdout.write(f"  {document}: {len(extraction.pages)} pages")
+        evict()
+        self.stdout.write(self.style.SUCCESS(
+            f"{extracted} extracted, {cached} already cached, {failed} failed in "
+            f"{time.perf_counter() - started:.1f}s; cache holds {ExtractedContent.objects.count()} entries, "
+            f"{cache_size() / 1024 / 1024:.1f} MB of {max_cache_bytes() / 1024 / 1024:.0f} MB."))
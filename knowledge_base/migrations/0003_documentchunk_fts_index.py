@@ -0,0 +1,24 @@
+# Generated by Django 5.0.6 on 2026-10-19 17:10
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("knowledge_base", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="documentchunk",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.search.SearchVector(
+                    "text_content", config="french"
+                ),
+                name="chunk_text_content_fts_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.0.6 on 2026-10-19 17:16
+
+import pgvector.django.bit
+import pgvector.django.halfvec
+import pgvector.django.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("knowledge_base", "0003_documentchunk_fts_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="documentchunk",
+            name="embedding_binary",
+            field=pgvector.django.bit.BitField(
+                blank=True, length=384, null=True, verbose_name="Binary Embedding"
+            ),
+        ),
+        migrations.AddField(
+            model_name="documentchunk",
+            name="embedding_half",
+            field=pgvector.django.halfvec.HalfVectorField(
+                blank=True,
+                dimensions=384,
+                null=True,
+                verbose_name="Half-precision Embedding",
+            ),
+        ),
+        # Backfill existing chunks before building the indexes (requires pgvector >= 0.7).
+        # New chunks get both columns from process_document.
+        migrations.RunSQL(
+            sql="""
+                UPDATE knowledge_base_documentchunk
+                SET embedding_half = embedding::halfvec(384),
+                    embedding_binary = binary_quantize(embedding)::bit(384)
+                WHERE embedding_half IS NULL OR embedding_binary IS NULL
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name="documentchunk",
+            index=pgvector.django.indexes.HnswIndex(
+                ef_construction=64,
+                fields=["embedding_half"],
+                m=16,
+                name="chunk_embedding_half_hnsw_idx",
+                opclasses=["halfvec_cosine_ops"],
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="documentchunk",
+            index=pgvector.django.indexes.HnswIndex(
+                ef_construction=64,
+                fields=["embedding_binary"],
+                m=16,
+                name="chunk_embedding_bin_hnsw_idx",
+                opclasses=["bit_hamming_ops"],
+            ),
+        ),
+    ]
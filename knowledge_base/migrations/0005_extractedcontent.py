@@ -0,0 +1,54 @@
+# Generated by Django 5.0.6 on 2026-10-19 17:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("knowledge_base", "0004_documentchunk_compact_embeddings"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExtractedContent",
+            fields=[
+                (
+                    "content_hash",
+                    models.CharField(
+                        max_length=64,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="SHA-256",
+                    ),
+                ),
+                (
+                    "version",
+                    models.PositiveSmallIntegerField(verbose_name="Extraction Version"),
+                ),
+                (
+                    "file_type",
+                    models.CharField(max_length=10, verbose_name="File Type"),
+                ),
+                ("pages", models.JSONField(verbose_name="Page Texts")),
+                ("segments", models.JSONField(verbose_name="Segments")),
+                (
+                    "size_bytes",
+                    models.PositiveIntegerField(verbose_name="Size (bytes)"),
+                ),
+                ("hits", models.PositiveIntegerField(default=0, verbose_name="Hits")),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Created At"),
+                ),
+                (
+                    "last_used_at",
+                    models.DateTimeField(db_index=True, verbose_name="Last Used At"),
+                ),
+            ],
+            options={
+                "verbose_name": "Extracted Content",
+                "verbose_name_plural": "Extracted Contents",
+            },
+        ),
+    ]
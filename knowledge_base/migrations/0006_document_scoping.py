@@ -0,0 +1,49 @@
+# Generated by Django 5.0.6 on 2026-10-19 17:51
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("knowledge_base", "0005_extractedcontent"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="knowledgedocument",
+            name="category",
+            field=models.CharField(
+                blank=True, db_index=True, max_length=50, verbose_name="Category"
+            ),
+        ),
+        migrations.AddField(
+            model_name="knowledgedocument",
+            name="tags",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.CharField(max_length=50),
+                blank=True,
+                default=list,
+                size=None,
+                verbose_name="Tags",
+            ),
+        ),
+        migrations.AddField(
+            model_name="knowledgedocument",
+            name="valid_from",
+            field=models.DateField(blank=True, null=True, verbose_name="Valid From"),
+        ),
+        migrations.AddField(
+            model_name="knowledgedocument",
+            name="valid_until",
+            field=models.DateField(blank=True, null=True, verbose_name="Valid Until"),
+        ),
+        migrations.AddIndex(
+            model_name="knowledgedocument",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["tags"], name="document_tags_gin_idx"
+            ),
+        ),
+    ]
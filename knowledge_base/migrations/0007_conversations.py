@@ -0,0 +1,98 @@
+# Generated by Django 5.0.6 on 2026-10-19 17:55
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("knowledge_base", "0006_document_scoping"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Conversation",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("summary", models.TextField(blank=True, verbose_name="Summary")),
+                (
+                    "summarized_through",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Summarized Through Turn"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Created At"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(
+                        auto_now=True, db_index=True, verbose_name="Updated At"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Conversation",
+                "verbose_name_plural": "Conversations",
+            },
+        ),
+        migrations.CreateModel(
+            name="ConversationTurn",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("position", models.PositiveIntegerField(verbose_name="Position")),
+                ("question", models.TextField(verbose_name="Question")),
+                (
+                    "standalone_question",
+                    models.TextField(blank=True, verbose_name="Standalone Question"),
+                ),
+                ("answer", models.TextField(verbose_name="Answer")),
+                (
+                    "tokens",
+                    models.PositiveIntegerField(verbose_name="Estimated Tokens"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Created At"),
+                ),
+                (
+                    "conversation",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="turns",
+                        to="knowledge_base.conversation",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Conversation Turn",
+                "verbose_name_plural": "Conversation Turns",
+                "ordering": ["conversation", "position"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="conversationturn",
+            constraint=models.UniqueConstraint(
+                fields=("conversation", "position"), name="unique_turn_position"
+            ),
+        ),
+    ]
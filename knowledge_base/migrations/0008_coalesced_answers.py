@@ -0,0 +1,36 @@
+# Generated by Django 5.0.6 on 2026-10-19 17:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("knowledge_base", "0007_conversations"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CoalescedAnswer",
+            fields=[
+                (
+                    "key",
+                    models.CharField(
+                        max_length=64,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="Key",
+                    ),
+                ),
+                ("result", models.JSONField(verbose_name="Result")),
+                (
+                    "created_at",
+                    models.DateTimeField(db_index=True, verbose_name="Created At"),
+                ),
+            ],
+            options={
+                "verbose_name": "Coalesced Answer",
+                "verbose_name_plural": "Coalesced Answers",
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.0.6 on 2026-10-19 18:01
+
+import pgvector.django.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("knowledge_base", "0008_coalesced_answers"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="documentchunk",
+            name="chunk_embedding_half_hnsw_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="documentchunk",
+            name="chunk_embedding_bin_hnsw_idx",
+        ),
+        migrations.AddField(
+            model_name="documentchunk",
+            name="is_searchable",
+            field=models.BooleanField(default=False, verbose_name="Searchable"),
+        ),
+        # Backfill before building the partial indexes.
+        # New chunks are published by process_document.
+        migrations.RunSQL(
+            sql="""
+                UPDATE knowledge_base_documentchunk AS chunk
+                SET is_searchable = TRUE
+                FROM knowledge_base_knowledgedocument AS document
+                WHERE chunk.document_id = document.id AND document.status = 'COMPLETED'
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name="documentchunk",
+            index=pgvector.django.indexes.HnswIndex(
+                condition=models.Q(("is_searchable", True)),
+                ef_construction=64,
+                fields=["embedding_half"],
+                m=16,
+                name="chunk_embedding_half_hnsw_idx",
+                opclasses=["halfvec_cosine_ops"],
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="documentchunk",
+            index=pgvector.django.indexes.HnswIndex(
+                condition=models.Q(("is_searchable", True)),
+                ef_construction=64,
+                fields=["embedding_binary"],
+                m=16,
+                name="chunk_embedding_bin_hnsw_idx",
+                opclasses=["bit_hamming_ops"],
+            ),
+        ),
+    ]
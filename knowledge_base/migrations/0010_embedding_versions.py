@@ -0,0 +1,186 @@
+# Generated by Django 5.0.6 on 2026-10-19 18:09
+
+import knowledge_base.models
+import pgvector.django.halfvec
+import pgvector.django.vector
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("knowledge_base", "0009_documentchunk_is_searchable"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EmbeddingVersion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "model_name",
+                    models.CharField(max_length=255, verbose_name="Model Name"),
+                ),
+                ("backend", models.CharField(max_length=20, verbose_name="Backend")),
+                ("dimensions", models.PositiveIntegerField(verbose_name="Dimensions")),
+                (
+                    "slot",
+                    models.CharField(
+                        choices=[("blue", "Blue"), ("green", "Green")],
+                        max_length=10,
+                        verbose_name="Slot",
+                    ),
+                ),
+                (
+                    "state",
+                    models.CharField(
+                        choices=[
+                            ("BACKFILLING", "Backfilling"),
+                            ("READY", "Ready"),
+                            ("ACTIVE", "Active"),
+                            ("RETIRED", "Retired"),
+                            ("CANCELLED", "Cancelled"),
+                        ],
+                        db_index=True,
+                        max_length=20,
+                        verbose_name="State",
+                    ),
+                ),
+                (
+                    "slot_prepared",
+                    models.BooleanField(default=False, verbose_name="Slot Prepared"),
+                ),
+                (
+                    "cursor",
+                    models.UUIDField(blank=True, null=True, verbose_name="Cursor"),
+                ),
+                (
+                    "chunks_embedded",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Chunks Embedded"
+                    ),
+                ),
+                (
+                    "rows_per_second",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Rows per Second"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Created At"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="Updated At"),
+                ),
+                (
+                    "activated_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Activated At"
+                    ),
+                ),
+                (
+                    "retired_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Retired At"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Embedding Version",
+                "verbose_name_plural": "Embedding Versions",
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name="documentchunk",
+            name="chunk_embedding_half_hnsw_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="documentchunk",
+            name="chunk_embedding_bin_hnsw_idx",
+        ),
+        migrations.AddField(
+            model_name="documentchunk",
+            name="embedding_binary_green",
+            field=knowledge_base.models.VarBitField(
+                blank=True, null=True, verbose_name="Binary Embedding (green)"
+            ),
+        ),
+        migrations.AddField(
+            model_name="documentchunk",
+            name="embedding_green",
+            field=pgvector.django.vector.VectorField(
+                blank=True, null=True, verbose_name="Embedding (green)"
+            ),
+        ),
+        migrations.AddField(
+            model_name="documentchunk",
+            name="embedding_half_green",
+            field=pgvector.django.halfvec.HalfVectorField(
+                blank=True, null=True, verbose_name="Half-precision Embedding (green)"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="documentchunk",
+            name="embedding",
+            field=pgvector.django.vector.VectorField(
+                blank=True, null=True, verbose_name="Embedding"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="documentchunk",
+            name="embedding_binary",
+            field=knowledge_base.models.VarBitField(
+                blank=True, null=True, verbose_name="Binary Embedding"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="documentchunk",
+            name="embedding_half",
+            field=pgvector.django.halfvec.HalfVectorField(
+                blank=True, null=True, verbose_name="Half-precision Embedding"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="embeddingversion",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("state", "ACTIVE")),
+                fields=("state",),
+                name="single_active_embedding_version",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="embeddingversion",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("state__in", ["ACTIVE", "BACKFILLING", "READY"])),
+                fields=("slot",),
+                name="single_live_version_per_slot",
+            ),
+        ),
+        # The blue slot's ANN indexes become expression indexes on the current model's
+        # dimensions; embedding_versions.create_slot_indexes() manages them from now on.
+        migrations.RunSQL(
+            sql="""
+            CREATE INDEX chunk_embedding_half_hnsw_idx ON knowledge_base_documentchunk
+            USING hnsw ((embedding_half::halfvec(384)) halfvec_cosine_ops) WITH (m = 16, ef_construction = 64)
+            WHERE is_searchable;
+            CREATE INDEX chunk_embedding_bin_hnsw_idx ON knowledge_base_documentchunk
+            USING hnsw ((embedding_binary::bit(384)) bit_hamming_ops) WITH (m = 16, ef_construction = 64)
+            WHERE is_searchable;
+        """,
+            reverse_sql="""
+            DROP INDEX IF EXISTS chunk_embedding_half_hnsw_idx;
+            DROP INDEX IF EXISTS chunk_embedding_bin_hnsw_idx;
+        """,
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.0.6 on 2026-10-19 18:36
+
+import pgvector.django.vector
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("knowledge_base", "0010_embedding_versions"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FaqEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("question", models.TextField(unique=True, verbose_name="Question")),
+                (
+                    "source",
+                    models.CharField(
+                        choices=[("CURATED", "Curated"), ("MINED", "Mined")],
+                        default="CURATED",
+                        max_length=10,
+                        verbose_name="Source",
+                    ),
+                ),
+                ("enabled", models.BooleanField(default=True, verbose_name="Enabled")),
+                ("answer", models.TextField(blank=True, verbose_name="Answer")),
+                (
+                    "embedding",
+                    pgvector.django.vector.VectorField(
+                        blank=True, null=True, verbose_name="Embedding"
+                    ),
+                ),
+                (
+                    "embedding_model",
+                    models.CharField(
+                        blank=True, max_length=255, verbose_name="Embedding Model"
+                    ),
+                ),
+                (
+                    "knowledge_base_version",
+                    models.CharField(
+                        blank=True,
+                        max_length=100,
+                        verbose_name="Knowledge Base Version",
+                    ),
+                ),
+                (
+                    "asked",
+                    models.PositiveIntegerField(default=0, verbose_name="Times Asked"),
+                ),
+                (
+                    "generated_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Generated At"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Created At"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="Updated At"),
+                ),
+            ],
+            options={
+                "verbose_name": "FAQ Entry",
+                "verbose_name_plural": "FAQ Entries",
+                "ordering": ["-asked", "question"],
+            },
+        ),
+    ]
@@ -1,10 +1,20 @@
 import uuid
+from collections import namedtuple
+
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
 from django.db import models
+from django.db.models import Q
 from django.utils.translation import gettext_lazy as _
-from pgvector.django import VectorField
+from pgvector.django import BitField, HalfVectorField, VectorField
 
 # Create your models here.
 
+# Postgres text search configuration used for the lexical retrieval leg.
+# The GIN index on DocumentChunk is built on this exact expression, so queries must use it too.
+TEXT_SEARCH_CONFIG = 'french'
+
 def knowledge_upload_path(instance, filename):
     # file will be uploaded to MEDIA_ROOT/knowledge_base/<uuid>.<ext>
     file_extension = filename.split('.')[-1]
@@ -29,11 +39,20 @@ class KnowledgeDocument(models.Model):
     uploaded_at = models.DateTimeField(_("Uploaded At"), auto_now_add=True)
     processed_at = models.DateTimeField(_("Processed At"), null=True, blank=True)
     error_message = models.TextField(_("Error Message"), blank=True, null=True) # To store processing errors
+    # Scoping of questions (see retrieval.apply_filters): e.g. category "programmes",
+    # tags ["saison-2026", "abidjan"], and the period a schedule is valid for
+    category = models.CharField(_("Category"), max_length=50, blank=True, db_index=True)
+    tags = ArrayField(models.CharField(max_length=50), verbose_name=_("Tags"), default=list, blank=True)
+    valid_from = models.DateField(_("Valid From"), null=True, blank=True)
+    valid_until = models.DateField(_("Valid Until"), null=True, blank=True)
 
     class Meta:
         verbose_name = _("Knowledge Document")
         verbose_name_plural = _("Knowledge Documents")
         ordering = ['-uploaded_at']
+        indexes = [
+            GinIndex(fields=['tags'], name='document_tags_gin_idx'),
+        ]
 
     def __str__(self):
         return self.original_filename or str(self.id)
@@ -41,12 +60,44 @@ class KnowledgeDocument(models.Model):
     def save(self, *args, **kwargs):
         if not self.original_filename and self.file:
             self.original_filename = self.file.name.split('/')[-1]
+        # Filters match exact values: keep categories and tags in one form
+        self.category = self.category.strip().lower()
+        self.tags = sorted({tag.strip().lower() for tag in self.tags if tag.strip()})
         super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'status' in update_fields:
+            # Keep DocumentChunk.is_searchable in step (queryset.update(status=...) bypasses this)
+            searchable = self.status == self.Status.COMPLETED
+            self.chunks.filter(is_searchable=not searchable).update(is_searchable=searchable)
+
+
+class VarBitField(BitField):
+    """Bit string of any length: an untyped `bit` column would be bit(1) in Postgres."""
+
+    def db_type(self, connection):
+        return 'varbit' if self.length is None else super().db_type(connection)
+
+
+# Columns of DocumentChunk holding the vectors of one embedding model version (see
+# embedding_versions.py): the active version serves queries from its slot while the
+# next one is filled in the other.
+SlotColumns = namedtuple('SlotColumns', ['full', 'half', 'binary', 'half_index', 'binary_index'])
+SLOT_BLUE = 'blue'
+SLOT_GREEN = 'green'
+SLOT_COLUMNS = {
+    SLOT_BLUE: SlotColumns(
+        'embedding', 'embedding_half', 'embedding_binary',
+        'chunk_embedding_half_hnsw_idx', 'chunk_embedding_bin_hnsw_idx'),
+    SLOT_GREEN: SlotColumns(
+        'embedding_green', 'embedding_half_green', 'embedding_binary_green',
+        'chunk_embedding_half_green_hnsw_idx', 'chunk_embedding_bin_green_hnsw_idx'),
+}
 
 
 class DocumentChunk(models.Model):
-    # Assuming usage of all-MiniLM-L6-v2 (384 dimensions)
-    # Adjust dimensions if using a different embedding model.
+    # Dimensions of EMBEDDING_MODEL_NAME (all-MiniLM-L6-v2), the version used until an
+    # EmbeddingVersion is activated. Vector columns are untyped so either slot can hold
+    # any model; their HNSW indexes are expression indexes on the version's dimensions.
     EMBEDDING_DIMENSIONS = 384
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -57,8 +108,22 @@ class DocumentChunk(models.Model):
         verbose_name=_("Parent Document")
     )
     text_content = models.TextField(_("Text Content"))
-    embedding = VectorField(_("Embedding"), dimensions=EMBEDDING_DIMENSIONS)
+    # Blue slot
+    embedding = VectorField(_("Embedding"), null=True, blank=True)
+    # Compact copies of `embedding` for large corpora (see settings.KNOWLEDGE_VECTOR_STORAGE):
+    # half precision (2 bytes/dim) and sign-bit binary quantisation (1 bit/dim) used as a
+    # Hamming-distance pre-filter before exact rescoring on `embedding`.
+    embedding_half = HalfVectorField(_("Half-precision Embedding"), null=True, blank=True)
+    embedding_binary = VarBitField(_("Binary Embedding"), null=True, blank=True)
+    # Green slot, same layout
+    embedding_green = VectorField(_("Embedding (green)"), null=True, blank=True)
+    embedding_half_green = HalfVectorField(_("Half-precision Embedding (green)"), null=True, blank=True)
+    embedding_binary_green = VarBitField(_("Binary Embedding (green)"), null=True, blank=True)
     metadata = models.JSONField(_("Metadata"), null=True, blank=True) # e.g., {'page_number': 1}
+    # Copy of "document is COMPLETED", so searches don't join KnowledgeDocument and the
+    # partial ANN indexes below serve them alone. Chunks are created searchable in the
+    # transaction completing their document; KnowledgeDocument.save() syncs status changes.
+    is_searchable = models.BooleanField(_("Searchable"), default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -66,6 +131,14 @@ class DocumentChunk(models.Model):
         verbose_name_plural = _("Document Chunks")
         indexes = [
             models.Index(fields=['document']),
+            # Full-text index for the lexical leg of hybrid retrieval (see retrieval.py)
+            GinIndex(
+                SearchVector('text_content', config=TEXT_SEARCH_CONFIG),
+                name='chunk_text_content_fts_idx',
+            ),
+            # The ANN indexes of the compact storage layouts (HNSW over searchable chunks,
+            # on the slot's columns cast to its version's dimensions) are created with the
+            # slot by embedding_versions.create_slot_indexes(), not here.
             # Optional: Add a HNSW or IVFFlat index for faster vector search
             # Requires enabling the extension and running migrations
             # See django-pgvector docs for index types (e.g., HnswIndex)
@@ -74,3 +147,179 @@ class DocumentChunk(models.Model):
 
     def __str__(self):
         return f"Chunk {self.id} from {self.document.original_filename or self.document.id}"
+
+
+class ExtractedContent(models.Model):
+    """
+    Extraction cache (see extraction_cache.py): the text of a file, per page, keyed by
+    the SHA-256 of its content and extractor, so reprocessing a document, re-uploading the same file
+    or changing chunking parameters doesn't parse it again.
+    """
+    content_hash = models.CharField(_("SHA-256"), max_length=64, primary_key=True)
+    # Bumped when extraction changes (extraction_cache.EXTRACTION_VERSION): older entries are misses
+    version = models.PositiveSmallIntegerField(_("Extraction Version"))
+    file_type = models.CharField(_("File Type"), max_length=10)
+    pages = models.JSONField(_("Page Texts"))  # Raw text of each page, [] for formats without pages
+    segments = models.JSONField(_("Segments"))  # [kind, text, level, page] lists, see extraction.Segment
+    size_bytes = models.PositiveIntegerField(_("Size (bytes)"))
+    hits = models.PositiveIntegerField(_("Hits"), default=0)
+    created_at = models.DateTimeField(_("Created At"), auto_now_add=True)
+    last_used_at = models.DateTimeField(_("Last Used At"), db_index=True)  # Least recently used are evicted first
+
+    class Meta:
+        verbose_name = _("Extracted Content")
+        verbose_name_plural = _("Extracted Contents")
+
+    def __str__(self):
+        return f"{self.content_hash[:12]} ({self.file_type}, {len(self.pages)} pages)"
+
+
+class Conversation(models.Model):
+    """
+    A chat session with FERMAN (see conversations.py). Old turns are folded into a
+    rolling `summary` so the prompt stays within a fixed budget however long the chat.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    summary = models.TextField(_("Summary"), blank=True)
+    # Turns up to this position are in the summary (0: none yet)
+    summarized_through = models.PositiveIntegerField(_("Summarized Through Turn"), default=0)
+    created_at = models.DateTimeField(_("Created At"), auto_now_add=True)
+    updated_at = models.DateTimeField(_("Updated At"), auto_now=True, db_index=True)
+
+    class Meta:
+        verbose_name = _("Conversation")
+        verbose_name_plural = _("Conversations")
+
+    def __str__(self):
+        return str(self.id)
+
+
+class ConversationTurn(models.Model):
+    """One question and its answer; retrieval snippets and prompts are not kept."""
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='turns')
+    position = models.PositiveIntegerField(_("Position"))  # 1-based
+    question = models.TextField(_("Question"))
+    # The follow-up rewritten to stand on its own, used for retrieval (blank for first questions)
+    standalone_question = models.TextField(_("Standalone Question"), blank=True)
+    answer = models.TextField(_("Answer"))
+    tokens = models.PositiveIntegerField(_("Estimated Tokens"))  # Of question + answer
+    created_at = models.DateTimeField(_("Created At"), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("Conversation Turn")
+        verbose_name_plural = _("Conversation Turns")
+        ordering = ['conversation', 'position']
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'position'], name='unique_turn_position'),
+        ]
+
+    def __str__(self):
+        return f"{self.conversation_id} #{self.position}"
+
+
+class CoalescedAnswer(models.Model):
+    """
+    Result of a query pipeline run shared with the identical requests that waited for it,
+    in any gunicorn worker (see coalescing.py). Rows only live for a few seconds.
+    """
+    key = models.CharField(_("Key"), max_length=64, primary_key=True)  # SHA-256 of question, filters, KB version
+    result = models.JSONField(_("Result"))
+    created_at = models.DateTimeField(_("Created At"), db_index=True)
+
+    class Meta:
+        verbose_name = _("Coalesced Answer")
+        verbose_name_plural = _("Coalesced Answers")
+
+    def __str__(self):
+        return self.key[:12]
+
+
+class EmbeddingVersion(models.Model):
+    """
+    An embedding model and the slot of DocumentChunk columns holding its vectors (see
+    embedding_versions.py). The ACTIVE version serves queries; a new one is BACKFILLING
+    in the other slot, then READY once every chunk has its vector, until it is activated.
+    """
+    class State(models.TextChoices):
+        BACKFILLING = 'BACKFILLING', _('Backfilling')
+        READY = 'READY', _('Ready')
+        ACTIVE = 'ACTIVE', _('Active')
+        RETIRED = 'RETIRED', _('Retired')
+        CANCELLED = 'CANCELLED', _('Cancelled')
+
+    class Slot(models.TextChoices):
+        BLUE = SLOT_BLUE, _('Blue')
+        GREEN = SLOT_GREEN, _('Green')
+
+    model_name = models.CharField(_("Model Name"), max_length=255)
+    backend = models.CharField(_("Backend"), max_length=20)  # 'torch' or 'onnx', see embeddings.py
+    dimensions = models.PositiveIntegerField(_("Dimensions"))
+    slot = models.CharField(_("Slot"), max_length=10, choices=Slot.choices)
+    state = models.CharField(_("State"), max_length=20, choices=State.choices, db_index=True)
+    # Backfill progress: the slot is first cleared of a retired version's vectors, then
+    # chunks are embedded in primary key order from `cursor`
+    slot_prepared = models.BooleanField(_("Slot Prepared"), default=False)
+    cursor = models.UUIDField(_("Cursor"), null=True, blank=True)
+    chunks_embedded = models.PositiveIntegerField(_("Chunks Embedded"), default=0)
+    rows_per_second = models.FloatField(_("Rows per Second"), null=True, blank=True)
+    created_at = models.DateTimeField(_("Created At"), auto_now_add=True)
+    updated_at = models.DateTimeField(_("Updated At"), auto_now=True)
+    activated_at = models.DateTimeField(_("Activated At"), null=True, blank=True)
+    retired_at = models.DateTimeField(_("Retired At"), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _("Embedding Version")
+        verbose_name_plural = _("Embedding Versions")
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['state'], condition=Q(state='ACTIVE'), name='single_active_embedding_version'),
+            # A slot holds the vectors of one live version
+            models.UniqueConstraint(
+                fields=['slot'], condition=Q(state__in=['ACTIVE', 'BACKFILLING', 'READY']),
+                name='single_live_version_per_slot'),
+        ]
+
+    def __str__(self):
+        return f"{self.model_name} ({self.slot}, {self.state})"
+
+    @property
+    def columns(self):
+        return SLOT_COLUMNS[self.slot]
+
+    def embeds_like(self, other):
+        """True when both versions produce the same vectors."""
+        return (self.model_name, self.backend, self.dimensions) == (other.model_name, other.backend, other.dimensions)
+
+
+class FaqEntry(models.Model):
+    """
+    A frequent question whose answer is generated offline, each time the knowledge base
+    changes, and served without retrieval or Gemini to the questions close enough to it
+    (see faq.py). Entries are added in the admin or mined from the conversations.
+    """
+    class Source(models.TextChoices):
+        CURATED = 'CURATED', _('Curated')
+        MINED = 'MINED', _('Mined')
+
+    question = models.TextField(_("Question"), unique=True)
+    source = models.CharField(_("Source"), max_length=10, choices=Source.choices, default=Source.CURATED)
+    enabled = models.BooleanField(_("Enabled"), default=True)
+    answer = models.TextField(_("Answer"), blank=True)
+    # Embedding of the question by `embedding_model`, and the knowledge_base_version()
+    # the answer was generated from: the answer is served only while both are current
+    embedding = VectorField(_("Embedding"), null=True, blank=True)
+    embedding_model = models.CharField(_("Embedding Model"), max_length=255, blank=True)
+    knowledge_base_version = models.CharField(_("Knowledge Base Version"), max_length=100, blank=True)
+    asked = models.PositiveIntegerField(_("Times Asked"), default=0)  # When mined, in the period mined
+    generated_at = models.DateTimeField(_("Generated At"), null=True, blank=True)
+    created_at = models.DateTimeField(_("Created At"), auto_now_add=True)
+    updated_at = models.DateTimeField(_("Updated At"), auto_now=True)
+
+    class Meta:
+        verbose_name = _("FAQ Entry")
+        verbose_name_plural = _("FAQ Entries")
+        ordering = ['-asked', 'question']
+
+    def __str__(self):
+        return self.question
@@ -0,0 +1,88 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+# Small multilingual cross-encoder (our documents and questions are in French), fast enough on CPU
+RERANKER_MODEL_NAME = getattr(
+    settings, 'KNOWLEDGE_RERANKER_MODEL', 'cross-encoder/mmarco-mMiniLMv2-L12-H384-v1')
+RERANK_BATCH_SIZE = getattr(settings, 'KNOWLEDGE_RERANK_BATCH_SIZE', 16)
+RERANK_BUDGET_MS = getattr(settings, 'KNOWLEDGE_RERANK_BUDGET_MS', 300)
+
+_reranker = None
+_reranker_lock = threading.Lock()
+# Scoring runs on this pool so the request thread can stop waiting once the budget is spent
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='reranker')
+
+
+def get_reranker():
+    """Loads the cross-encoder once per process (thread-safe)."""
+    global _reranker
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                from sentence_transformers import CrossEncoder
+                logger.info(f"Loading re-ranking model: {RERANKER_MODEL_NAME}")
+                _reranker = CrossEncoder(RERANKER_MODEL_NAME, device='cpu')
+    return _reranker
+
+
+def _score(model, question, texts, deadline, cancelled):
+    """Scores (question, text) pairs batch by batch, giving up once the deadline is passed."""
+    scores = []
+    for start in range(0, len(texts), RERANK_BATCH_SIZE):
+        if cancelled.is_set() or time.monotonic() > deadline:
+            return None
+        batch = [(question, text) for text in texts[start:start + RERANK_BATCH_SIZE]]
+        scores.extend(model.predict(batch, batch_size=RERANK_BATCH_SIZE, show_progress_bar=False))
+    return scores
+
+
+def rerank(question, chunks, top_n, fallback_k=None, budget_ms=None):
+    """
+    Re-scores candidate chunks with the cross-encoder and returns the best `top_n`.
+    If scoring does not finish within `budget_ms`, the original (bi-encoder / RRF) ranking
+    is kept and its first `fallback_k` chunks are returned instead (defaults to `top_n`).
+    The model is loaded before the budget starts (once per process, normally by the warm-up).
+    """
+    fallback = chunks[:fallback_k or top_n]
+    if not chunks:
+        return fallback
+    try:
+        model = get_reranker()
+    except Exception:
+        logger.exception("Re-ranking model unavailable, keeping the original ranking.")
+        return fallback
+
+    budget_ms = RERANK_BUDGET_MS if budget_ms is None else budget_ms
+    started = time.monotonic()
+    deadline = started + budget_ms / 1000
+    cancelled = threading.Event()
+    texts = [chunk.text_content for chunk in chunks]
+    future = _executor.submit(_score, model, question, texts, deadline, cancelled)
+    try:
+        scores = future.result(timeout=max(deadline - time.monotonic(), 0))
+    except FutureTimeoutError:
+        scores = None
+    except Exception:
+        logger.exception("Re-ranking failed, keeping the original ranking.")
+        scores = None
+    finally:
+        # Lets a still-running scorer stop at its next batch boundary
+        cancelled.set()
+
+    elapsed_ms = (time.monotonic() - started) * 1000
+    if scores is None:
+        logger.warning(
+            f"Re-ranking of {len(chunks)} candidates exceeded its {budget_ms} ms budget "
+            f"({elapsed_ms:.0f} ms); falling back to the original ranking.")
+        return fallback
+
+    logger.debug(f"Re-ranked {len(chunks)} candidates in {elapsed_ms:.0f} ms.")
+    order = sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True)
+    return [chunks[i] for i in order[:top_n]]
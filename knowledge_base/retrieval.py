@@ -0,0 +1,248 @@
+import logging
+import re
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Cast
+from pgvector import HalfVector
+from pgvector.django import BitField, CosineDistance, HalfVectorField, HammingDistance
+
+from .embedding_versions import active_embedding_version
+from .embeddings import binary_quantize
+from .models import DocumentChunk, KnowledgeDocument, TEXT_SEARCH_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# --- Retrieval modes ---
+MODE_VECTOR = 'vector'
+MODE_LEXICAL = 'lexical'
+MODE_HYBRID = 'hybrid'
+RETRIEVAL_MODES = (MODE_VECTOR, MODE_LEXICAL, MODE_HYBRID)
+
+# --- Vector storage layouts (settings.KNOWLEDGE_VECTOR_STORAGE) ---
+# Columns of the active embedding version's slot (`embedding*` in the blue slot)
+STORAGE_FULL = 'full'      # float32 `embedding`, exact scan
+STORAGE_HALF = 'half'      # float16 `embedding_half`, HNSW
+STORAGE_BINARY = 'binary'  # 1-bit `embedding_binary` Hamming pre-filter + exact rescoring on `embedding`
+STORAGE_SNAPSHOT = 'snapshot'  # Exact scan of a memory-mapped copy of `embedding`, in process (vector_snapshot.py)
+VECTOR_STORAGES = (STORAGE_FULL, STORAGE_HALF, STORAGE_BINARY, STORAGE_SNAPSHOT)
+
+VECTOR_STORAGE = getattr(settings, 'KNOWLEDGE_VECTOR_STORAGE', STORAGE_FULL)
+# Candidates kept by the Hamming pre-filter before rescoring
+BINARY_RESCORE_CANDIDATES = getattr(settings, 'KNOWLEDGE_BINARY_RESCORE_CANDIDATES', 100)
+
+# Number of candidates each leg contributes before fusion.
+# Larger values give RRF more to work with at the cost of a slightly slower query.
+CANDIDATES_PER_LEG = getattr(settings, 'KNOWLEDGE_HYBRID_CANDIDATES', 20)
+# Standard RRF damping constant (Cormack et al. use 60)
+RRF_K = getattr(settings, 'KNOWLEDGE_RRF_K', 60)
+
+# Keeps frequencies such as "106.9" or "99.6" together as a single term
+QUERY_TERM_PATTERN = re.compile(r"\w+(?:[.,]\w+)*")
+
+# Request-level scoping of a question (see KnowledgeQuerySerializer)
+FILTER_FIELDS = ('document_ids', 'category', 'tags', 'valid_on')
+
+
+def document_filter(filters, prefix='document__'):
+    """
+    Q object matching the documents that satisfy every given filter: document_ids (any
+    of), category, tags (all of) and valid_on (a date within the document's validity
+    period, open-ended when valid_from/valid_until are empty). Fields are looked up
+    through `prefix`: the chunk's document by default, '' on KnowledgeDocument itself.
+    """
+    condition = Q()
+    if filters.get('document_ids'):
+        condition &= Q(**{f'{prefix}id__in': filters['document_ids']})
+    if filters.get('category'):
+        condition &= Q(**{f'{prefix}category': filters['category'].strip().lower()})
+    if filters.get('tags'):
+        condition &= Q(**{f'{prefix}tags__contains': sorted({tag.strip().lower() for tag in filters['tags']})})
+    if filters.get('valid_on'):
+        day = filters['valid_on']
+        condition &= Q(**{f'{prefix}valid_from__isnull': True}) | Q(**{f'{prefix}valid_from__lte': day})
+        condition &= Q(**{f'{prefix}valid_until__isnull': True}) | Q(**{f'{prefix}valid_until__gte': day})
+    return condition
+
+
+def apply_filters(chunks, filters):
+    """Restricts a chunk queryset to the documents matching every given filter (see document_filter)."""
+    if not filters:
+        return chunks
+    return chunks.filter(document_filter(filters))
+
+
+def searchable_chunks(filters=None):
+    """
+    Base queryset: only chunks from documents that have been successfully processed.
+    Uses the chunk's own is_searchable flag: without filters on document fields, searches
+    are single-table scans of the partial HNSW indexes.
+    """
+    return apply_filters(DocumentChunk.objects.filter(is_searchable=True), filters)
+
+
+@contextmanager
+def iterative_index_scan(order):
+    """
+    An HNSW scan stops after hnsw.ef_search candidates (40 by default): when a filter
+    rejects most of them, a filtered query returns fewer than `limit` chunks, or none.
+    pgvector >= 0.8 can continue the scan until enough rows pass the filter
+    (hnsw.iterative_scan, bounded by hnsw.max_scan_tuples). `order` is 'strict_order'
+    or 'relaxed_order' (faster, for results that are re-sorted anyway); the setting is
+    local to the block, so queries must be evaluated inside it.
+    Disabled by settings.KNOWLEDGE_HNSW_ITERATIVE_SCAN=False (older pgvector).
+    """
+    if not getattr(settings, 'KNOWLEDGE_HNSW_ITERATIVE_SCAN', True):
+        yield
+        return
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            # current_setting() is NULL until pgvector is loaded in the session: its default is 'off'
+            "SELECT coalesce(current_setting('hnsw.iterative_scan', true), 'off'), "
+            "set_config('hnsw.iterative_scan', %s, true)", [order])
+        previous = cursor.fetchone()[0]
+        yield
+        # Inside an outer transaction (ATOMIC_REQUESTS, tests) the local setting would outlive this block
+        cursor.execute("SELECT set_config('hnsw.iterative_scan', %s, true)", [previous])
+
+
+def half_distance(question_embedding, version):
+    """Cosine distance on the version's halfvec column, cast like its slot's index expression."""
+    column = Cast(version.columns.half, HalfVectorField(dimensions=version.dimensions))
+    return CosineDistance(column, HalfVector(question_embedding))
+
+
+def binary_distance(question_embedding, version):
+    """Hamming distance on the version's binary column, cast like its slot's index expression."""
+    column = Cast(version.columns.binary, BitField(length=version.dimensions))
+    return HammingDistance(column, binary_quantize(question_embedding))
+
+
+def vector_search(question_embedding, limit, storage=None, filters=None, version=None):
+    """
+    Returns the `limit` chunks nearest to the question embedding (cosine distance), in
+    the slot of `version` (default: the active EmbeddingVersion, whose model encoded the question).
+    """
+    storage = storage or VECTOR_STORAGE
+    version = version or active_embedding_version()
+    if storage == STORAGE_HALF:
+        query = searchable_chunks(filters).order_by(half_distance(question_embedding, version))[:limit]
+        # Filtered, or more chunks than hnsw.ef_search (the re-ranking candidates)
+        with iterative_index_scan('strict_order'):
+            return list(query)
+    if storage == STORAGE_BINARY:
+        return binary_vector_search(question_embedding, limit, filters, version)
+    if storage == STORAGE_SNAPSHOT:
+        return snapshot_vector_search(question_embedding, limit, filters, version)
+    if storage != STORAGE_FULL:
+        raise ValueError(f"Unknown vector storage: {storage}")
+    # No ANN index on `embedding`: an exact scan, which filters only make cheaper
+    return list(
+        searchable_chunks(filters).order_by(
+            CosineDistance(version.columns.full, question_embedding)
+        )[:limit]
+    )
+
+
+def binary_vector_search(question_embedding, limit, filters=None, version=None):
+    """
+    Two-phase search: the binary HNSW index shortlists the closest chunks by Hamming
+    distance, then only that shortlist is rescored with exact cosine distance.
+    """
+    version = version or active_embedding_version()
+    shortlist = searchable_chunks(filters).order_by(
+        binary_distance(question_embedding, version)
+    ).values('id')[:max(limit, BINARY_RESCORE_CANDIDATES)]
+    query = DocumentChunk.objects.filter(id__in=shortlist).order_by(
+        CosineDistance(version.columns.full, question_embedding)
+    )[:limit]
+    # Even unfiltered, the shortlist is longer than hnsw.ef_search (40): without an
+    # iterative scan it would be cut there. It is rescored, its order needn't be exact
+    with iterative_index_scan('relaxed_order'):
+        return list(query)
+
+
+def snapshot_vector_search(question_embedding, limit, filters=None, version=None):
+    """
+    Exact cosine search in the in-process snapshot of the embeddings: no query at all
+    without filters, one on the documents table with them.
+    """
+    from .vector_snapshot import current_snapshot
+
+    document_ids = None
+    if filters:
+        document_ids = set(KnowledgeDocument.objects.filter(
+            document_filter(filters, prefix='')).values_list('id', flat=True))
+    return current_snapshot(version).search(question_embedding, limit, document_ids)
+
+
+def build_lexical_query(question):
+    """
+    Builds an OR-ed full-text query from the question terms.
+    Plain/websearch queries AND every term together, which is far too strict for
+    natural language questions ("Quelle est la fréquence à Singrobo ?").
+    """
+    terms = [term for term in QUERY_TERM_PATTERN.findall(question) if len(term) > 1]
+    if not terms:
+        return None
+    query = SearchQuery(terms[0], config=TEXT_SEARCH_CONFIG)
+    for term in terms[1:]:
+        query |= SearchQuery(term, config=TEXT_SEARCH_CONFIG)
+    return query
+
+
+def lexical_search(question, limit, filters=None):
+    """Returns up to `limit` chunks ranked by Postgres full-text relevance (ts_rank)."""
+    query = build_lexical_query(question)
+    if query is None:
+        return []
+    # The annotation must match the GIN index expression exactly for the index to be used
+    vector = SearchVector('text_content', config=TEXT_SEARCH_CONFIG)
+    return list(
+        searchable_chunks(filters)
+        .annotate(search_vector=vector, rank=SearchRank(vector, query))
+        .filter(search_vector=query)
+        .order_by('-rank')[:limit]
+    )
+
+
+def reciprocal_rank_fusion(ranked_lists, k=RRF_K):
+    """
+    Fuses several ranked lists of chunks with Reciprocal Rank Fusion:
+    score(chunk) = sum over lists of 1 / (k + rank), rank starting at 1.
+    Returns the chunks ordered by fused score (ties keep first-seen order).
+    """
+    scores = {}
+    chunks_by_id = {}
+    for ranked in ranked_lists:
+        for rank, chunk in enumerate(ranked, start=1):
+            chunks_by_id.setdefault(chunk.id, chunk)
+            scores[chunk.id] = scores.get(chunk.id, 0.0) + 1.0 / (k + rank)
+    ordered_ids = sorted(scores, key=lambda chunk_id: scores[chunk_id], reverse=True)
+    return [chunks_by_id[chunk_id] for chunk_id in ordered_ids]
+
+
+def search_chunks(question, question_embedding, top_k, mode=None, filters=None, version=None):
+    """
+    Retrieves the `top_k` most relevant chunks for a question.
+    `mode` is one of RETRIEVAL_MODES and defaults to settings.KNOWLEDGE_RETRIEVAL_MODE.
+    `filters` scopes the search (keys of FILTER_FIELDS, see apply_filters).
+    `version` is the EmbeddingVersion of `question_embedding` (default: the active one).
+    """
+    mode = mode or getattr(settings, 'KNOWLEDGE_RETRIEVAL_MODE', MODE_HYBRID)
+    if mode == MODE_VECTOR:
+        return vector_search(question_embedding, top_k, filters=filters, version=version)
+    if mode == MODE_LEXICAL:
+        return lexical_search(question, top_k, filters)
+    if mode != MODE_HYBRID:
+        raise ValueError(f"Unknown retrieval mode: {mode}")
+
+    candidates = max(top_k, CANDIDATES_PER_LEG)
+    vector_hits = vector_search(question_embedding, candidates, filters=filters, version=version)
+    lexical_hits = lexical_search(question, candidates, filters)
+    logger.debug(
+        f"Hybrid retrieval: {len(vector_hits)} vector hits, {len(lexical_hits)} lexical hits.")
+    return reciprocal_rank_fusion([vector_hits, lexical_hits])[:top_k]
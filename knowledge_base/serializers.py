@@ -7,12 +7,37 @@ class KnowledgeQuerySerializer(serializers.Serializer):
         allow_blank=False,
         help_text="The question to ask the knowledge base."
     )
-    # Optional: Add filters like document IDs, date ranges, etc.
-    # document_ids = serializers.ListField(
-    #     child=serializers.UUIDField(),
-    #     required=False,
-    #     help_text="Optional list of specific document IDs to query."
-    # )
+    conversation_id = serializers.UUIDField(
+        required=False,
+        help_text="Conversation to continue (returned by the previous answer); a new one is started otherwise."
+    )
+    start_conversation = serializers.BooleanField(
+        required=False,
+        help_text="Whether to store a new question as the start of a conversation (default: "
+                  "settings.KNOWLEDGE_CONVERSATION_START). False for one-shot questions: nothing is stored."
+    )
+    # Optional scoping of the search (see retrieval.apply_filters)
+    document_ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        required=False,
+        max_length=100,
+        help_text="Optional list of specific document IDs to query."
+    )
+    category = serializers.CharField(
+        required=False,
+        max_length=50,
+        help_text="Only query documents of this category (e.g. 'programmes')."
+    )
+    tags = serializers.ListField(
+        child=serializers.CharField(max_length=50),
+        required=False,
+        max_length=20,
+        help_text="Only query documents having all of these tags."
+    )
+    valid_on = serializers.DateField(
+        required=False,
+        help_text="Only query documents valid on this date (e.g. the current season's schedule)."
+    )
 
 class KnowledgeAnswerSerializer(serializers.Serializer):
     """Serializer for the generated answer."""
@@ -20,6 +45,11 @@ class KnowledgeAnswerSerializer(serializers.Serializer):
         read_only=True,
         help_text="The answer generated based on the provided documents."
     )
+    conversation_id = serializers.UUIDField(
+        read_only=True,
+        allow_null=True,
+        help_text="Conversation to pass with the next question to keep its context (null for one-shot questions)."
+    )
     # Optional: Include source chunks or metadata for reference
     # source_chunks = serializers.ListField(
     #     child=serializers.CharField(),
@@ -1,8 +1,9 @@
 import logging
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django_q.tasks import async_task
 
+from .faq import queue_regeneration
 from .models import KnowledgeDocument
 
 logger = logging.getLogger(__name__)
@@ -30,4 +31,11 @@ def trigger_document_processing(sender, instance, created, **kwargs):
             'knowledge_base.tasks.process_document', 
             instance.id,
             q_options={'group': f'doc_proc_{instance.id}'} 
-        ) 
\ No newline at end of file
+        ) 
+
+
+@receiver(post_delete, sender=KnowledgeDocument)
+def regenerate_faq_answers_without_document(sender, instance, **kwargs):
+    """FAQ answers may come from a deleted document: answer them again without it."""
+    if instance.status == KnowledgeDocument.Status.COMPLETED:
+        queue_regeneration()
@@ -1,66 +1,55 @@
 import logging
 import os
-from io import BytesIO
+from datetime import timedelta
 
 from django.utils import timezone
 from django.db import transaction
 from django.conf import settings
+from django_q.tasks import async_task
 
-# Text Extraction
-from pypdf import PdfReader
-import docx # python-docx
+# Text extraction (pypdf, python-docx, see extraction.py) and chunking (langchain) libraries are imported
+# inside the functions that use them: this module is imported by the web process and
+# every management command, which should not pay for them at startup.
 
-# Text Chunking
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+# Structured extraction and chunking
+from .chunking import CHUNKER_RECURSIVE, StructuredChunker, split_recursive
+from .extraction_cache import get_extraction
 
-# Embeddings
-from sentence_transformers import SentenceTransformer
+# Embeddings (torch or ONNX Runtime, see embeddings.py), one model per live embedding
+# version while the model is being migrated (see embedding_versions.py)
+from .embeddings import load_embedding_backend
+from .embedding_versions import backfill, writing_versions
+# Binary COPY of the chunks, straight from the embeddings array
+from .bulk_load import copy_chunks
+
+# In-process vector search, rebuilt once a document is processed
+from .retrieval import STORAGE_SNAPSHOT
+from .vector_snapshot import refresh_snapshot
+
+# Precomputed answers, regenerated once the knowledge base changed
+from .faq import queue_regeneration, regenerate_answers
 
 # Models
-from .models import KnowledgeDocument, DocumentChunk
+from .models import Conversation, KnowledgeDocument, DocumentChunk
+from .conversations import fold_turns
+
+from core.instrumentation import span
+from core.task_metrics import measured_task
 
 logger = logging.getLogger(__name__)
 
 # --- Constants ---
-# Choose your embedding model
-# Make sure the model name matches one compatible with sentence-transformers
-# and that its dimensions match DocumentChunk.EMBEDDING_DIMENSIONS
-# e.g., 'all-MiniLM-L6-v2' (384 dims), 'all-mpnet-base-v2' (768 dims)
-EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+# The embedding model and backend are those of the active EmbeddingVersion
+# (EMBEDDING_MODEL_NAME and settings.KNOWLEDGE_EMBEDDING_BACKEND until a migration)
 # Consider loading the model once globally if tasks run in the same process space,
 # but loading per-task ensures isolation, especially with multiple worker types.
 # sentence_model = SentenceTransformer(EMBEDDING_MODEL_NAME) # Potential global load
 
-# Chunking parameters (tune based on your content and embedding model context window)
-CHUNK_SIZE = 1000 # Characters
-CHUNK_OVERLAP = 150 # Characters overlap between chunks
-
-
-def extract_text_from_pdf(file_content):
-    """Extracts text from PDF file content (bytes)."""
-    text = ""
-    try:
-        reader = PdfReader(BytesIO(file_content))
-        for page in reader.pages:
-            text += page.extract_text() or ""
-    except Exception as e:
-        logger.error(f"Error extracting text from PDF: {e}")
-        raise # Re-raise to mark task as failed
-    return text
-
-def extract_text_from_docx(file_content):
-    """Extracts text from DOCX file content (bytes)."""
-    text = ""
-    try:
-        doc = docx.Document(BytesIO(file_content))
-        for para in doc.paragraphs:
-            text += para.text + "\n"
-    except Exception as e:
-        logger.error(f"Error extracting text from DOCX: {e}")
-        raise # Re-raise to mark task as failed
-    return text
+# Chunking (structure-aware and token-sized by default) is configured in chunking.py
+# and settings.KNOWLEDGE_CHUNKER / KNOWLEDGE_CHUNK_*_TOKENS
 
 
+@measured_task
 def process_document(document_id):
     """
     Django-Q task to process an uploaded KnowledgeDocument:
@@ -68,6 +57,8 @@ def process_document(document_id):
     2. Chunks text.
     3. Generates embeddings.
     4. Saves chunks and embeddings to the database.
+    A failure marks the document FAILED and is raised again, so the TaskRun and
+    Django-Q record it too.
     """
     logger.info(f"Starting processing for KnowledgeDocument ID: {document_id}")
     try:
@@ -88,74 +79,155 @@ def process_document(document_id):
     doc.save(update_fields=['status', 'processed_at', 'error_message'])
 
     try:
-        file_content = doc.file.read()
         filename = doc.original_filename.lower()
 
+        chunker = getattr(settings, 'KNOWLEDGE_CHUNKER', 'structured')
+
         # --- 1. Extract Text ---
         logger.info(f"Extracting text from {filename}...")
-        if filename.endswith('.pdf'):
-            extracted_text = extract_text_from_pdf(file_content)
-        elif filename.endswith('.docx'):
-            extracted_text = extract_text_from_docx(file_content)
-        else:
-            raise ValueError(f"Unsupported file type: {doc.original_filename}")
+        with span('extract'):
+            # Cached by content hash: repeat uploads and reprocessing skip the parsing.
+            # The file is streamed, the extractor being picked from its content.
+            with doc.file.open('rb') as file:
+                extraction = get_extraction(file, filename)
+            if extraction.cached:
+                logger.info("Extraction found in cache.")
+            if chunker == CHUNKER_RECURSIVE:
+                extracted_text = extraction.text
+            else:
+                # Headings, paragraphs and tables with their page, in reading order
+                segments = extraction.segments
+                extracted_text = '\n'.join(segment.text for segment in segments)
 
         if not extracted_text.strip():
             raise ValueError("No text could be extracted from the document.")
 
+        # Active version first, then the version being migrated to, if any
+        versions = writing_versions()
+        logger.info(f"Loading embedding models: {', '.join(version.model_name for version in versions)}...")
+        # Load model within the task for better isolation / memory management per task
+        with span('load_model'):
+            # CPU only, torch or ONNX Runtime
+            models = [load_embedding_backend(version.backend, version.model_name) for version in versions]
+            sentence_model = models[0]
+
         # --- 2. Chunk Text ---
-        logger.info("Chunking extracted text...")
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=CHUNK_SIZE,
-            chunk_overlap=CHUNK_OVERLAP,
-            length_function=len,
-        )
-        text_chunks = text_splitter.split_text(extracted_text)
+        logger.info(f"Chunking extracted text ({chunker})...")
+        with span('chunk'):
+            if chunker == CHUNKER_RECURSIVE:
+                text_chunks = split_recursive(extracted_text)
+                chunk_metadata = [{'chunk_index': i} for i in range(len(text_chunks))]
+            else:
+                # Sized with the active model's tokenizer so no chunk is truncated when embedded
+                chunks = StructuredChunker(sentence_model.count_tokens).split(segments)
+                text_chunks = [chunk.text for chunk in chunks]
+                chunk_metadata = [chunk.metadata for chunk in chunks]
         logger.info(f"Created {len(text_chunks)} text chunks.")
 
         if not text_chunks:
              raise ValueError("Text splitting resulted in zero chunks.")
 
         # --- 3. Generate Embeddings ---
-        logger.info(f"Loading embedding model: {EMBEDDING_MODEL_NAME}...")
-        # Load model within the task for better isolation / memory management per task
-        sentence_model = SentenceTransformer(EMBEDDING_MODEL_NAME, device='cpu') # Force CPU if GPU issues arise
         logger.info("Generating embeddings for chunks...")
-        embeddings = sentence_model.encode(text_chunks, show_progress_bar=False) # Set True for debug if needed
+        with span('embed'):
+            embeddings = {version.slot: model.encode(text_chunks) for version, model in zip(versions, models)}
 
         # --- 4. Save Chunks ---
         # Delete old chunks first if reprocessing is allowed
         # DocumentChunk.objects.filter(document=doc).delete()
 
-        logger.info("Saving document chunks and embeddings...")
-        chunks_to_create = []
-        for i, chunk_text in enumerate(text_chunks):
-            chunk = DocumentChunk(
-                document=doc,
-                text_content=chunk_text,
-                embedding=embeddings[i].tolist(), # Convert numpy array to list for DB
-                # Add metadata if needed, e.g., chunk index or page number if available
-                # metadata={'chunk_index': i}
-            )
-            chunks_to_create.append(chunk)
-
-        # Use transaction.atomic to ensure all chunks are saved or none are
-        with transaction.atomic():
-            # Clear existing chunks if this is a re-processing run
-            # Be careful with this if multiple tasks could run for the same doc
-            # Consider adding a check or locking mechanism if necessary
-            DocumentChunk.objects.filter(document=doc).delete()
-            DocumentChunk.objects.bulk_create(chunks_to_create, batch_size=100) # Adjust batch_size as needed
-
-        doc.status = KnowledgeDocument.Status.COMPLETED
-        doc.processed_at = timezone.now()
-        doc.error_message = None
-        doc.save(update_fields=['status', 'processed_at', 'error_message'])
+        with span('save'):
+            logger.info("Saving document chunks and embeddings...")
+            # Use transaction.atomic to ensure all chunks are saved or none are
+            with transaction.atomic():
+                # Clear existing chunks if this is a re-processing run
+                # Be careful with this if multiple tasks could run for the same doc
+                # Consider adding a check or locking mechanism if necessary
+                DocumentChunk.objects.filter(document=doc).delete()
+                # All three embedding columns (full, half, binary) of each version's slot and the
+                # metadata (position, pages and heading path of each chunk) are streamed with one
+                # binary COPY. Chunks are published with the COMPLETED status below, in the same transaction.
+                copy_chunks(doc, text_chunks, embeddings, chunk_metadata, is_searchable=True)
+                # A migration started (or was restarted) since the models were loaded: its
+                # backfill embeds these chunks. Activation waits for this transaction.
+                written = {version.slot: version for version in versions}
+                for version in writing_versions():
+                    previous = written.get(version.slot)
+                    if previous is not None and previous.embeds_like(version):
+                        continue
+                    if previous is not None:
+                        # Another model's vectors
+                        doc.chunks.update(**{column: None for column in version.columns[:3]})
+                    transaction.on_commit(
+                        lambda version_id=version.pk: async_task('knowledge_base.tasks.reembed_chunks', version_id))
+
+                # Searches see either the old chunks or all the new ones, never a mix
+                doc.status = KnowledgeDocument.Status.COMPLETED
+                doc.processed_at = timezone.now()
+                doc.error_message = None
+                doc.save(update_fields=['status', 'processed_at', 'error_message'])
+                queue_regeneration()
         logger.info(f"Successfully processed KnowledgeDocument ID: {document_id}")
+        if getattr(settings, 'KNOWLEDGE_VECTOR_STORAGE', 'full') == STORAGE_SNAPSHOT:
+            refresh_vector_snapshot()
 
     except Exception as e:
         logger.exception(f"Failed processing KnowledgeDocument ID: {document_id}", exc_info=True)
         doc.status = KnowledgeDocument.Status.FAILED
         doc.processed_at = timezone.now()
         doc.error_message = str(e)
-        doc.save(update_fields=['status', 'processed_at', 'error_message']) 
\ No newline at end of file
+        doc.save(update_fields=['status', 'processed_at', 'error_message'])
+        raise
+
+def refresh_vector_snapshot():
+    """
+    Builds the snapshot including the document just processed, so the web workers
+    load it instead of building it on a request. A failure only delays the update.
+    """
+    try:
+        with span('snapshot'):
+            refresh_snapshot()
+    except Exception:
+        logger.warning("Could not refresh the vector snapshot, the web workers will build it.", exc_info=True)
+
+
+@measured_task
+def summarize_conversation(conversation_id):
+    """
+    Django-Q task folding the older turns of a conversation into its rolling summary,
+    queued by the query view when the turns outgrow the prompt budget.
+    """
+    if fold_turns(conversation_id):
+        logger.info(f"Summarised conversation {conversation_id}.")
+
+
+@measured_task
+def reembed_chunks(version_id):
+    """
+    Django-Q task embedding the chunks with a new EmbeddingVersion's model (see
+    embedding_versions.backfill), then activating it. Runs for at most
+    settings.KNOWLEDGE_REEMBED_TASK_SECONDS, below the cluster timeout, and queues
+    itself again while chunks remain.
+    """
+    time_budget = getattr(settings, 'KNOWLEDGE_REEMBED_TASK_SECONDS', 60)
+    if backfill(version_id, time_budget=time_budget):
+        async_task('knowledge_base.tasks.reembed_chunks', version_id)
+
+
+@measured_task
+def regenerate_faq_answers():
+    """
+    Django-Q task answering again the FAQ entries answered from an older knowledge base
+    (see faq.regenerate_answers). Runs for at most settings.KNOWLEDGE_FAQ_TASK_SECONDS,
+    below the cluster timeout, and queues itself again while entries remain.
+    """
+    if regenerate_answers(time_budget=getattr(settings, 'KNOWLEDGE_FAQ_TASK_SECONDS', 60)):
+        async_task('knowledge_base.tasks.regenerate_faq_answers')
+
+
+# Periodic task, to schedule daily via the Django Q admin
+def prune_conversations_task():
+    """Deletes conversations idle for more than settings.KNOWLEDGE_CONVERSATION_RETENTION_DAYS."""
+    days = getattr(settings, 'KNOWLEDGE_CONVERSATION_RETENTION_DAYS', 30)
+    deleted, _ = Conversation.objects.filter(updated_at__lt=timezone.now() - timedelta(days=days)).delete()
+    logger.info(f"Deleted {deleted} conversation rows idle for more than {days} days.")
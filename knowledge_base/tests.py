@@ -1,3 +1,1129 @@
-from django.test import TestCase
+import datetime
+import hashlib
+import importlib.util
+import re
+import tarfile
+import tempfile
+import threading
+import time
+import uuid
+from io import BytesIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import TaskRun
+
+from .archive import export_knowledge_base, import_knowledge_base
+from .bulk_load import copy_chunks, create_chunks
+from .chunking import StructuredChunker
+from .coalescing import SingleFlight, coalesce_key, knowledge_base_version
+from .conversations import fold_turns, prompt_history, record_turn
+from .embedding_versions import (
+    activate, active_embedding_version, backfill, clear_version_cache, start_migration, writing_versions)
+from .embeddings import (
+    ONNX_TOKENIZER_FILENAME, OnnxBackend, binary_quantize, QueryEncoder, SentenceTransformerBackend, warm_up)
+from .extraction import HEADING, PARAGRAPH, TABLE, Segment, detect_extractor, extract_segments
+from .extraction_cache import content_hash, get_extraction
+from .faq import clear_index_cache, match_faq, mine_questions, queue_regeneration, regenerate_answers, stale_entries
+from .models import (
+    SLOT_BLUE, SLOT_GREEN, Conversation, DocumentChunk, EmbeddingVersion, ExtractedContent, FaqEntry, KnowledgeDocument)
+from .reranking import rerank
+from .tasks import process_document
+from .vector_snapshot import clear_snapshot_cache, current_snapshot, refresh_snapshot
+from .retrieval import (
+    STORAGE_BINARY, STORAGE_FULL, STORAGE_HALF, STORAGE_SNAPSHOT, VECTOR_STORAGES, binary_distance, half_distance, lexical_search,
+    reciprocal_rank_fusion, searchable_chunks, vector_search)
+
+
+def make_document(status=KnowledgeDocument.Status.COMPLETED, name='grille.pdf', **fields):
+    return KnowledgeDocument.objects.create(
+        file=f'knowledge_base/{name}', original_filename=name, status=status, **fields)
+
+
+def make_chunk(document, text, embedding=None):
+    embedding = embedding or [0.1] * DocumentChunk.EMBEDDING_DIMENSIONS
+    return DocumentChunk.objects.create(
+        document=document,
+        text_content=text,
+        embedding=embedding,
+        embedding_half=embedding,
+        embedding_binary=binary_quantize(np.array(embedding)),
+        is_searchable=document.status == KnowledgeDocument.Status.COMPLETED,
+    )
+
+
+class ReciprocalRankFusionTests(SimpleTestCase):
+    def test_chunks_ranked_by_both_legs_come_first(self):
+        a, b, c = (SimpleNamespace(id=name) for name in 'abc')
+        fused = reciprocal_rank_fusion([[a, b], [c, b]], k=60)
+        self.assertEqual([chunk.id for chunk in fused], ['b', 'a', 'c'])
+
+
+class LexicalSearchTests(TestCase):
+    def test_exact_frequency_and_town_match(self):
+        doc = make_document()
+        match = make_chunk(doc, "FER FM émet à Singrobo sur 106.9 MHz.")
+        make_chunk(doc, "Autoroute Matin, de 6h à 11h.")
+
+        self.assertEqual(lexical_search("Fréquence à Singrobo ?", 5), [match])
+        self.assertEqual(lexical_search("106.9", 5), [match])
+
+    def test_only_completed_documents_are_searched(self):
+        pending = make_document(status=KnowledgeDocument.Status.PENDING)
+        make_chunk(pending, "FER FM émet à Tiébissou sur 99.6 MHz.")
+
+        self.assertEqual(lexical_search("Tiébissou", 5), [])
+
+
+def unit_vector(rng, near=None, noise=0.1):
+    vector = rng.standard_normal(DocumentChunk.EMBEDDING_DIMENSIONS)
+    if near is not None:
+        vector = near + noise * vector / np.linalg.norm(vector)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def use_temporary_snapshot_dir(test):
+    """Test documents have no processed_at, so snapshots of other tests can have the same stamp."""
+    directory = test.enterContext(tempfile.TemporaryDirectory())
+    test.enterContext(override_settings(KNOWLEDGE_VECTOR_SNAPSHOT_DIR=directory))
+    clear_snapshot_cache()
+    test.addCleanup(clear_snapshot_cache)
+
+
+class ScopedRetrievalTests(TestCase):
+    def setUp(self):
+        use_temporary_snapshot_dir(self)
+        rng = np.random.default_rng(0)
+        self.query = np.array(unit_vector(rng))
+        self.general = make_document(name='general.pdf', category='General', tags=['FER FM'])
+        self.schedule = make_document(
+            name='grille.pdf', category='programmes', tags=['saison-2026', 'abidjan'],
+            valid_from=datetime.date(2026, 9, 1), valid_until=datetime.date(2027, 6, 30))
+        # General chunks crowd the neighbourhood of the query, the schedule's are further away
+        for index in range(150):
+            make_chunk(self.general, f"Général {index}", unit_vector(rng, self.query, noise=0.3))
+        for index in range(8):
+            make_chunk(self.schedule, f"Grille {index}", unit_vector(rng, self.query, noise=3.0))
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE knowledge_base_documentchunk")
+
+    def search(self, storage, **filters):
+        return vector_search(self.query.tolist(), 5, storage=storage, filters=filters)
+
+    def test_filters_restrict_every_storage(self):
+        for storage in VECTOR_STORAGES:
+            with self.subTest(storage=storage):
+                for filters in ({'category': 'Programmes'}, {'tags': ['Abidjan', 'saison-2026']},
+                                {'document_ids': [self.schedule.id]}):
+                    chunks = self.search(storage, **filters)
+                    self.assertEqual(len(chunks), 5)
+                    self.assertEqual({chunk.document_id for chunk in chunks}, {self.schedule.id})
+                self.assertEqual(self.search(storage, tags=['abidjan', 'bouake']), [])
+                self.assertEqual({chunk.document_id for chunk in self.search(storage, category='general')},
+                                 {self.general.id})
+
+    def test_validity_period(self):
+        in_season = self.search(STORAGE_HALF, category='programmes', valid_on=datetime.date(2026, 10, 19))
+        off_season = self.search(STORAGE_HALF, category='programmes', valid_on=datetime.date(2027, 8, 1))
+
+        self.assertEqual(len(in_season), 5)
+        self.assertEqual(off_season, [])
+        # Documents without a validity period are always in scope
+        self.assertEqual(len(self.search(STORAGE_HALF, valid_on=datetime.date(2027, 8, 1))), 5)
+
+    def test_unfiltered_search_is_a_single_table_ann_scan(self):
+        version = active_embedding_version()
+        queries = {
+            STORAGE_HALF: searchable_chunks().order_by(half_distance(self.query.tolist(), version))[:5],
+            STORAGE_BINARY: searchable_chunks().order_by(binary_distance(self.query, version))[:100],
+        }
+        with connection.cursor() as cursor:
+            # A table this small is cheaper to sort: make the planner consider the indexes
+            cursor.execute("SET enable_sort = off")
+        try:
+            for storage, query in queries.items():
+                with self.subTest(storage=storage):
+                    plan = query.explain()
+                    self.assertIn('Index Scan using chunk_embedding_', plan)
+                    self.assertNotIn('knowledge_base_knowledgedocument', plan)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("RESET enable_sort")
+
+    def test_chunks_follow_their_document_status(self):
+        self.schedule.status = KnowledgeDocument.Status.PROCESSING
+        self.schedule.save(update_fields=['status'])
+        self.assertFalse(self.schedule.chunks.filter(is_searchable=True).exists())
+        self.assertEqual(self.search(STORAGE_HALF, category='programmes'), [])
+
+        self.schedule.status = KnowledgeDocument.Status.COMPLETED
+        self.schedule.save()
+        self.assertEqual(self.schedule.chunks.filter(is_searchable=False).count(), 0)
+
+    def test_iterative_scan_finds_chunks_beyond_ef_search(self):
+        with connection.cursor() as cursor:
+            # Force the HNSW indexes, and make them stop early without iterative scans
+            cursor.execute("SET enable_sort = off")
+            cursor.execute("SET hnsw.ef_search = 10")
+        try:
+            for storage in (STORAGE_HALF, STORAGE_BINARY):
+                with self.subTest(storage=storage):
+                    self.assertEqual(len(self.search(storage, category='programmes')), 5)
+                    with override_settings(KNOWLEDGE_HNSW_ITERATIVE_SCAN=False):
+                        self.assertLess(len(self.search(storage, category='programmes')), 5)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("RESET enable_sort")
+                cursor.execute("RESET hnsw.ef_search")
+
+
+class QuantizedStorageTests(TestCase):
+    """The halfvec and binary columns against full precision, on a seeded corpus."""
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.query = np.array(unit_vector(rng))
+        document = make_document()
+        # A few relevant chunks, at increasing distances, among many unrelated ones
+        self.embeddings = [unit_vector(rng, self.query, noise=0.2 + 0.05 * index) for index in range(10)]
+        self.embeddings += [unit_vector(rng, self.query, noise=3.0) for _ in range(290)]
+        self.chunks = [make_chunk(document, f"Chunk {index}", embedding)
+                       for index, embedding in enumerate(self.embeddings)]
+
+    def search(self, storage, limit=10):
+        return [chunk.pk for chunk in vector_search(self.query.tolist(), limit, storage=storage)]
+
+    def test_binary_quantize_matches_pgvector(self):
+        rng = np.random.default_rng(0)
+        vectors = [rng.standard_normal(16), np.zeros(16), np.array([-1.0, 0.0, 1e-9, -1e-9] * 4)]
+        with connection.cursor() as cursor:
+            for vector in vectors:
+                cursor.execute("SELECT binary_quantize(%s::vector)::text", [str(vector.tolist())])
+                self.assertEqual(binary_quantize(vector), cursor.fetchone()[0])
+            # And the stored column, bit for bit
+            cursor.execute("SELECT count(*) FROM knowledge_base_documentchunk "
+                           "WHERE binary_quantize(embedding)::varbit IS DISTINCT FROM embedding_binary")
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_halfvec_storage_keeps_the_full_precision_ranking(self):
+        stored = DocumentChunk.objects.values_list('embedding_half', flat=True).get(pk=self.chunks[0].pk)
+        np.testing.assert_allclose(stored, self.embeddings[0], atol=1e-3)
+        self.assertEqual(self.search(STORAGE_HALF), [chunk.pk for chunk in self.chunks[:10]])
+        with connection.cursor() as cursor:
+            cursor.execute("SET enable_sort = off")  # Force the HNSW index
+        try:
+            # More chunks than hnsw.ef_search, as many re-ranking candidates
+            self.assertEqual(len(self.search(STORAGE_HALF, 60)), 60)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("RESET enable_sort")
+
+    def test_binary_shortlist_is_rescored_at_full_precision(self):
+        exact = self.search(STORAGE_FULL)
+        self.assertEqual(exact, [chunk.pk for chunk in self.chunks[:10]])
+        self.assertEqual(self.search(STORAGE_BINARY), exact)
+        with connection.cursor() as cursor:
+            # Force the HNSW index: its scans stop after hnsw.ef_search (40) candidates
+            cursor.execute("SET enable_sort = off")
+        try:
+            self.assertEqual(self.search(STORAGE_BINARY), exact)
+            # The whole shortlist is rescored, not just the first ef_search candidates
+            self.assertEqual(len(self.search(STORAGE_BINARY, 60)), 60)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("RESET enable_sort")
+
+
+class FakeCrossEncoder:
+    """Scores pairs by text length, optionally sleeping to simulate a slow CPU."""
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def predict(self, pairs, **kwargs):
+        time.sleep(self.delay)
+        return [len(text) for _, text in pairs]
+
+
+class RerankTests(SimpleTestCase):
+    chunks = [SimpleNamespace(text_content=text) for text in ('a', 'ccc', 'bb')]
+
+    def test_candidates_are_reordered_by_cross_encoder_score(self):
+        with mock.patch('knowledge_base.reranking.get_reranker', return_value=FakeCrossEncoder()):
+            ranked = rerank("question", self.chunks, top_n=2, budget_ms=1000)
+        self.assertEqual([chunk.text_content for chunk in ranked], ['ccc', 'bb'])
+
+    def test_original_ranking_is_kept_when_budget_is_exceeded(self):
+        with mock.patch('knowledge_base.reranking.get_reranker', return_value=FakeCrossEncoder(delay=0.2)):
+            ranked = rerank("question", self.chunks, top_n=1, fallback_k=2, budget_ms=20)
+        self.assertEqual([chunk.text_content for chunk in ranked], ['a', 'ccc'])
+
+    def test_model_loading_does_not_count_against_the_budget(self):
+        def load():
+            time.sleep(0.2)
+            return FakeCrossEncoder()
+
+        with mock.patch('knowledge_base.reranking.get_reranker', side_effect=load):
+            ranked = rerank("question", self.chunks, top_n=2, budget_ms=100)
+        self.assertEqual([chunk.text_content for chunk in ranked], ['ccc', 'bb'])
+
+
+@skipUnless(importlib.util.find_spec('onnxruntime'), "onnxruntime is not installed")
+@skipUnless(
+    (Path(settings.KNOWLEDGE_ONNX_MODEL_DIR) / ONNX_TOKENIZER_FILENAME).exists(),
+    "ONNX model not exported (python manage.py export_onnx_embedding_model)")
+class OnnxBackendParityTests(SimpleTestCase):
+    sentences = [
+        "Quelle est la fréquence de FER FM à Singrobo ?",
+        "Autoroute Matin, de 6h à 11h.",
+        "Info trafic : ralentissements sur l'autoroute du nord.",
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reference = SentenceTransformerBackend().encode(cls.sentences)
+
+    def assert_cosine_agreement(self, backend, minimum):
+        embeddings = backend.encode(self.sentences)
+        self.assertEqual(embeddings.shape, self.reference.shape)
+        # Both sides are L2-normalised, so the row-wise dot product is the cosine similarity
+        cosines = np.sum(embeddings * self.reference, axis=1)
+        self.assertGreater(cosines.min(), minimum)
+
+    def test_fp32_export_matches_torch_model(self):
+        self.assert_cosine_agreement(OnnxBackend(quantized=False), 0.999)
+
+    def test_int8_export_stays_close_to_torch_model(self):
+        self.assert_cosine_agreement(OnnxBackend(quantized=True), 0.98)
+
+
+class FakeEmbeddingBackend:
+    """Records the batches it is asked to encode."""
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+
+    def encode(self, texts, batch_size=32):
+        self.calls.append(list(texts))
+        time.sleep(self.delay)
+        return np.array([[float(len(text)), 1.0] for text in texts], dtype=np.float32)
+
+
+class QueryEncoderTests(SimpleTestCase):
+    def test_repeated_question_is_served_from_cache(self):
+        backend = FakeEmbeddingBackend()
+        encoder = QueryEncoder(backend, cache_size=10, max_batch_size=8, max_wait_ms=1)
+
+        first = encoder.encode("Fréquence à Singrobo ?")
+        second = encoder.encode("Fréquence  à Singrobo ? ")
+
+        np.testing.assert_array_equal(first, second)
+        self.assertEqual(len(backend.calls), 1)
+        self.assertEqual(encoder.stats()['cache_hits'], 1)
+
+    def test_concurrent_questions_are_encoded_in_one_batch(self):
+        backend = FakeEmbeddingBackend()
+        encoder = QueryEncoder(backend, cache_size=0, max_batch_size=16, max_wait_ms=200)
+        questions = [f"question {i}" for i in range(8)]
+        results = {}
+        barrier = threading.Barrier(len(questions))
+
+        def ask(question):
+            barrier.wait()
+            results[question] = encoder.encode(question)
+
+        threads = [threading.Thread(target=ask, args=(q,)) for q in questions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), len(questions))
+        self.assertEqual(len(backend.calls), 1)
+        self.assertEqual(encoder.stats()['max_batch_size'], len(questions))
+        self.assertEqual(results["question 3"][0], len("question 3"))
+
+    def test_warm_up_starts_no_thread(self):
+        backend = FakeEmbeddingBackend()
+        encoder = QueryEncoder(backend)
+        version = SimpleNamespace(model_name='all-MiniLM-L6-v2', backend='torch')
+        with mock.patch('knowledge_base.embedding_versions.active_embedding_version', return_value=version), \
+                mock.patch('knowledge_base.embeddings.get_query_encoder', return_value=encoder):
+            warm_up()
+        self.assertEqual(backend.calls, [["FER FM"]])
+        # Threads don't survive the fork of the gunicorn workers
+        self.assertIsNone(encoder._worker)
+
+    def test_stuck_encoding_times_out(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        backend = FakeEmbeddingBackend()
+        backend.encode = lambda texts, batch_size=32: release.wait() and None
+        encoder = QueryEncoder(backend, cache_size=0, max_wait_ms=1, timeout=0.2)
+        started = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            encoder.encode("Fréquence à Singrobo ?")
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_pending_questions_fail_when_the_batcher_dies(self):
+        backend = FakeEmbeddingBackend()
+        encoder = QueryEncoder(backend, cache_size=0, max_wait_ms=1, timeout=30)
+        with mock.patch.object(backend, 'encode', side_effect=SystemExit):
+            started = time.monotonic()
+            with self.assertRaises(RuntimeError):
+                encoder.encode("Fréquence à Singrobo ?")
+            self.assertLess(time.monotonic() - started, 5)
+        # The next question starts a new batcher
+        self.assertEqual(encoder.encode("Fréquence à Bouaké ?")[0], len("Fréquence à Bouaké ?"))
+
+
+def count_words(texts):
+    return [len(text.split()) for text in texts]
+
+
+class StructuredChunkerTests(SimpleTestCase):
+    def chunker(self, **kwargs):
+        options = {'max_tokens': 40, 'overlap_tokens': 6, 'min_tokens': 5, **kwargs}
+        return StructuredChunker(count_words, **options)
+
+    def test_chunks_follow_sections_and_carry_heading_path(self):
+        segments = [
+            Segment(HEADING, "Fréquences", 1, 1),
+            Segment(HEADING, "Abidjan", 2, 1),
+            Segment(PARAGRAPH, "FER FM émet à Abidjan sur 101.3 MHz dans tout le district.", None, 1),
+            Segment(HEADING, "Bouaké", 2, 2),
+            Segment(PARAGRAPH, "FER FM émet à Bouaké sur 98.7 MHz depuis le relais régional.", None, 2),
+        ]
+        chunks = self.chunker().split(segments)
+
+        self.assertEqual(len(chunks), 2)
+        self.assertTrue(chunks[0].text.startswith("Fréquences > Abidjan\n\n"))
+        self.assertNotIn("Bouaké", chunks[0].text)
+        self.assertEqual(chunks[1].metadata['headings'], ["Fréquences", "Bouaké"])
+        self.assertEqual(chunks[1].metadata['pages'], [2])
+        self.assertEqual([chunk.metadata['chunk_index'] for chunk in chunks], [0, 1])
+
+    def test_small_section_is_merged_with_the_next_one(self):
+        segments = [
+            Segment(HEADING, "Contact", 1, None),
+            Segment(PARAGRAPH, "Écrivez-nous.", None, None),
+            Segment(HEADING, "Studio", 1, None),
+            Segment(PARAGRAPH, "Le studio est ouvert du lundi au vendredi.", None, None),
+        ]
+        chunks = self.chunker().split(segments)
+
+        self.assertEqual(len(chunks), 1)
+        self.assertIn("Écrivez-nous.\n\nStudio\n\nLe studio", chunks[0].text)
+
+    def test_long_paragraph_is_split_within_budget_with_overlap(self):
+        sentences = [f"Phrase numéro {i} du long paragraphe sur la grille." for i in range(20)]
+        segments = [Segment(HEADING, "Grille", 1, None), Segment(PARAGRAPH, ' '.join(sentences), None, None)]
+        chunks = self.chunker(overlap_tokens=10).split(segments)
+
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            # Budget includes the model's two special tokens
+            self.assertLessEqual(count_words([chunk.text])[0], 40 - 2)
+            self.assertEqual(chunk.metadata['tokens'], count_words([chunk.text])[0])
+        # The last sentence of a chunk starts the next one
+        last_sentence = chunks[0].text.rsplit('. ', 1)[-1]
+        self.assertIn(last_sentence, chunks[1].text)
+        self.assertIn(sentences[0] + ' ' + sentences[1], chunks[0].text)
+
+
+def make_pdf(pages):
+    from reportlab.pdfgen import canvas
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer)
+    for lines in pages:
+        for index, line in enumerate(lines):
+            pdf.drawString(72, 750 - 20 * index, line)
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+class ExtractionCacheTests(TestCase):
+    def test_same_content_is_parsed_once(self):
+        content = make_pdf([["GRILLE DES PROGRAMMES", "Le matin, Autoroute Matin de 6h a 9h."]])
+
+        first = get_extraction(content, "grille.pdf")
+        with mock.patch('knowledge_base.extraction.pdf_pages') as pdf_pages:
+            second = get_extraction(content, "grille-copie.PDF")
+
+        pdf_pages.assert_not_called()
+        self.assertFalse(first.cached)
+        self.assertTrue(second.cached)
+        self.assertEqual(second.text, first.text)
+        self.assertEqual(second.segments, first.segments)
+        self.assertEqual(second.segments[0], Segment(HEADING, "GRILLE DES PROGRAMMES", 1, 1))
+        self.assertEqual(ExtractedContent.objects.get().hits, 1)
+
+    @override_settings(KNOWLEDGE_EXTRACTION_CACHE_MAX_MB=0.001)  # About 1 KB
+    def test_least_recently_used_entries_are_evicted(self):
+        contents = [make_pdf([[f"Document {i}", "x" * 60] for _ in range(3)]) for i in range(3)]
+        for content in contents:
+            get_extraction(content, "document.pdf")
+        get_extraction(contents[0], "document.pdf")  # Oldest entry used again
+
+        self.assertLessEqual(sum(ExtractedContent.objects.values_list('size_bytes', flat=True)), 1048)
+        self.assertTrue(get_extraction(contents[0], "document.pdf").cached)
+        self.assertFalse(ExtractedContent.objects.filter(
+            content_hash=content_hash(BytesIO(contents[1]), 'pdf')).exists())
+
+    def test_text_is_cached_per_extractor(self):
+        content = "Ville,Fréquence\nBouaké,98.9\n".encode()
+
+        as_csv = get_extraction(content, "frequences.csv")
+        as_text = get_extraction(content, "frequences.txt")
+
+        self.assertFalse(as_text.cached)
+        self.assertEqual(as_csv.segments[0].text, "Ville: Bouaké | Fréquence: 98.9")
+        self.assertEqual(as_text.segments[0].text, "Ville,Fréquence\nBouaké,98.9")
+        self.assertEqual(get_extraction(content, "copie.csv").segments, as_csv.segments)
+
+
+class ProcessDocumentTests(TestCase):
+    def test_failure_is_recorded_on_the_document_and_the_task_run(self):
+        document = make_document(status=KnowledgeDocument.Status.PENDING, name='missing.pdf')
+
+        with self.assertRaises(FileNotFoundError):
+            process_document(document.id)
+
+        document.refresh_from_db()
+        self.assertEqual(document.status, KnowledgeDocument.Status.FAILED)
+        self.assertTrue(document.error_message)
+        run = TaskRun.objects.get(func='knowledge_base.tasks.process_document')
+        self.assertEqual(run.status, TaskRun.Status.FAILED)
+        self.assertIn('FileNotFoundError', run.error)
+
+
+class ExtractorRegistryTests(SimpleTestCase):
+    def test_type_is_sniffed_from_content_then_extension(self):
+        pdf = make_pdf([["Grille"]])
+        html = b"\xef\xbb\xbf  <!DOCTYPE html><html><body><p>Accueil</p></body></html>"
+
+        self.assertEqual(detect_extractor(BytesIO(pdf), "upload").kind, 'pdf')
+        self.assertEqual(detect_extractor(BytesIO(html), "index.php").kind, 'html')
+        self.assertEqual(detect_extractor(BytesIO(b"# Titre"), "notes.md").kind, 'markdown')
+        self.assertEqual(detect_extractor(BytesIO(b"a,b"), "grille.csv").kind, 'csv')
+        self.assertEqual(detect_extractor(BytesIO(b"Bonjour"), "LISEZMOI").kind, 'text')
+        with self.assertRaises(ValueError):
+            detect_extractor(BytesIO(b"<p>not a pdf</p>"), "grille.pdf")
+        with self.assertRaises(ValueError):
+            detect_extractor(BytesIO(b"\x89PNG\r\n\x1a\n\x00\x00"), "logo.png")
+
+    def test_html_page(self):
+        html = (
+            "<html><head><title>FER FM</title><style>p {color: red}</style></head><body>"
+            "<nav><a href='/'>Accueil</a></nav><h2>Fréquences</h2><p>FER FM &eacute;met sur <b>101.3</b> MHz.</p>"
+            "<ul><li>Abidjan</li><li>Bouaké</li></ul>"
+            "<table><tr><th>Ville</th><th>MHz</th></tr><tr><td>Abidjan</td><td>101.3</td></tr></table>"
+            "<footer>© FER FM</footer></body></html>"
+        ).encode()
+
+        self.assertEqual(list(extract_segments(html, "frequences.html")), [
+            Segment(HEADING, "Fréquences", 2, None),
+            Segment(PARAGRAPH, "FER FM émet sur 101.3 MHz.", None, None),
+            Segment(PARAGRAPH, "Abidjan\nBouaké", None, None),
+            Segment(TABLE, "Ville | MHz\nAbidjan | 101.3", None, None),
+        ])
+
+    def test_csv_schedule_rows_keep_their_columns_and_row_numbers(self):
+        schedule = "Jour;Heure;Émission\nLundi;06:00;Autoroute Matin\n;;\nMardi;07:00;Le Journal\n".encode('cp1252')
+
+        segments = list(extract_segments(schedule, "grille.csv"))
+        chunks = StructuredChunker(count_words, max_tokens=40, overlap_tokens=0, min_tokens=0).split(iter(segments))
+
+        self.assertEqual(segments[0], Segment(TABLE, "Jour: Lundi | Heure: 06:00 | Émission: Autoroute Matin",
+                                              None, None, {'row': 1}))
+        self.assertEqual(segments[1].metadata, {'row': 3})
+        self.assertEqual(chunks[0].metadata['rows'], [1, 3])
+
+
+@override_settings(KNOWLEDGE_CONVERSATION_HISTORY_TOKENS=400, KNOWLEDGE_CONVERSATION_RECENT_TURNS=4)
+class ConversationTests(TestCase):
+    def ask(self, conversation, count, answer_words=60):
+        for i in range(count):
+            record_turn(conversation, f"Question {i} ?", None, ' '.join(['réponse'] * answer_words))
+
+    def test_prompt_history_stays_within_budget(self):
+        conversation = Conversation.objects.create()
+        self.ask(conversation, 20)
+
+        summary, history = prompt_history(conversation)
+
+        self.assertEqual(summary, '')
+        self.assertEqual([question for question, _ in history], ["Question 17 ?", "Question 18 ?", "Question 19 ?"])
+        self.assertLessEqual(sum(len(q) + len(a) for q, a in history) / 4, 400)
+
+    def test_older_turns_are_folded_into_the_summary(self):
+        conversation = Conversation.objects.create()
+        self.ask(conversation, 2, answer_words=40)
+        self.assertTrue(record_turn(conversation, "Et à Bouaké ?", None, ' '.join(['réponse'] * 150)))
+
+        with mock.patch('services.gemini_service.summarize_conversation', return_value="Vit à Yamoussoukro.") as summarize:
+            self.assertTrue(fold_turns(conversation.pk))
+        # The last KEEP_RECENT_TURNS turns stay verbatim
+        self.assertEqual([question for question, _ in summarize.call_args.args[1]], ["Question 0 ?"])
+
+        conversation.refresh_from_db()
+        summary, history = prompt_history(conversation)
+        self.assertEqual(summary, "Vit à Yamoussoukro.")
+        self.assertEqual(conversation.summarized_through, 1)
+        self.assertEqual([question for question, _ in history], ["Question 1 ?", "Et à Bouaké ?"])
+
+    def test_summary_computed_on_a_stale_conversation_is_dropped(self):
+        conversation = Conversation.objects.create()
+        self.ask(conversation, 4)
+
+        def summarize_concurrently(*args):
+            Conversation.objects.filter(pk=conversation.pk).update(summary="Autre résumé", summarized_through=2)
+            return "Résumé périmé"
+
+        with mock.patch('services.gemini_service.summarize_conversation', side_effect=summarize_concurrently):
+            self.assertFalse(fold_turns(conversation.pk))
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.summary, "Autre résumé")
+
+    @mock.patch('knowledge_base.views.async_task')
+    @mock.patch('knowledge_base.views.generate_answer', return_value="Sur 98.9 FM.")
+    @mock.patch('knowledge_base.views.condense_question', return_value="Quelle est la fréquence de FER FM à Bouaké ?")
+    @mock.patch('knowledge_base.views.search_chunks', return_value=[])
+    @mock.patch('knowledge_base.views.get_query_encoder')
+    def test_follow_up_is_condensed_for_retrieval(self, get_encoder, search, condense, generate, enqueue):
+        url = reverse('knowledge_base:query_knowledge')
+        first = self.client.post(url, {"question": "Fréquence à Abidjan ?"}, content_type='application/json')
+        conversation_id = first.json()['conversation_id']
+        condense.assert_not_called()
+
+        self.client.post(url, {"question": "Et à Bouaké ?", "conversation_id": conversation_id},
+                         content_type='application/json')
+
+        self.assertEqual(search.call_args.args[0], "Quelle est la fréquence de FER FM à Bouaké ?")
+        self.assertEqual(generate.call_args.kwargs['user_question'], "Et à Bouaké ?")
+        self.assertEqual(generate.call_args.kwargs['history'], [("Fréquence à Abidjan ?", "Sur 98.9 FM.")])
+        turns = Conversation.objects.get(pk=conversation_id).turns.all()
+        self.assertEqual(turns[1].standalone_question, "Quelle est la fréquence de FER FM à Bouaké ?")
+
+        unknown = self.client.post(url, {"question": "Et demain ?", "conversation_id": str(uuid.uuid4())},
+                                   content_type='application/json')
+        self.assertEqual(unknown.status_code, 404)
+
+    @mock.patch('knowledge_base.views.COALESCE_QUERIES', False)
+    @mock.patch('knowledge_base.views.FAQ_ENABLED', False)
+    @mock.patch('knowledge_base.views.generate_answer', return_value="Sur 98.9 FM.")
+    @mock.patch('knowledge_base.views.search_chunks', return_value=[])
+    @mock.patch('knowledge_base.views.get_query_encoder')
+    def test_conversations_are_only_stored_for_answered_questions(self, get_encoder, search, generate):
+        url = reverse('knowledge_base:query_knowledge')
+        one_shot = self.client.post(url, {"question": "Fréquence à Abidjan ?", "start_conversation": False},
+                                    content_type='application/json')
+        self.assertIsNone(one_shot.json()['conversation_id'])
+
+        generate.side_effect = RuntimeError("Gemini is down")
+        failed = self.client.post(url, {"question": "Fréquence à Abidjan ?"}, content_type='application/json')
+        self.assertEqual(failed.status_code, 500)
+        self.assertFalse(Conversation.objects.exists())
+
+        generate.side_effect = None
+        with CaptureQueriesContext(connection) as queries:
+            started = self.client.post(url, {"question": "Fréquence à Abidjan ?"}, content_type='application/json')
+        # The conversation and its first turn: no lock nor aggregate
+        self.assertEqual([query['sql'].split()[0] for query in queries.captured_queries
+                          if 'SAVEPOINT' not in query['sql']], ['INSERT', 'INSERT'])
+        conversation = Conversation.objects.get()
+        self.assertEqual(started.json()['conversation_id'], str(conversation.pk))
+        self.assertEqual(list(conversation.turns.values_list('position', 'question')), [(1, "Fréquence à Abidjan ?")])
+
+
+def run_concurrently(function, count):
+    """Calls function(index) from `count` threads started together; returns the results."""
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def target(index):
+        barrier.wait()
+        try:
+            results[index] = function(index)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=target, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class CoalescingTests(TransactionTestCase):
+    def test_key_ignores_case_and_spacing_but_not_filters_or_new_documents(self):
+        key = coalesce_key("Quelle est la fréquence à Bouaké ?")
+        self.assertEqual(coalesce_key("  quelle est la  Fréquence à Bouaké ?"), key)
+        self.assertNotEqual(coalesce_key("Quelle est la fréquence à Bouaké ?", {'category': 'frequences'}), key)
+        make_document(processed_at=datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc))
+        self.assertNotEqual(coalesce_key("Quelle est la fréquence à Bouaké ?"), key)
+
+    def test_identical_questions_across_workers_run_once(self):
+        workers = [SingleFlight(), SingleFlight()]  # As in two gunicorn processes
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.5)
+            return {'answer': "Sur 98.9 FM."}
+
+        results = run_concurrently(lambda index: workers[index % 2].run('a' * 64, compute), 8)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'answer': "Sur 98.9 FM."}] * 8)
+
+    @override_settings(KNOWLEDGE_COALESCE_WAIT_SECONDS=0.2)
+    def test_followers_stop_waiting_for_a_hung_leader(self):
+        flight = SingleFlight()
+
+        def ask(index):
+            if index == 0:
+                return flight.run('b' * 64, lambda: time.sleep(1) or "Trop tard."), None
+            time.sleep(0.1)  # The leader is in flight
+            started = time.monotonic()
+            return flight.run('b' * 64, lambda: "Sur 98.9 FM."), time.monotonic() - started
+
+        (leader, _), (follower, waited) = run_concurrently(ask, 2)
+
+        self.assertEqual((leader, follower), ("Trop tard.", "Sur 98.9 FM."))
+        self.assertLess(waited, 0.8)
+
+    @mock.patch('knowledge_base.views.generate_answer')
+    @mock.patch('knowledge_base.views.search_chunks', return_value=[])
+    @mock.patch('knowledge_base.views.get_query_encoder')
+    def test_concurrent_identical_requests_make_one_gemini_call(self, get_encoder, search, generate):
+        generate.side_effect = lambda **kwargs: time.sleep(0.5) or "Sur 98.9 FM."
+        url = reverse('knowledge_base:query_knowledge')
+
+        responses = run_concurrently(
+            lambda index: self.client_class().post(
+                url, {"question": "Fréquence à Bouaké ?"}, content_type='application/json'), 10)
+
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual(search.call_count, 1)
+        self.assertEqual({response.json()['answer'] for response in responses}, {"Sur 98.9 FM."})
+        # Each listener still gets a conversation of their own
+        self.assertEqual(len({response.json()['conversation_id'] for response in responses}), 10)
+
+
+class BulkLoadTests(TestCase):
+    def test_copy_stores_the_same_values_as_bulk_create(self):
+        rng = np.random.default_rng(0)
+        embeddings = np.array([unit_vector(rng) for _ in range(300)], dtype=np.float32)
+        texts = [f"Chunk n°{index} — Autoroute Matin" for index in range(300)]
+        metadata = [{'chunk_index': index, 'headings': ["Programmes"]} for index in range(300)]
+        copied, created = make_document(name='copy.pdf'), make_document(name='orm.pdf')
+
+        self.assertEqual(copy_chunks(copied, texts, embeddings, metadata), 300)
+        create_chunks(created, texts, embeddings, metadata)
+
+        fields = ('text_content', 'embedding', 'embedding_half', 'embedding_binary', 'metadata', 'is_searchable')
+        for copy_row, orm_row in zip(copied.chunks.order_by('metadata__chunk_index').values_list(*fields),
+                                     created.chunks.order_by('metadata__chunk_index').values_list(*fields)):
+            self.assertEqual(copy_row[0], orm_row[0])
+            np.testing.assert_array_equal(copy_row[1], orm_row[1])
+            np.testing.assert_array_equal(copy_row[2], orm_row[2])
+            self.assertEqual(copy_row[3:], orm_row[3:])
+        self.assertEqual(copied.chunks.filter(created_at__isnull=False).count(), 300)
+
+
+class HashingEmbeddingBackend:
+    """Deterministic 8-dimension bag-of-words embeddings, standing in for a new model."""
+    def encode(self, texts, batch_size=32):
+        vectors = np.full((len(texts), 8), 0.01, dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % 8] += 1
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@override_settings(KNOWLEDGE_REEMBED_MAX_ROWS_PER_SECOND=0, KNOWLEDGE_REEMBED_BATCH_SIZE=2)
+@mock.patch('knowledge_base.embedding_versions.load_embedding_backend', return_value=HashingEmbeddingBackend())
+class EmbeddingMigrationTests(TestCase):
+    def setUp(self):
+        clear_version_cache()
+        use_temporary_snapshot_dir(self)
+        self.document = make_document()
+        self.chunks = [make_chunk(self.document, text) for text in (
+            "Singrobo 106.9", "Autoroute Matin", "Bouaké 99.6", "Journal de midi", "Tiébissou")]
+
+    def tearDown(self):
+        clear_version_cache()
+
+    def start(self):
+        return start_migration('hashing-8', backend='torch', dimensions=8)
+
+    def test_backfill_fills_the_new_slot_then_switches_queries(self, _):
+        version = self.start()
+        self.assertEqual(version.slot, SLOT_GREEN)
+        # Queries keep using the current model until the switch
+        self.assertEqual(active_embedding_version().slot, SLOT_BLUE)
+
+        self.assertFalse(backfill(version.pk))
+
+        version.refresh_from_db()
+        self.assertEqual(version.state, EmbeddingVersion.State.ACTIVE)
+        self.assertEqual(version.chunks_embedded, 5)
+        self.assertEqual(EmbeddingVersion.objects.get(slot=SLOT_BLUE).state, EmbeddingVersion.State.RETIRED)
+        self.assertEqual(active_embedding_version(), version)
+        query = HashingEmbeddingBackend().encode(["Singrobo"])[0]
+        for storage in VECTOR_STORAGES:
+            with self.subTest(storage=storage):
+                self.assertEqual(vector_search(query, 1, storage=storage), [self.chunks[0]])
+
+    @override_settings(KNOWLEDGE_EMBEDDING_AUTO_ACTIVATE=False)
+    def test_activation_waits_for_every_chunk(self, _):
+        version = self.start()
+        with self.assertRaises(ValueError):
+            activate(version)
+        self.assertFalse(backfill(version.pk))
+        version.refresh_from_db()
+        self.assertEqual(version.state, EmbeddingVersion.State.READY)
+
+        # Written by a process_document that didn't know about the migration yet
+        make_chunk(self.document, "Singrobo")
+        with self.assertRaises(ValueError):
+            activate(version)
+        backfill(version.pk)
+        self.assertEqual(activate(version).state, EmbeddingVersion.State.ACTIVE)
+
+    def test_new_chunks_are_written_to_every_live_slot(self, _):
+        version = self.start()
+        self.assertEqual([v.slot for v in writing_versions()], [SLOT_BLUE, SLOT_GREEN])
+        rng = np.random.default_rng(0)
+        copy_chunks(self.document, ["Singrobo"], {
+            SLOT_BLUE: np.array([unit_vector(rng)], dtype=np.float32),
+            SLOT_GREEN: HashingEmbeddingBackend().encode(["Singrobo"]),
+        })
+        chunk = self.document.chunks.get(text_content="Singrobo")
+        self.assertEqual(len(chunk.embedding), DocumentChunk.EMBEDDING_DIMENSIONS)
+        self.assertEqual(len(chunk.embedding_green), 8)
+        self.assertEqual(len(chunk.embedding_binary_green), 8)
+        self.assertEqual(version.columns.full, 'embedding_green')
+
+    def test_progress_is_saved_between_bounded_runs(self, _):
+        version = self.start()
+        # Out of time before the first batch: the slot is prepared, nothing embedded yet
+        self.assertTrue(backfill(version.pk, time_budget=1e-9))
+        version.refresh_from_db()
+        self.assertTrue(version.slot_prepared)
+        self.assertEqual(version.chunks_embedded, 0)
+
+        reports = []
+        self.assertFalse(backfill(version.pk, progress=lambda v: reports.append(v.chunks_embedded)))
+        self.assertEqual(reports, [2, 4, 5])
+        version.refresh_from_db()
+        self.assertGreater(version.rows_per_second, 0)
+        self.assertFalse(DocumentChunk.objects.filter(embedding_green__isnull=True).exists())
+
+    @override_settings(KNOWLEDGE_REEMBED_MAX_ROWS_PER_SECOND=50, KNOWLEDGE_EMBEDDING_AUTO_ACTIVATE=False)
+    def test_backfill_is_throttled(self, _):
+        version = self.start()
+        started = time.perf_counter()
+        backfill(version.pk)
+        self.assertGreaterEqual(time.perf_counter() - started, 5 / 50)
+        version.refresh_from_db()
+        self.assertLessEqual(version.rows_per_second, 50)
+
+
+@override_settings(KNOWLEDGE_VECTOR_SNAPSHOT_REFRESH_SECONDS=0)
+class VectorSnapshotTests(TestCase):
+    def setUp(self):
+        use_temporary_snapshot_dir(self)
+        self.rng = np.random.default_rng(0)
+        self.query = np.array(unit_vector(self.rng))
+
+    def processed_document(self, name, chunks):
+        document = make_document(name=name, processed_at=timezone.now())
+        for index in range(chunks):
+            make_chunk(document, f"{name} {index}", unit_vector(self.rng, self.query, noise=1.0))
+        return document
+
+    def search(self, storage, **filters):
+        return [chunk.id for chunk in vector_search(self.query, 5, storage=storage, filters=filters)]
+
+    def test_same_ranking_as_the_exact_scan(self):
+        general = self.processed_document('general.pdf', 40)
+        self.processed_document('grille.pdf', 40)
+
+        self.assertEqual(self.search(STORAGE_SNAPSHOT), self.search(STORAGE_FULL))
+        self.assertEqual(self.search(STORAGE_SNAPSHOT, document_ids=[general.id]),
+                         self.search(STORAGE_FULL, document_ids=[general.id]))
+        chunk = vector_search(self.query, 1, storage=STORAGE_SNAPSHOT)[0]
+        self.assertEqual(chunk.text_content, DocumentChunk.objects.get(pk=chunk.pk).text_content)
+
+    @override_settings(KNOWLEDGE_VECTOR_SNAPSHOT_REFRESH_SECONDS=60)
+    def test_unfiltered_search_does_not_query_the_database(self):
+        self.processed_document('general.pdf', 10)
+        active_embedding_version()
+        refresh_snapshot()
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.search(STORAGE_SNAPSHOT)), 5)
+
+    def test_reload_reads_only_new_and_reprocessed_documents(self):
+        general = self.processed_document('general.pdf', 10)
+        schedule = self.processed_document('grille.pdf', 10)
+        self.assertEqual(len(current_snapshot()), 20)
+
+        news = self.processed_document('news.pdf', 3)
+        schedule.chunks.all().delete()
+        make_chunk(schedule, "Grille 2027", self.query.tolist())
+        KnowledgeDocument.objects.filter(pk=schedule.pk).update(processed_at=timezone.now())
+        with mock.patch('knowledge_base.vector_snapshot._fetch_chunks',
+                        wraps=importlib.import_module('knowledge_base.vector_snapshot')._fetch_chunks) as fetch:
+            snapshot = current_snapshot()
+
+        self.assertEqual(sorted(fetch.call_args.args[1]), sorted([str(schedule.pk), str(news.pk)]))
+        self.assertEqual(len(snapshot), 14)
+        self.assertEqual(self.search(STORAGE_SNAPSHOT)[0], schedule.chunks.get().pk)
+        self.assertEqual(len(self.search(STORAGE_SNAPSHOT, document_ids=[general.pk])), 5)
+
+    def test_document_completed_during_a_build_is_left_for_the_next(self):
+        self.processed_document('general.pdf', 10)
+        fetch_chunks = importlib.import_module('knowledge_base.vector_snapshot')._fetch_chunks
+
+        def complete_a_document_first(*args):
+            self.processed_document('news.pdf', 3)
+            return fetch_chunks(*args)
+
+        with mock.patch('knowledge_base.vector_snapshot._fetch_chunks', side_effect=complete_a_document_first):
+            self.assertEqual(len(current_snapshot()), 10)
+        self.assertEqual(len(refresh_snapshot()), 13)
+
+    @override_settings(KNOWLEDGE_VECTOR_SNAPSHOT_REFRESH_SECONDS=60, KNOWLEDGE_REEMBED_MAX_ROWS_PER_SECOND=0,
+                       KNOWLEDGE_EMBEDDING_AUTO_ACTIVATE=False)
+    @mock.patch('knowledge_base.embedding_versions.load_embedding_backend', return_value=HashingEmbeddingBackend())
+    def test_version_switch_within_the_refresh_window(self, _):
+        self.addCleanup(clear_version_cache)
+        self.processed_document('general.pdf', 10)
+        old = active_embedding_version()
+        self.assertEqual(current_snapshot(old).embeddings.shape[1], old.dimensions)
+
+        new = start_migration('hashing-8', backend='torch', dimensions=8)
+        backfill(new.pk)
+        activate(new)
+        snapshot = current_snapshot(new)
+        self.assertEqual(snapshot.embeddings.shape, (10, 8))
+        query = HashingEmbeddingBackend().encode(["general.pdf 3"])[0]
+        self.assertEqual(len(vector_search(query, 3, storage=STORAGE_SNAPSHOT, version=new)), 3)
+
+
+class KnowledgeBaseArchiveTests(TestCase):
+    def setUp(self):
+        self.directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.enterContext(override_settings(MEDIA_ROOT=self.directory / 'media'))
+        use_temporary_snapshot_dir(self)
+        rng = np.random.default_rng(0)
+        self.query = np.array(unit_vector(rng))
+        default_storage.save('knowledge_base/grille.pdf', ContentFile(b'%PDF-1.4 grille'))
+        self.document = make_document(
+            category='programmes', tags=['saison-2026'], valid_from=datetime.date(2026, 9, 1),
+            processed_at=timezone.now())
+        for index in range(12):
+            make_chunk(self.document, f"Grille {index}", unit_vector(rng, self.query, noise=1.0))
+        # Not exported: its chunks aren't searchable
+        make_chunk(make_document(status=KnowledgeDocument.Status.PROCESSING, name='draft.pdf'), "Brouillon")
+
+    def chunk_rows(self):
+        fields = ('id', 'document_id', 'text_content', 'embedding', 'embedding_half', 'embedding_binary', 'is_searchable')
+        return list(DocumentChunk.objects.filter(is_searchable=True).order_by('id').values_list(*fields))
+
+    def test_round_trip_restores_a_query_ready_knowledge_base(self):
+        path = self.directory / 'kb.tar.gz'
+        self.assertEqual(export_knowledge_base(path), (1, 12))
+        chunks, ranking = self.chunk_rows(), [chunk.pk for chunk in vector_search(self.query, 5)]
+
+        self.assertEqual(import_knowledge_base(path, replace=True), (1, 12))
+
+        document = KnowledgeDocument.objects.get()
+        self.assertEqual((document.pk, document.category, document.tags, document.valid_from, document.status),
+                         (self.document.pk, 'programmes', ['saison-2026'], datetime.date(2026, 9, 1),
+                          KnowledgeDocument.Status.COMPLETED))
+        self.assertEqual((document.uploaded_at, document.processed_at),
+                         (self.document.uploaded_at, self.document.processed_at))
+        with document.file.open('rb') as file:
+            self.assertEqual(file.read(), b'%PDF-1.4 grille')
+        self.assertEqual(self.chunk_rows(), chunks)
+        self.assertEqual([chunk.pk for chunk in vector_search(self.query, 5)], ranking)
+
+    def test_corrupted_archive_is_rejected_before_any_change(self):
+        path = self.directory / 'kb.tar'
+        export_knowledge_base(path)
+        with tarfile.open(path) as tar:
+            offset = tar.getmember('embeddings.npy').offset_data
+        with open(path, 'r+b') as archive:
+            archive.seek(offset + 200)
+            byte = archive.read(1)
+            archive.seek(offset + 200)
+            archive.write(bytes([byte[0] ^ 0xFF]))
+
+        with self.assertRaisesMessage(ValueError, "Checksum mismatch for embeddings.npy"):
+            import_knowledge_base(path, replace=True)
+        self.assertEqual(DocumentChunk.objects.count(), 13)
+
+    def test_refuses_a_non_empty_knowledge_base_or_another_model(self):
+        path = self.directory / 'kb.tar'
+        export_knowledge_base(path, include_files=False)
+
+        with self.assertRaisesMessage(ValueError, "isn't empty"):
+            import_knowledge_base(path)
+        other = EmbeddingVersion(model_name='hashing-8', backend='torch', dimensions=8, slot=SLOT_GREEN)
+        with mock.patch('knowledge_base.archive.active_embedding_version', return_value=other), \
+                self.assertRaisesMessage(ValueError, "embedded with"):
+            import_knowledge_base(path, replace=True)
+        self.assertEqual(KnowledgeDocument.objects.count(), 2)
+
+    def test_replace_keeps_the_indexes_and_answers_are_regenerated(self):
+        path = self.directory / 'kb.tar'
+        export_knowledge_base(path, include_files=False)
+        KnowledgeDocument.objects.all().delete()
+        FaqEntry.objects.create(question="Quelle est la fréquence de FER FM à Bouaké ?")
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            import_knowledge_base(path)
+        self.assertEqual(len(callbacks), 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            import_knowledge_base(path, replace=True)
+        self.assertFalse([query for query in queries.captured_queries if 'INDEX' in query['sql']])
+        self.assertEqual(DocumentChunk.objects.count(), 12)
+
+
+class WordHashingEncoder:
+    """QueryEncoder stand-in: bag-of-words embeddings the size of the default model's."""
+    def __init__(self):
+        self.backend = self
+
+    def encode(self, text_or_texts, batch_size=32):
+        if not isinstance(text_or_texts, str):
+            return np.array([self.encode(text) for text in text_or_texts])
+        vector = np.full(DocumentChunk.EMBEDDING_DIMENSIONS, 0.001, dtype=np.float32)
+        for word in re.findall(r"\w+", text_or_texts.casefold()):
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % len(vector)] += 1
+        return vector / np.linalg.norm(vector)
+
+
+@mock.patch('knowledge_base.faq.get_query_encoder', return_value=WordHashingEncoder())
+class FaqTests(TestCase):
+    QUESTION = "Quelle est la fréquence de FER FM à Bouaké ?"
+
+    def setUp(self):
+        clear_version_cache()
+        clear_index_cache()
+        self.addCleanup(clear_index_cache)
+        make_document(processed_at=timezone.now())
+        self.entry = FaqEntry.objects.create(question=self.QUESTION)
+
+    def regenerate(self, answer="Sur 98.9 FM à Bouaké."):
+        with mock.patch('services.gemini_service.generate_answer', return_value=answer) as generate, \
+                mock.patch('knowledge_base.views.search_chunks', return_value=[]):
+            regenerate_answers()
+        clear_index_cache()
+        return generate
+
+    @mock.patch('knowledge_base.views.async_task')
+    @mock.patch('knowledge_base.views.generate_answer')
+    @mock.patch('knowledge_base.views.search_chunks')
+    @mock.patch('knowledge_base.views.get_query_encoder', return_value=WordHashingEncoder())
+    def test_frequent_question_is_answered_without_retrieval_or_gemini(self, _, search, generate, enqueue, __):
+        self.regenerate()
+        url = reverse('knowledge_base:query_knowledge')
+
+        response = self.client.post(url, {"question": "quelle est la fréquence de FER FM à Bouaké?"},
+                                    content_type='application/json')
+
+        self.assertEqual(response.json()['answer'], "Sur 98.9 FM à Bouaké.")
+        search.assert_not_called()
+        generate.assert_not_called()
+        # Scoped questions still go through retrieval
+        generate.return_value = "Dans la grille 2026..."
+        search.return_value = []
+        response = self.client.post(url, {"question": self.QUESTION, "category": "programmes"},
+                                    content_type='application/json')
+        self.assertEqual(response.json()['answer'], "Dans la grille 2026...")
+
+    def test_answers_are_only_served_for_the_knowledge_base_they_come_from(self, encoder):
+        generate = self.regenerate()
+        self.assertEqual(generate.call_args.kwargs, {'extractive_fallback': False})
+        question = encoder.return_value.encode(self.QUESTION)
+        self.assertEqual(match_faq(self.QUESTION, question), "Sur 98.9 FM à Bouaké.")
+        other = "Qui présente Autoroute Matin ?"
+        self.assertIsNone(match_faq(other, encoder.return_value.encode(other)))
+
+        make_document(name='grille-2027.pdf', processed_at=timezone.now())
+        clear_index_cache()
+        self.assertIsNone(match_faq(self.QUESTION, question))
+        self.assertEqual(list(stale_entries(knowledge_base_version(), active_embedding_version())), [self.entry])
+
+        # Gemini unavailable: the entry stays stale rather than answered with an extract
+        self.regenerate(answer=None)
+        self.assertIsNone(match_faq(self.QUESTION, question))
+        self.regenerate(answer="Sur 98.9 FM, grille 2027.")
+        self.assertEqual(match_faq(self.QUESTION, question), "Sur 98.9 FM, grille 2027.")
+
+    # Low enough for the bag-of-words embeddings of two cities' questions to match
+    @override_settings(KNOWLEDGE_FAQ_MATCH_THRESHOLD=0.6)
+    def test_close_questions_about_another_city_are_not_answered(self, encoder):
+        def ask(question):
+            return match_faq(question, encoder.return_value.encode(question))
+
+        self.regenerate()
+        abidjan = "Quelle est la fréquence de FER FM à Abidjan ?"
+        self.assertGreater(float(encoder.return_value.encode(abidjan) @ encoder.return_value.encode(self.QUESTION)), 0.6)
+        self.assertIsNone(ask(abidjan))
+        self.assertIsNone(ask("quelle est la fréquence de fer fm à abidjan"))
+        # Nor a question without the entry's city
+        self.assertIsNone(ask("Quelle est la fréquence de FER FM ?"))
+
+        FaqEntry.objects.create(question=abidjan)
+        self.regenerate(answer="Sur 101.3 FM à Abidjan.")
+        self.assertEqual(ask("Fréquence de FER FM à Abidjan ?"), "Sur 101.3 FM à Abidjan.")
+        self.assertEqual(ask("quelle est la fréquence de fer fm à bouaké ?"), "Sur 98.9 FM à Bouaké.")
+
+    @override_settings(KNOWLEDGE_FAQ_REFRESH_SECONDS=60)
+    def test_index_is_reloaded_for_another_model(self, encoder):
+        self.regenerate()
+        version = active_embedding_version()
+        question = encoder.return_value.encode(self.QUESTION)
+        self.assertEqual(match_faq(self.QUESTION, question, version), "Sur 98.9 FM à Bouaké.")
+        # Within the refresh interval, a question embedded by another model gets no answer
+        # of the previous one (and no dimension mismatch)
+        other = SimpleNamespace(model_name='hashing-8', dimensions=8)
+        self.assertIsNone(match_faq(self.QUESTION, np.ones(8, dtype=np.float32), other))
+
+    def test_deleting_documents_queues_one_regeneration(self, _):
+        make_document(name='grille-2027.pdf')
+        with self.captureOnCommitCallbacks() as callbacks:
+            KnowledgeDocument.objects.all().delete()
+            queue_regeneration()
+        self.assertEqual(len(callbacks), 1)
+
+    def test_mining_groups_the_phrasings_of_a_question(self, _):
+        asked = ["Quelle est la fréquence à Abidjan ?"] * 4 + ["quelle est la fréquence à abidjan?"] * 2 + [
+            "Quelle est la fréquence à Abidjan, svp ?", self.QUESTION, "Qui présente Autoroute Matin ?"]
+        for question in asked * 2:
+            record_turn(Conversation.objects.create(), question, None, "Réponse.")
+
+        entries = mine_questions(min_count=5, threshold=0.8)
+
+        self.assertEqual([(entry.question, entry.asked) for entry in entries],
+                         [("Quelle est la fréquence à Abidjan ?", 14)])
+        self.assertEqual(entries[0].source, FaqEntry.Source.MINED)
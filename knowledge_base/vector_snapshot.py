@@ -0,0 +1,259 @@
+"""
+In-process vector search over a memory-mapped snapshot of the searchable chunks
+(settings.KNOWLEDGE_VECTOR_STORAGE = 'snapshot').
+
+For a few thousand chunks, scoring every embedding with one matrix-vector product in
+numpy is faster than a round-trip to Postgres. The snapshot is a directory of .npy
+files under settings.KNOWLEDGE_VECTOR_SNAPSHOT_DIR, named after a version stamp: the
+L2-normalised float32 embeddings of the active embedding version, the chunk ids, each
+chunk's document and the chunk texts. Workers np.load() them with mmap_mode='r', so
+the pages are shared through the page cache instead of copied into every process.
+
+Each worker compares its snapshot's stamp with the database (the completed documents,
+see coalescing.knowledge_base_version, and the active embedding version) at most every
+settings.KNOWLEDGE_VECTOR_SNAPSHOT_REFRESH_SECONDS. When it changed, the first worker
+to notice builds the new snapshot under a file lock and the others load it. Builds are
+incremental: rows of documents unchanged since the previous snapshot are copied from
+it, only the chunks of new or reprocessed documents are read from Postgres.
+process_document refreshes the snapshot once a document is processed, so the workers
+usually find it built.
+
+Search results are DocumentChunk instances with only id, document_id and text_content
+loaded (like .only()), built without querying the database.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from .coalescing import knowledge_base_version
+from .embedding_versions import active_embedding_version
+from .models import DocumentChunk, KnowledgeDocument
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 1
+# Snapshots kept on disk: the current one and the previous ones, still mapped by
+# workers that haven't refreshed yet (a deleted file stays readable while mapped)
+KEEP_SNAPSHOTS = 3
+FETCH_BATCH_SIZE = 2000
+CHUNK_FIELDS = ['id', 'document_id', 'text_content']
+
+_lock = threading.Lock()
+_snapshot = None
+_next_check = 0.0
+
+
+def snapshot_dir():
+    return Path(getattr(settings, 'KNOWLEDGE_VECTOR_SNAPSHOT_DIR', Path(settings.BASE_DIR) / 'var' / 'vector_snapshot'))
+
+
+def snapshot_stamp(version):
+    """Changes whenever a document finishes processing or is removed, or the active embedding version changes."""
+    return f"{knowledge_base_version()}:{version.pk}:{version.model_name}:{version.dimensions}"
+
+
+class VectorSnapshot:
+    """A loaded (memory-mapped) snapshot."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        manifest = json.loads((self.path / 'manifest.json').read_text())
+        self.stamp = manifest['stamp']
+        self.version_key = manifest['version_key']
+        self.documents = manifest['documents']  # [[document id, processed_at], ...], by document index
+        self.document_ids = [uuid.UUID(document_id) for document_id, _ in self.documents]
+        self.embeddings = np.load(self.path / 'embeddings.npy', mmap_mode='r')
+        self.chunk_ids = np.load(self.path / 'chunk_ids.npy', mmap_mode='r')
+        self.document_index = np.load(self.path / 'document_index.npy', mmap_mode='r')
+        self.text_offsets = np.load(self.path / 'text_offsets.npy', mmap_mode='r')
+        texts = self.path / 'texts.bin'
+        # np.memmap can't map an empty file
+        self.texts = np.memmap(texts, dtype=np.uint8, mode='r') if texts.stat().st_size else np.empty(0, np.uint8)
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    def chunk(self, row):
+        text = bytes(self.texts[self.text_offsets[row]:self.text_offsets[row + 1]]).decode()
+        chunk_id = uuid.UUID(bytes=bytes(self.chunk_ids[row]))
+        return DocumentChunk.from_db(
+            DEFAULT_DB_ALIAS, CHUNK_FIELDS, [chunk_id, self.document_ids[self.document_index[row]], text])
+
+    def search(self, question_embedding, limit, document_ids=None):
+        """The `limit` chunks nearest to the question (cosine), among `document_ids` when given."""
+        query = np.asarray(question_embedding, dtype=np.float32)
+        query = query / max(np.linalg.norm(query), 1e-12)
+        scores = self.embeddings @ query
+        if document_ids is not None:
+            allowed = [index for index, document_id in enumerate(self.document_ids) if document_id in document_ids]
+            scores = np.where(np.isin(self.document_index, allowed), scores, -np.inf)
+        limit = min(limit, int(np.isfinite(scores).sum()))
+        if limit <= 0:
+            return []
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        return [self.chunk(row) for row in top[np.argsort(-scores[top], kind='stable')]]
+
+
+def _version_key(version):
+    return f"{version.pk}:{version.model_name}:{version.dimensions}:{version.slot}"
+
+
+def _fetch_chunks(version, document_ids):
+    """
+    (chunk ids, document ids, texts, embeddings) of the searchable chunks of
+    `document_ids`. Documents completed since they were listed are left for the next build.
+    """
+    chunks = DocumentChunk.objects.filter(is_searchable=True, document_id__in=document_ids)
+    rows = chunks.values_list('id', 'document_id', 'text_content', version.columns.full)
+    ids, documents, texts, vectors = [], [], [], []
+    for chunk_id, document_id, text, vector in rows.iterator(chunk_size=FETCH_BATCH_SIZE):
+        if vector is None:
+            continue  # Not embedded yet by this version (see embedding_versions.py)
+        ids.append(chunk_id)
+        documents.append(document_id)
+        texts.append(text)
+        vectors.append(vector)
+    embeddings = np.array(vectors, dtype=np.float32).reshape(len(vectors), version.dimensions)
+    return ids, documents, texts, embeddings
+
+
+def _write(path, stamp, version, documents, chunk_ids, document_index, texts, embeddings):
+    """Writes the snapshot to a temporary directory renamed to `path`, so readers never see a partial one."""
+    building = path.with_name(f".{path.name}.{os.getpid()}")
+    shutil.rmtree(building, ignore_errors=True)
+    building.mkdir(parents=True)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    np.save(building / 'embeddings.npy', (embeddings / np.clip(norms, 1e-12, None)).astype(np.float32))
+    np.save(building / 'chunk_ids.npy', np.frombuffer(b''.join(chunk_ids), dtype=np.uint8).reshape(len(chunk_ids), 16))
+    np.save(building / 'document_index.npy', np.array(document_index, dtype=np.int32))
+    encoded = [text.encode() for text in texts]
+    offsets = np.concatenate([[0], np.cumsum([len(text) for text in encoded], dtype=np.int64)])
+    np.save(building / 'text_offsets.npy', offsets.astype(np.int64))
+    (building / 'texts.bin').write_bytes(b''.join(encoded))
+    (building / 'manifest.json').write_text(json.dumps({
+        'format': SNAPSHOT_FORMAT, 'stamp': stamp, 'version_key': _version_key(version), 'documents': documents}))
+    os.rename(building, path)
+
+
+def build_snapshot(path, stamp, version, previous=None):
+    """
+    Builds the snapshot of the searchable chunks in `path`, reusing the rows of
+    `previous` for the documents it has with the same processed_at.
+    """
+    started = time.perf_counter()
+    current = {
+        str(document_id): processed_at.isoformat() if processed_at else None
+        for document_id, processed_at in KnowledgeDocument.objects.filter(
+            status=KnowledgeDocument.Status.COMPLETED).values_list('id', 'processed_at')
+    }
+    reusable = previous is not None and previous.version_key == _version_key(version)
+    kept = {}
+    if reusable:
+        kept = {index: document_id for index, (document_id, processed_at) in enumerate(previous.documents)
+                if current.get(document_id, False) == processed_at}
+    to_fetch = [document_id for document_id in current if document_id not in kept.values()]
+
+    documents = [[document_id, current[document_id]] for document_id in list(kept.values()) + to_fetch]
+    position = {document_id: index for index, (document_id, _) in enumerate(documents)}
+    chunk_ids, document_index, texts, parts = [], [], [], []
+    if kept:
+        rows = np.flatnonzero(np.isin(previous.document_index, list(kept)))
+        parts.append(np.asarray(previous.embeddings[rows]))
+        chunk_ids.extend(bytes(previous.chunk_ids[row]) for row in rows)
+        document_index.extend(position[kept[previous.document_index[row]]] for row in rows)
+        offsets = previous.text_offsets
+        texts.extend(bytes(previous.texts[offsets[row]:offsets[row + 1]]).decode() for row in rows)
+    if to_fetch:
+        ids, fetched_documents, fetched_texts, embeddings = _fetch_chunks(version, to_fetch)
+        parts.append(embeddings)
+        chunk_ids.extend(chunk_id.bytes for chunk_id in ids)
+        document_index.extend(position[str(document_id)] for document_id in fetched_documents)
+        texts.extend(fetched_texts)
+    embeddings = np.concatenate(parts) if parts else np.empty((0, version.dimensions), np.float32)
+
+    _write(path, stamp, version, documents, chunk_ids, document_index, texts, embeddings)
+    logger.info(
+        f"Built vector snapshot of {len(chunk_ids)} chunks ({len(to_fetch)} documents read, {len(kept)} reused) "
+        f"in {time.perf_counter() - started:.2f}s.")
+
+
+def _prune(directory, keep):
+    snapshots = sorted((path for path in directory.iterdir() if path.is_dir() and not path.name.startswith('.')),
+                       key=lambda path: path.stat().st_mtime, reverse=True)
+    for path in snapshots[KEEP_SNAPSHOTS:]:
+        if path != keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def load_snapshot(stamp, version, previous=None, force=False):
+    """Loads the snapshot of `stamp`, building it first unless another process already did."""
+    directory = snapshot_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / hashlib.sha256(stamp.encode()).hexdigest()[:16]
+    if (path / 'manifest.json').exists() and not force:
+        return VectorSnapshot(path)
+    with open(directory / '.lock', 'w') as lock_file:
+        # One builder per host; the others wait, then load its result
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if force:
+                shutil.rmtree(path, ignore_errors=True)
+            if not (path / 'manifest.json').exists():
+                build_snapshot(path, stamp, version, None if force else previous)
+                _prune(directory, keep=path)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return VectorSnapshot(path)
+
+
+def current_snapshot(version=None):
+    """
+    The snapshot of the current knowledge base, reloaded when its stamp changed or
+    when it was built for another embedding version than `version` (the one that
+    encoded the question).
+    """
+    global _snapshot, _next_check
+    with _lock:
+        now = time.monotonic()
+        version = version or active_embedding_version()
+        # The version cache and this one expire at different times: after a switch, a
+        # question embedded by the new model mustn't be searched in the old one's vectors
+        if _snapshot is not None and now < _next_check and _snapshot.version_key == _version_key(version):
+            return _snapshot
+        stamp = snapshot_stamp(version)
+        if _snapshot is None or _snapshot.stamp != stamp:
+            _snapshot = load_snapshot(stamp, version, previous=_snapshot)
+        _next_check = now + getattr(settings, 'KNOWLEDGE_VECTOR_SNAPSHOT_REFRESH_SECONDS', 5)
+        return _snapshot
+
+
+def refresh_snapshot(force=False):
+    """
+    Brings this process's snapshot up to date now (process_document, benchmarks).
+    `force` rebuilds it from the database even if the stamp didn't change.
+    """
+    global _snapshot, _next_check
+    with _lock:
+        version = active_embedding_version()
+        stamp = snapshot_stamp(version)
+        if force or _snapshot is None or _snapshot.stamp != stamp:
+            _snapshot = load_snapshot(stamp, version, previous=_snapshot, force=force)
+        _next_check = time.monotonic() + getattr(settings, 'KNOWLEDGE_VECTOR_SNAPSHOT_REFRESH_SECONDS', 5)
+        return _snapshot
+
+
+def clear_snapshot_cache():
+    global _snapshot
+    with _lock:
+        _snapshot = None
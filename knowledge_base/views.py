@@ -6,48 +6,95 @@ from rest_framework.response import Response
 from rest_framework import status
 # Or AllowAny for testing
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from django.conf import settings
+from django_q.tasks import async_task
 
-from pgvector.django import CosineDistance
-from sentence_transformers import SentenceTransformer
+from core.instrumentation import span
 
 # Local imports
-from .models import DocumentChunk, KnowledgeDocument
+from .coalescing import coalesce_key, single_flight
+from .conversations import prompt_history, record_turn, start_conversation
+from .embedding_versions import active_embedding_version
+from .faq import match_faq
+from .models import Conversation
+from .reranking import rerank
+from .retrieval import FILTER_FIELDS, search_chunks
 from .serializers import KnowledgeQuerySerializer, KnowledgeAnswerSerializer
-from services.gemini_service import generate_answer
-# Use the same model as the processing task
-from .tasks import EMBEDDING_MODEL_NAME
+from services.gemini_service import answer_deadline, condense_question, generate_answer
+# Questions are encoded with the model of the active embedding version
+from .embeddings import get_query_encoder
 
 logger = logging.getLogger(__name__)
 
 # --- Constants ---
 # Number of relevant chunks to retrieve for context
 TOP_K = 5
-
-# --- Load Model Globally (for efficiency within the API worker process) ---
-# Ensure this matches the model used in tasks.py
-# Consider error handling if the model fails to load
-try:
-    logger.info(f"Loading embedding model for API: {EMBEDDING_MODEL_NAME}")
-    # Force CPU if needed: device='cpu'
-    embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
-    logger.info("Embedding model loaded successfully for API.")
-except Exception as e:
-    logger.error(
-        f"Failed to load embedding model {EMBEDDING_MODEL_NAME}: {e}", exc_info=True)
-    # Depending on desired behavior, you might raise an error or disable the endpoint
-    embedding_model = None
+# Optional cross-encoder re-ranking: retrieve a wider candidate set, then keep
+# fewer but better chunks for the Gemini prompt (see reranking.py)
+RERANK_ENABLED = getattr(settings, 'KNOWLEDGE_RERANK_ENABLED', False)
+RERANK_CANDIDATES = getattr(settings, 'KNOWLEDGE_RERANK_CANDIDATES', 50)
+RERANK_TOP_N = getattr(settings, 'KNOWLEDGE_RERANK_TOP_N', 3)
+COALESCE_QUERIES = getattr(settings, 'KNOWLEDGE_COALESCE_QUERIES', True)
+CONDENSE_QUESTIONS = getattr(settings, 'KNOWLEDGE_CONDENSE_QUESTIONS', True)
+START_CONVERSATIONS = getattr(settings, 'KNOWLEDGE_CONVERSATION_START', True)
+FAQ_ENABLED = getattr(settings, 'KNOWLEDGE_FAQ_ENABLED', True)
+
+
+def retrieve_snippets(search_question, question_embedding, filters=None, version=None):
+    """
+    Texts of the chunks to answer from (vector, lexical or hybrid RRF, see
+    settings.KNOWLEDGE_RETRIEVAL_MODE, then optionally re-ranked). Only chunks from
+    documents that have been successfully processed are searched.
+    """
+    if RERANK_ENABLED:
+        logger.debug(f"Searching for {RERANK_CANDIDATES} candidate chunks to re-rank...")
+        with span('vector_search'):
+            candidates = search_chunks(
+                search_question, question_embedding, RERANK_CANDIDATES, filters=filters, version=version)
+        # Falls back to the original top TOP_K if the latency budget is exceeded
+        with span('rerank'):
+            relevant_chunks = rerank(search_question, candidates, RERANK_TOP_N, fallback_k=TOP_K)
+    else:
+        logger.debug(f"Searching for top {TOP_K} relevant chunks...")
+        with span('vector_search'):
+            relevant_chunks = search_chunks(
+                search_question, question_embedding, TOP_K, filters=filters, version=version)
+
+    if not relevant_chunks:
+        logger.warning(
+            "No relevant document chunks found for the query.")
+        # Consider a specific response or letting Gemini handle it
+        # return Response({"answer": "I could not find relevant information in the knowledge base to answer your question."}, status=status.HTTP_200_OK)
+        return []  # Pass empty list to Gemini
+    knowledge_snippets = [
+        chunk.text_content for chunk in relevant_chunks]
+    logger.info(
+        f"Retrieved {len(knowledge_snippets)} snippets for context.")
+    # for i, snippet in enumerate(knowledge_snippets):
+    #     logger.debug(f"Snippet {i+1}: {snippet[:100]}...")
+    return knowledge_snippets
 
 
 class QueryKnowledgeView(APIView):
     """
     API endpoint to ask questions based on the indexed knowledge documents.
     Requires POST request with JSON body: {"question": "Your question here?"}
+    Optional filters scope the search: "document_ids", "category", "tags", "valid_on".
+    Pass the returned "conversation_id" to ask follow-up questions (see conversations.py),
+    or "start_conversation": false for a one-shot question.
     """
     # permission_classes = [IsAuthenticated] # Adjust as needed (e.g., AllowAny)
     permission_classes = [AllowAny]  # Adjust as needed (e.g., AllowAny)
 
     def post(self, request, *args, **kwargs):
-        if not embedding_model:
+        # The embedding model is loaded on first use (or by the warm-up hook),
+        # not at import time, so importing this module stays cheap.
+        version = active_embedding_version()
+        try:
+            query_encoder = get_query_encoder(version.model_name, version.backend)
+        except Exception as e:
+            logger.error(
+                f"Failed to load embedding model {version.model_name}: {e}", exc_info=True)
             return Response(
                 {"error": "Embedding model is not available. Cannot process query."},
                 status=status.HTTP_503_SERVICE_UNAVAILABLE
@@ -58,49 +105,63 @@ class QueryKnowledgeView(APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
         question = serializer.validated_data['question']
+        filters = {name: value for name, value in serializer.validated_data.items() if name in FILTER_FIELDS}
         logger.info(f"Received knowledge query: '{question[:100]}...'")
 
+        # A new conversation is only stored once its first question is answered
+        conversation = None
+        conversation_id = serializer.validated_data.get('conversation_id')
+        if conversation_id:
+            conversation = Conversation.objects.filter(pk=conversation_id).first()
+            if conversation is None:
+                return Response({"error": "Unknown or expired conversation."}, status=status.HTTP_404_NOT_FOUND)
+
         try:
-            # 1. Generate embedding for the question
-            logger.debug("Generating embedding for the query...")
-            question_embedding = embedding_model.encode(question)
-
-            # 2. Find relevant document chunks via vector similarity search
-            # Only search chunks from documents that have been successfully processed
-            logger.debug(f"Searching for top {TOP_K} relevant chunks...")
-            relevant_chunks = DocumentChunk.objects.filter(
-                document__status=KnowledgeDocument.Status.COMPLETED
-            ).order_by(
-                CosineDistance('embedding', question_embedding)
-            )[:TOP_K]
-
-            if not relevant_chunks:
-                logger.warning(
-                    "No relevant document chunks found for the query.")
-                # Consider a specific response or letting Gemini handle it
-                # return Response({"answer": "I could not find relevant information in the knowledge base to answer your question."}, status=status.HTTP_200_OK)
-                knowledge_snippets = []  # Pass empty list to Gemini
-            else:
-                knowledge_snippets = [
-                    chunk.text_content for chunk in relevant_chunks]
-                logger.info(
-                    f"Retrieved {len(knowledge_snippets)} snippets for context.")
-                # for i, snippet in enumerate(knowledge_snippets):
-                #     logger.debug(f"Snippet {i+1}: {snippet[:100]}...")
-
-            # 3. Generate answer using Gemini with retrieved context
-            logger.debug("Calling Gemini service to generate answer...")
-            answer_text = generate_answer(
-                user_question=question,
-                knowledge_snippets=knowledge_snippets
-            )
+            # Condensing a follow-up question and answering it share the Gemini budget
+            deadline = answer_deadline()
+
+            # 0. Conversation so far: rolling summary and the recent turns within budget.
+            # A follow-up question is rewritten as a standalone one for retrieval.
+            summary, history = '', []
+            if conversation is not None:
+                with span('conversation'):
+                    summary, history = prompt_history(conversation)
+            standalone_question = None
+            if CONDENSE_QUESTIONS and (summary or history):
+                standalone_question = condense_question(question, summary, history, deadline)
+            search_question = standalone_question or question
+
+            # Frequent first questions get the answer precomputed for them (see faq.py)
+            answer_text = None
+            if FAQ_ENABLED and not (summary or history or filters):
+                with span('faq'):
+                    answer_text = match_faq(question, query_encoder.encode(question), version)
+
+            # 1-3. Embedding, search and Gemini. Identical first questions asked at the same
+            # time (live shows) share one run, across gunicorn workers (see coalescing.py).
+            def run_pipeline():
+                return self.run_pipeline(
+                    query_encoder, question, search_question, filters, summary, history, version, deadline)
+
+            if answer_text is None and COALESCE_QUERIES and not (summary or history):
+                answer_text = single_flight.run(coalesce_key(question, filters, version), run_pipeline)
+            elif answer_text is None:
+                answer_text = run_pipeline()
+
+            if conversation is not None:
+                # Older turns are summarised in the background once they outgrow the budget
+                if record_turn(conversation, question, standalone_question, answer_text):
+                    async_task('knowledge_base.tasks.summarize_conversation', str(conversation.pk))
+            elif serializer.validated_data.get('start_conversation', START_CONVERSATIONS):
+                conversation = start_conversation(question, answer_text)
 
             # 4. Serialize and return response
             # response_serializer = KnowledgeAnswerSerializer(
             #     data={'answer': answer_text})
             # response_serializer.is_valid(raise_exception=True) # Check validation and raise error if invalid
             # return Response(response_serializer.data, status=status.HTTP_200_OK)
-            return Response({"answer": answer_text}, status=status.HTTP_200_OK)
+            return Response({"answer": answer_text, "conversation_id": conversation.pk if conversation else None},
+                            status=status.HTTP_200_OK)
 
         except Exception as e:
             logger.exception(
@@ -110,3 +171,36 @@ class QueryKnowledgeView(APIView):
                     "detail": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+    def run_pipeline(self, query_encoder, question, search_question, filters, summary, history, version=None,
+                     deadline=None):
+        """
+        Answer to `question`, from the chunks retrieved for `search_question`.
+        `version` is the EmbeddingVersion of `query_encoder`'s model, `deadline` that of
+        the Gemini calls (see gemini_service.answer_deadline).
+        """
+        # 1. Generate embedding for the question
+        logger.debug("Generating embedding for the query...")
+        with span('embedding'):
+            question_embedding = query_encoder.encode(search_question)
+
+        # 2. Find relevant document chunks
+        knowledge_snippets = retrieve_snippets(search_question, question_embedding, filters, version)
+
+        # 3. Generate answer using Gemini with retrieved context
+        logger.debug("Calling Gemini service to generate answer...")
+        answer_text = generate_answer(
+            user_question=question,
+            knowledge_snippets=knowledge_snippets,
+            summary=summary,
+            history=history,
+            deadline=deadline,
+        )
+        return answer_text
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        # Render here (instead of later in Django's handler) so serialisation is timed
+        with span('serialization'):
+            response.render()
+        return response
@@ -1,13 +1,66 @@
 from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Count, Q
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html, format_html_join
 from .models import ExpoPushToken, Notification, NotificationDelivery
 from .tasks import queue_notification_for_sending # Import the task queuing function
 from django.utils import timezone
 
+# Tables smaller than this are counted exactly, their estimates being less reliable
+EXACT_COUNT_BELOW = 10000
+# Tokens matched by a prefix search looked up by id; broader prefixes use a subquery
+SEARCH_MAX_TOKENS = 1000
+
+
+def estimated_row_count(model):
+    """The planner's estimate of the table's rows (pg_class.reltuples), None if never analyzed."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [model._meta.db_table])
+        row = cursor.fetchone()
+    return row[0] if row and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts the unfiltered list of a large table from the planner's estimate instead
+    of a COUNT(*) scanning the whole table on every page. Filtered lists, served by
+    indexes, and small tables are counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = estimated_row_count(self.object_list.model)
+            if estimate is not None and estimate >= EXACT_COUNT_BELOW:
+                return estimate
+        return super().count
+
+
+def search_deliveries(queryset, term):
+    """
+    Deliveries whose ticket id is `term` or whose token starts with it. Case-sensitive,
+    like the tokens and tickets, so that both use btree indexes (varchar_pattern_ops
+    for the prefix), where search_fields' icontains scans the tables.
+    """
+    tokens = ExpoPushToken.objects.filter(token__startswith=term).values_list('id', flat=True)
+    token_ids = list(tokens[:SEARCH_MAX_TOKENS + 1])
+    if len(token_ids) > SEARCH_MAX_TOKENS:
+        token_ids = tokens
+    return queryset.filter(Q(push_ticket_id=term) | Q(expo_push_token_id__in=token_ids))
+
+
 @admin.register(ExpoPushToken)
 class ExpoPushTokenAdmin(admin.ModelAdmin):
     list_display = ('token', 'is_active', 'created_at', 'updated_at')
     list_filter = ('is_active',)
     search_fields = ('token',)
+    search_help_text = 'Beginning of the token (case-sensitive).'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     actions = ['mark_as_active', 'mark_as_inactive']
 
     def mark_as_active(self, request, queryset):
@@ -20,24 +73,44 @@ class ExpoPushTokenAdmin(admin.ModelAdmin):
         self.message_user(request, f"{queryset.count()} tokens marked as inactive.", messages.SUCCESS)
     mark_as_inactive.short_description = "Mark selected tokens as inactive"
 
-class NotificationDeliveryInline(admin.TabularInline):
-    model = NotificationDelivery
-    extra = 0
-    readonly_fields = ('expo_push_token', 'push_ticket_id', 'status', 'receipt_status_text', 'receipt_checked_at', 'receipt_details', 'created_at', 'updated_at')
-    can_delete = False
-    show_change_link = True
-
-    def has_add_permission(self, request, obj=None):
-        return False
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        # Prefix, served by the token's varchar_pattern_ops index
+        return queryset.filter(token__startswith=term), False
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
     list_display = ('title', 'status', 'creator', 'scheduled_at', 'sent_at', 'created_at')
+    list_select_related = ('creator',)
     list_filter = ('status', 'creator', 'scheduled_at')
     search_fields = ('title', 'body')
-    inlines = [NotificationDeliveryInline]
     actions = ['process_selected_notifications']
-    readonly_fields = ('sent_at', 'status') # status is now managed by the queueing logic primarily
+    # A broadcast has a delivery per token: their status counts, linking to the deliveries
+    # list, rather than an inline of every delivery
+    readonly_fields = ('sent_at', 'status', 'deliveries_summary') # status is now managed by the queueing logic primarily
+
+    def deliveries_summary(self, obj):
+        if obj.pk is None:
+            return '-'
+        counts = dict(
+            NotificationDelivery.objects.filter(notification=obj).order_by()
+            .values_list('status').annotate(count=Count('id'))
+        )
+        if not counts:
+            return 'No deliveries.'
+        url = reverse('admin:push_notifications_notificationdelivery_changelist')
+        labels = dict(NotificationDelivery.DELIVERY_STATUS_CHOICES)
+        return format_html(
+            '<a href="{}?notification__id__exact={}">{} deliveries</a>: {}',
+            url, obj.pk, sum(counts.values()),
+            format_html_join(', ', '<a href="{}?notification__id__exact={}&status__exact={}">{}</a> {}', (
+                (url, obj.pk, status, labels.get(status, status), count)
+                for status, count in sorted(counts.items())
+            )),
+        )
+    deliveries_summary.short_description = 'Deliveries'
 
     def process_selected_notifications(self, request, queryset):
         processed_count = 0
@@ -60,8 +133,13 @@ class NotificationAdmin(admin.ModelAdmin):
 @admin.register(NotificationDelivery)
 class NotificationDeliveryAdmin(admin.ModelAdmin):
     list_display = ('notification', 'get_token_short', 'status', 'push_ticket_id', 'receipt_status_text', 'receipt_checked_at', 'updated_at')
-    list_filter = ('status', 'receipt_status_text', 'receipt_checked_at')
-    search_fields = ('push_ticket_id', 'expo_push_token__token', 'notification__title')
+    list_select_related = ('notification', 'expo_push_token')
+    # No receipt_status_text filter: listing its values is a DISTINCT over the whole table
+    list_filter = ('status', 'receipt_checked_at')
+    search_fields = ('push_ticket_id', 'expo_push_token__token')
+    search_help_text = 'Exact ticket id, or beginning of the token (case-sensitive).'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     readonly_fields = ('notification', 'expo_push_token', 'push_ticket_id', 'receipt_details', 'created_at', 'updated_at', 'status', 'receipt_status_text', 'receipt_checked_at')
 
     def get_token_short(self, obj):
@@ -70,6 +148,16 @@ class NotificationDeliveryAdmin(admin.ModelAdmin):
         return None
     get_token_short.short_description = 'Expo Token (Shortened)'
 
+    def get_queryset(self, request):
+        # The change page shows both in its readonly fields
+        return super().get_queryset(request).select_related('notification', 'expo_push_token')
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        return search_deliveries(queryset, term), False
+
     def has_add_permission(self, request):
         return False
 
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-19 18:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("push_notifications", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="notificationdelivery",
+            index=models.Index(
+                fields=["notification", "status"], name="delivery_notification_status"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="notificationdelivery",
+            index=models.Index(fields=["-created_at"], name="delivery_created_at"),
+        ),
+    ]
@@ -115,6 +115,20 @@ class NotificationDelivery(models.Model):
             "expo_push_token",
         )  # Ensure one delivery record per token per notification
         ordering = ["-created_at"]
+        indexes = [
+            # Status counts of a notification (admin summary), index-only
+            models.Index(
+                fields=["notification", "status"], name="delivery_notification_status"
+            ),
+            # Default ordering of the admin list
+            models.Index(fields=["-created_at"], name="delivery_created_at"),
+        ]
 
     def __str__(self):
-        return f"To: {self.expo_push_token.token[:20]}... - Status: {self.get_status_display()}"
+        # The token only when already loaded (select_related): listing deliveries
+        # mustn't query it row by row
+        if self._meta.get_field("expo_push_token").is_cached(self):
+            recipient = f"{self.expo_push_token.token[:20]}..."
+        else:
+            recipient = f"token #{self.expo_push_token_id}"
+        return f"To: {recipient} - Status: {self.get_status_display()}"
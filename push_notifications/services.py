@@ -1,5 +1,5 @@
 from exponent_server_sdk import (
-    PushClient, PushMessage, PushServerError, PushTicketError, DeviceNotRegisteredError)
+    PushClient, PushMessage, PushServerError, PushTicket, PushTicketError, DeviceNotRegisteredError)
 from requests.exceptions import ConnectionError, HTTPError
 
 from django.conf import settings
@@ -7,9 +7,16 @@ from .models import ExpoPushToken, Notification, NotificationDelivery
 from django.utils import timezone
 import logging
 
+from core.instrumentation import span
+
 logger = logging.getLogger(__name__)
 
 
+def get_push_client():
+    # EXPO_PUSH_HOST points the client at a local stand-in (core/fake_services) for benchmarks
+    return PushClient(host=getattr(settings, 'EXPO_PUSH_HOST', None))
+
+
 def send_expo_push_messages(notification_id):
     """
     Sends a given notification to all active ExpoPushToken recipients.
@@ -38,73 +45,76 @@ def send_expo_push_messages(notification_id):
     notification.sent_at = timezone.now()
     notification.save()
 
-    for expo_token_obj in active_tokens:
-        # Create or get delivery record
-        delivery, created = NotificationDelivery.objects.get_or_create(
-            notification=notification,
-            expo_push_token=expo_token_obj,
-            # Should be pending_send initially
-            defaults={'status': 'pending_send'}
-        )
-        # Ensure status is ready for sending if record already existed but failed previously
-        if not created and delivery.status not in ['receipt_ok']:
-            delivery.status = 'pending_send'
-            # Reset other fields if re-sending the same notification after a failure on this delivery
-            delivery.push_ticket_id = None
-            delivery.receipt_checked_at = None
-            delivery.receipt_status_text = None
-            delivery.receipt_details = None
-            delivery.save()
-
-        messages_to_send.append(
-            PushMessage(
-                to=expo_token_obj.token,
-                title=notification.title,
-                body=notification.body,
-                data=notification.data or {},
-                sound="default",  # You can customize this
-                # extra fields like badge, ttl, etc. can be added here
+    with span('build'):
+        for expo_token_obj in active_tokens:
+            # Create or get delivery record
+            delivery, created = NotificationDelivery.objects.get_or_create(
+                notification=notification,
+                expo_push_token=expo_token_obj,
+                # Should be pending_send initially
+                defaults={'status': 'pending_send'}
             )
-        )
-        delivery_records_map[expo_token_obj.token] = delivery
+            # Ensure status is ready for sending if record already existed but failed previously
+            if not created and delivery.status not in ['receipt_ok']:
+                delivery.status = 'pending_send'
+                # Reset other fields if re-sending the same notification after a failure on this delivery
+                delivery.push_ticket_id = None
+                delivery.receipt_checked_at = None
+                delivery.receipt_status_text = None
+                delivery.receipt_details = None
+                delivery.save()
+
+            messages_to_send.append(
+                PushMessage(
+                    to=expo_token_obj.token,
+                    title=notification.title,
+                    body=notification.body,
+                    data=notification.data or {},
+                    sound="default",  # You can customize this
+                    # extra fields like badge, ttl, etc. can be added here
+                )
+            )
+            delivery_records_map[expo_token_obj.token] = delivery
 
     logger.info(
         f"Attempting to send notification '{notification.title}' to {len(messages_to_send)} tokens.")
 
     try:
         # Send messages in chunks if necessary (Expo recommends chunks of up to 100)
-        client = PushClient()
+        client = get_push_client()
         # The send_messages method automatically chunks
-        push_tickets = client.publish_multiple(messages_to_send)
-
-        all_tickets_successful = True
-        for idx, ticket in enumerate(push_tickets):
-            token_str = messages_to_send[idx].to  # Get original token string
-            delivery_record = delivery_records_map.get(token_str)
-            if not delivery_record:
-                logger.error(
-                    f"Could not find delivery record for token {token_str} during ticket processing.")
-                continue
-
-            if ticket.status == 'ok':
-                delivery_record.push_ticket_id = ticket.id
-                # Or 'receipt_pending_check' if you prefer
-                delivery_record.status = 'sent_to_expo'
-                logger.info(
-                    f"Successfully sent to Expo for token {token_str}, ticket ID: {ticket.id}")
-            else:
-                all_tickets_successful = False
-                delivery_record.status = 'expo_error'
-                error_details = {
-                    'message': ticket.message,
-                    'details': ticket.details
-                }
-                if ticket.is_device_not_registered():  # Specific check for DeviceNotRegistered
-                    error_details['error_type'] = 'DeviceNotRegistered'
-                delivery_record.receipt_details = error_details  # Store error from ticket
-                logger.error(
-                    f"Expo send error for token {token_str}: {ticket.message} - Details: {ticket.details}")
-            delivery_record.save()
+        with span('publish'):
+            push_tickets = client.publish_multiple(messages_to_send)
+
+        with span('persist'):
+            all_tickets_successful = True
+            for idx, ticket in enumerate(push_tickets):
+                token_str = messages_to_send[idx].to  # Get original token string
+                delivery_record = delivery_records_map.get(token_str)
+                if not delivery_record:
+                    logger.error(
+                        f"Could not find delivery record for token {token_str} during ticket processing.")
+                    continue
+
+                if ticket.status == 'ok':
+                    delivery_record.push_ticket_id = ticket.id
+                    # Or 'receipt_pending_check' if you prefer
+                    delivery_record.status = 'sent_to_expo'
+                    logger.info(
+                        f"Successfully sent to Expo for token {token_str}, ticket ID: {ticket.id}")
+                else:
+                    all_tickets_successful = False
+                    delivery_record.status = 'expo_error'
+                    error_details = {
+                        'message': ticket.message,
+                        'details': ticket.details
+                    }
+                    if ticket.is_device_not_registered():  # Specific check for DeviceNotRegistered
+                        error_details['error_type'] = 'DeviceNotRegistered'
+                    delivery_record.receipt_details = error_details  # Store error from ticket
+                    logger.error(
+                        f"Expo send error for token {token_str}: {ticket.message} - Details: {ticket.details}")
+                delivery_record.save()
 
         if all_tickets_successful:
             notification.status = 'sent'
@@ -166,45 +176,54 @@ def check_expo_push_receipts(delivery_ids_batch):
 
     logger.info(f"Checking receipts for {len(ticket_ids)} tickets.")
     try:
-        client = PushClient()
-        receipts = client.get_receipts(ticket_ids)
+        client = get_push_client()
+        with span('fetch_receipts'):
+            # PushClient has no get_receipts(); check_receipts_multiple() takes tickets and
+            # returns one receipt (with the ticket id) per ticket Expo knows about
+            receipts = {
+                receipt.id: receipt
+                for receipt in client.check_receipts_multiple(
+                    [PushTicket(push_message=None, status=PushTicket.SUCCESS_STATUS, message='',
+                                details=None, id=ticket_id) for ticket_id in ticket_ids])
+            }
 
         processed_notification_ids = set()
 
-        for ticket_id, receipt in receipts.items():
-            try:
-                delivery = NotificationDelivery.objects.get(
-                    push_ticket_id=ticket_id)
-                delivery.receipt_checked_at = timezone.now()
-                delivery.receipt_details = receipt.details
-                processed_notification_ids.add(delivery.notification_id)
-
-                if receipt.status == 'ok':
-                    delivery.status = 'receipt_ok'
-                    delivery.receipt_status_text = 'ok'
-                    logger.info(f"Receipt OK for ticket ID: {ticket_id}")
-                else:
-                    delivery.status = 'receipt_error'
-                    delivery.receipt_status_text = receipt.details.get(
-                        'error', 'unknown_error') if receipt.details else 'unknown_error'
-                    logger.warning(
-                        f"Receipt error for ticket ID {ticket_id}: {receipt.message} - Details: {receipt.details}")
-
-                    if receipt.details and receipt.details.get('error') == 'DeviceNotRegistered':
-                        expo_token_obj = delivery.expo_push_token
-                        if expo_token_obj.is_active:
-                            expo_token_obj.is_active = False
-                            expo_token_obj.save()
-                            logger.info(
-                                f"Token {expo_token_obj.token} marked inactive due to DeviceNotRegistered receipt.")
-                delivery.save()
-
-            except NotificationDelivery.DoesNotExist:
-                logger.error(
-                    f"NotificationDelivery not found for ticket_id {ticket_id} during receipt check.")
-            except Exception as e:
-                logger.exception(
-                    f"Error processing receipt for ticket_id {ticket_id}: {e}")
+        with span('persist'):
+            for ticket_id, receipt in receipts.items():
+                try:
+                    delivery = NotificationDelivery.objects.get(
+                        push_ticket_id=ticket_id)
+                    delivery.receipt_checked_at = timezone.now()
+                    delivery.receipt_details = receipt.details
+                    processed_notification_ids.add(delivery.notification_id)
+
+                    if receipt.status == 'ok':
+                        delivery.status = 'receipt_ok'
+                        delivery.receipt_status_text = 'ok'
+                        logger.info(f"Receipt OK for ticket ID: {ticket_id}")
+                    else:
+                        delivery.status = 'receipt_error'
+                        delivery.receipt_status_text = receipt.details.get(
+                            'error', 'unknown_error') if receipt.details else 'unknown_error'
+                        logger.warning(
+                            f"Receipt error for ticket ID {ticket_id}: {receipt.message} - Details: {receipt.details}")
+
+                        if receipt.details and receipt.details.get('error') == 'DeviceNotRegistered':
+                            expo_token_obj = delivery.expo_push_token
+                            if expo_token_obj.is_active:
+                                expo_token_obj.is_active = False
+                                expo_token_obj.save()
+                                logger.info(
+                                    f"Token {expo_token_obj.token} marked inactive due to DeviceNotRegistered receipt.")
+                    delivery.save()
+
+                except NotificationDelivery.DoesNotExist:
+                    logger.error(
+                        f"NotificationDelivery not found for ticket_id {ticket_id} during receipt check.")
+                except Exception as e:
+                    logger.exception(
+                        f"Error processing receipt for ticket_id {ticket_id}: {e}")
 
         for notif_id in processed_notification_ids:
             update_overall_notification_status(notif_id)
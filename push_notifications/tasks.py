@@ -5,10 +5,12 @@ import logging
 
 from .models import Notification, NotificationDelivery # Import your models
 from .services import send_expo_push_messages, check_expo_push_receipts # Import your services
+from core.task_metrics import measured_task
 
 logger = logging.getLogger(__name__)
 
 # Task to send a notification
+@measured_task
 def send_notification_task(notification_id):
     """ 
     Django Q task to send a specific notification.
@@ -32,6 +34,7 @@ def send_notification_task(notification_id):
             logger.error(f"Task: Failed to update notification status to failed for ID {notification_id}: {e_save}")
 
 # Task to check receipts for a batch of delivery IDs
+@measured_task
 def check_receipts_batch_task(delivery_ids_batch):
     """
     Django Q task to check receipts for a batch of NotificationDelivery IDs.
@@ -1,3 +1,130 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.fake_services.expo import FakeExpoServer
+
+from . import admin as push_admin
+from .models import ExpoPushToken, Notification, NotificationDelivery
+from .services import check_expo_push_receipts, send_expo_push_messages
+
+
+class ExpoRoundTripTests(TestCase):
+    """Sending and receipt checking against the local fake Expo server."""
+
+    def setUp(self):
+        self.expo = FakeExpoServer().start()
+        self.addCleanup(self.expo.stop)
+        settings_override = override_settings(EXPO_PUSH_HOST=self.expo.url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        ExpoPushToken.objects.bulk_create(
+            [ExpoPushToken(token=f"ExponentPushToken[test-{index}]") for index in range(3)])
+        self.notification = Notification.objects.create(title="Title", body="Body")
+
+    def test_send_then_check_receipts(self):
+        send_expo_push_messages(self.notification.id)
+
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.status, 'sent')
+        self.assertEqual(self.expo.messages_received, 3)
+        deliveries = NotificationDelivery.objects.filter(notification=self.notification)
+        self.assertEqual(set(deliveries.values_list('status', flat=True)), {'sent_to_expo'})
+
+        check_expo_push_receipts(list(deliveries.values_list('id', flat=True)))
+
+        self.assertEqual(set(deliveries.values_list('status', flat=True)), {'receipt_ok'})
+        self.notification.refresh_from_db()
+        self.assertEqual(self.notification.status, 'completed_success')
+
+    def test_device_not_registered_receipts_deactivate_tokens(self):
+        self.expo.receipt_error_rate = 1.0
+        send_expo_push_messages(self.notification.id)
+        deliveries = NotificationDelivery.objects.filter(notification=self.notification)
+
+        check_expo_push_receipts(list(deliveries.values_list('id', flat=True)))
+
+        self.assertEqual(set(deliveries.values_list('receipt_status_text', flat=True)), {'DeviceNotRegistered'})
+        self.assertFalse(ExpoPushToken.objects.filter(is_active=True).exists())
+
+
+class DeliveryAdminTests(TestCase):
+    """The admin pages of a notification and its deliveries run a fixed number of queries."""
+
+    def setUp(self):
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        self.notification = Notification.objects.create(title="Broadcast", body="Body", creator=user)
+        self.add_deliveries(10)
+
+    def add_deliveries(self, count):
+        start = ExpoPushToken.objects.count()
+        tokens = ExpoPushToken.objects.bulk_create(
+            [ExpoPushToken(token=f"ExponentPushToken[device-{index}]") for index in range(start, start + count)])
+        NotificationDelivery.objects.bulk_create([
+            NotificationDelivery(notification=self.notification, expo_push_token=token, push_ticket_id=f"ticket-{index}",
+                                 status='receipt_ok' if index % 2 else 'receipt_error')
+            for index, token in enumerate(tokens, start)
+        ])
+
+    def queries(self, url):
+        self.client.get(url)  # Warms the content types cache
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in context.captured_queries]
+
+    def test_delivery_list_queries_do_not_grow_with_rows(self):
+        url = reverse('admin:push_notifications_notificationdelivery_changelist')
+        _, few = self.queries(url)
+        self.add_deliveries(40)
+        response, many = self.queries(url)
+        self.assertEqual(len(many), len(few))
+        self.assertContains(response, 'ExponentPushToken[device-49]')
+
+    def test_notification_page_summarises_deliveries(self):
+        url = reverse('admin:push_notifications_notification_change', args=[self.notification.pk])
+        _, few = self.queries(url)
+        self.add_deliveries(40)
+        response, many = self.queries(url)
+        self.assertEqual(len(many), len(few))
+        self.assertContains(response, '50 deliveries')
+        self.assertContains(response, 'Receipt OK</a> 25')
+        self.assertNotContains(response, 'ticket-0')
+
+        # The summary's links filter the deliveries list
+        filtered = self.client.get(reverse('admin:push_notifications_notificationdelivery_changelist'),
+                                   {'notification__id__exact': self.notification.pk, 'status__exact': 'receipt_ok'})
+        self.assertEqual(filtered.context['cl'].result_count, 25)
+
+    def test_unfiltered_list_is_counted_from_the_estimate(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {NotificationDelivery._meta.db_table}")
+        url = reverse('admin:push_notifications_notificationdelivery_changelist')
+        with mock.patch.object(push_admin, 'EXACT_COUNT_BELOW', 0):
+            response, queries = self.queries(url)
+        self.assertEqual(response.context['cl'].result_count, 10)
+        self.assertFalse([sql for sql in queries if 'COUNT(' in sql])
+
+        # Filtered lists are counted exactly
+        with mock.patch.object(push_admin, 'EXACT_COUNT_BELOW', 0):
+            response, queries = self.queries(url + '?status__exact=receipt_ok')
+        self.assertEqual(response.context['cl'].result_count, 5)
+
+    def test_search_matches_ticket_or_token_prefix(self):
+        url = reverse('admin:push_notifications_notificationdelivery_changelist')
+        response = self.client.get(url, {'q': 'ticket-3'})
+        self.assertEqual([delivery.push_ticket_id for delivery in response.context['cl'].result_list], ['ticket-3'])
+        response = self.client.get(url, {'q': 'ExponentPushToken[device-1'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+        # Prefix only: the middle of a token doesn't match
+        response = self.client.get(url, {'q': 'device-1'})
+        self.assertEqual(response.context['cl'].result_count, 0)
+
+        with mock.patch.object(push_admin, 'SEARCH_MAX_TOKENS', 2):
+            response = self.client.get(url, {'q': 'ExponentPushToken['})
+        self.assertEqual(response.context['cl'].result_count, 10)
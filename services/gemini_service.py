@@ -1,15 +1,343 @@
-from google import genai
-from core.settings import GEMINI_API_KEY
+import logging
+import textwrap
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
+import prometheus_client
+from django.conf import settings
 
-def generate_answer(user_question, knowledge_snippets):
-    """Generates an answer using the Gemini model."""
+from core.instrumentation import span
+from core.settings import GEMINI_API_KEY, GEMINI_BASE_URL
 
-    client = genai.Client(api_key=GEMINI_API_KEY)
+logger = logging.getLogger(__name__)
 
-    # model = genai.GenerativeModel('gemini-pro')
+GEMINI_MODEL = "gemini-2.0-flash"
 
+# Answers that reach neither Gemini model in time are built from the retrieved chunks
+EXTRACTIVE_SNIPPETS = 2
+EXTRACTIVE_SNIPPET_CHARS = 400
+EXTRACTIVE_INTRO = ("Je ne parviens pas à formuler une réponse complète pour le moment. "
+                    "Voici ce que j'ai trouvé à ce sujet :")
+UNAVAILABLE_ANSWER = ("Désolé, je ne parviens pas à répondre pour le moment. "
+                      "Pouvez-vous reposer votre question dans un instant ?")
+CLOSING = "Puis-je vous aider sur autre chose à propos de FER FM ?"
+
+# Prometheus metrics of answer generation (served at /metrics). Hedge rate:
+# ferfm_gemini_answer_calls_total{kind="hedge"} / sum(ferfm_gemini_answers_total)
+GEMINI_ANSWERS = prometheus_client.Counter(
+    'ferfm_gemini_answers_total', 'Answers by the call that produced them.', ['source'])
+GEMINI_ANSWER_CALLS = prometheus_client.Counter(
+    'ferfm_gemini_answer_calls_total', 'Gemini calls made to answer questions.', ['kind'])
+GEMINI_ANSWER_CALL_ERRORS = prometheus_client.Counter(
+    'ferfm_gemini_answer_call_errors_total', 'Failed Gemini answer calls.', ['kind'])
+
+# One client per process, reusing its HTTP connection pool across requests.
+# Connection pools must not be shared across fork(): gunicorn's post_fork hook
+# calls reset_client() so each worker builds its own (see gunicorn.conf.py).
+_client = None
+# Likewise one answer generator (see HedgedGenerator) with its thread pool
+_answer_generator = None
+_answer_generator_lock = threading.Lock()
+
+
+def get_client():
+    """Returns the process-wide Gemini client, creating it on first use."""
+    global _client
+    if _client is None:
+        # Imported lazily: the google-genai SDK is slow to import and only needed per query
+        from google import genai
+        from google.genai import types
+        # GEMINI_BASE_URL points the client at a local stand-in (core/fake_services) for load tests
+        http_options = types.HttpOptions(base_url=GEMINI_BASE_URL) if GEMINI_BASE_URL else None
+        _client = genai.Client(api_key=GEMINI_API_KEY, http_options=http_options)
+    return _client
+
+
+def reset_client():
+    """Drops the cached client (e.g. after fork) so the next call creates a fresh one."""
+    global _client, _answer_generator
+    _client = None
+    # Its pool's threads don't survive fork() either
+    _answer_generator = None
+
+
+def call_model(model, prompt, timeout_ms, client=None):
+    """One generateContent call, abandoned by the HTTP client after `timeout_ms`."""
+    from google.genai import types
+    config = types.GenerateContentConfig(http_options=types.HttpOptions(timeout=max(int(timeout_ms), 1)))
+    return (client or get_client()).models.generate_content(model=model, contents=prompt, config=config).text
+
+
+class LatencyWindow:
+    """The latencies of the last `size` successful calls, for quantile estimates."""
+
+    def __init__(self, size=200, min_samples=20):
+        self.samples = deque(maxlen=size)
+        self.min_samples = min_samples
+        self.lock = threading.Lock()
+
+    def record(self, ms):
+        with self.lock:
+            self.samples.append(ms)
+
+    def quantile(self, q):
+        """None until `min_samples` latencies were recorded."""
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class HedgedGenerator:
+    """
+    Gets an answer from Gemini within a deadline.
+
+    The primary call goes to `model`. If it hasn't answered after the `hedge_quantile`
+    of recent call latencies (`hedge_initial_delay_ms` until enough were observed), an
+    identical hedge call is sent and the first answer wins, so a slow upstream
+    response only costs about one p95. `fallback_reserve_ms` before the deadline, the
+    lighter `fallback_model` is asked too. A failed call brings the next one forward.
+    At the deadline the caller's extractive answer is returned. Calls still running
+    are abandoned: their HTTP timeout is the time left until the deadline.
+    """
+
+    def __init__(self, call=call_model, model=GEMINI_MODEL, fallback_model=None, deadline_ms=8000,
+                 hedge=True, hedge_quantile=0.95, hedge_initial_delay_ms=3000, hedge_min_delay_ms=250,
+                 fallback_reserve_ms=2500, max_concurrent_calls=32):
+        self.call = call
+        self.model = model
+        self.fallback_model = fallback_model
+        self.deadline_ms = deadline_ms
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_initial_delay_ms = hedge_initial_delay_ms
+        self.hedge_min_delay_ms = hedge_min_delay_ms
+        self.fallback_reserve_ms = fallback_reserve_ms
+        self.latencies = LatencyWindow()
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent_calls, thread_name_prefix='gemini')
+        self.lock = threading.Lock()
+        self.counts = Counter()  # answers by source, calls by kind and failed calls, for stats()
+
+    def hedge_delay_ms(self):
+        observed = self.latencies.quantile(self.hedge_quantile)
+        return max(self.hedge_initial_delay_ms if observed is None else observed, self.hedge_min_delay_ms)
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def _plan(self, started, deadline):
+        """[(kind, model, start time)] of the calls to make, in start order."""
+        plan = [('primary', self.model, started)]
+        fallback_at = deadline - self.fallback_reserve_ms / 1000
+        hedge_at = started + self.hedge_delay_ms() / 1000
+        if self.hedge and hedge_at < (fallback_at if self.fallback_model else deadline):
+            plan.append(('hedge', self.model, hedge_at))
+        if self.fallback_model:
+            plan.append(('fallback', self.fallback_model, max(fallback_at, started)))
+        return plan
+
+    def _submit(self, kind, model, prompt, deadline):
+        submitted = time.monotonic()
+        future = self.executor.submit(self.call, model, prompt, (deadline - submitted) * 1000)
+        GEMINI_ANSWER_CALLS.labels(kind=kind).inc()
+        self.count(f'{kind}_calls')
+        if model == self.model:
+            # Every completed call of the main model counts, including abandoned ones,
+            # so the hedge delay follows the real latency distribution
+            def record(done):
+                if not done.cancelled() and done.exception() is None:
+                    self.latencies.record((time.monotonic() - submitted) * 1000)
+            future.add_done_callback(record)
+        return future
+
+    def generate(self, prompt, fallback_answer, deadline=None):
+        """
+        (answer, source): source is 'primary', 'hedge', 'fallback' or 'extractive' (fallback_answer).
+        `deadline` (time.monotonic()) brings the deadline forward, when part of the
+        budget was spent before (see answer_deadline).
+        """
+        started = time.monotonic()
+        deadline = min(started + self.deadline_ms / 1000, deadline or float('inf'))
+        plan = self._plan(started, deadline)
+        pending = {}
+        while True:
+            now = time.monotonic()
+            while plan and plan[0][2] <= now:
+                kind, model, _ = plan.pop(0)
+                pending[self._submit(kind, model, prompt, deadline)] = kind
+            if now >= deadline or not (pending or plan):
+                break
+            next_event = min(plan[0][2], deadline) if plan else deadline
+            done, _ = wait(pending, timeout=next_event - now, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind = pending.pop(future)
+                try:
+                    text = future.result()
+                except Exception as e:
+                    text = None
+                    logger.warning(f"Gemini {kind} call failed: {e}")
+                if text:
+                    GEMINI_ANSWERS.labels(source=kind).inc()
+                    self.count(kind)
+                    return text, kind
+                GEMINI_ANSWER_CALL_ERRORS.labels(kind=kind).inc()
+                self.count(f'{kind}_errors')
+                if plan:
+                    # Don't wait for the hedge (or fallback) time: retry now
+                    plan[0] = (*plan[0][:2], time.monotonic())
+        for future in pending:
+            future.cancel()  # Those not started yet
+        reason = f"No Gemini answer within {self.deadline_ms} ms" if pending else "Every Gemini call failed"
+        logger.warning(f"{reason}, answering from the retrieved chunks.")
+        GEMINI_ANSWERS.labels(source='extractive').inc()
+        self.count('extractive')
+        return fallback_answer, 'extractive'
+
+    def stats(self):
+        """Counters since the generator was created, with the hedge rate and current hedge delay."""
+        with self.lock:
+            counts = dict(self.counts)
+        answers = sum(counts.get(source, 0) for source in ('primary', 'hedge', 'fallback', 'extractive'))
+        return {
+            **counts,
+            'answers': answers,
+            'hedge_rate': round(counts.get('hedge_calls', 0) / answers, 4) if answers else 0.0,
+            'hedge_delay_ms': round(self.hedge_delay_ms(), 1),
+        }
+
+
+def get_answer_generator():
+    """The process-wide HedgedGenerator, configured by the GEMINI_* settings."""
+    global _answer_generator
+    if _answer_generator is None:
+        with _answer_generator_lock:
+            if _answer_generator is None:
+                _answer_generator = HedgedGenerator(
+                    model=GEMINI_MODEL,
+                    fallback_model=getattr(settings, 'GEMINI_FALLBACK_MODEL', None) or None,
+                    deadline_ms=getattr(settings, 'GEMINI_ANSWER_DEADLINE_MS', 8000),
+                    hedge=getattr(settings, 'GEMINI_HEDGE_ENABLED', True),
+                    hedge_quantile=getattr(settings, 'GEMINI_HEDGE_QUANTILE', 0.95),
+                    hedge_initial_delay_ms=getattr(settings, 'GEMINI_HEDGE_INITIAL_DELAY_MS', 3000),
+                    hedge_min_delay_ms=getattr(settings, 'GEMINI_HEDGE_MIN_DELAY_MS', 250),
+                    fallback_reserve_ms=getattr(settings, 'GEMINI_FALLBACK_RESERVE_MS', 2500),
+                    max_concurrent_calls=getattr(settings, 'GEMINI_MAX_CONCURRENT_CALLS', 32),
+                )
+    return _answer_generator
+
+
+def answer_deadline():
+    """
+    time.monotonic() deadline of a question asked now (settings.GEMINI_ANSWER_DEADLINE_MS),
+    shared by every Gemini call made to answer it.
+    """
+    return time.monotonic() + getattr(settings, 'GEMINI_ANSWER_DEADLINE_MS', 8000) / 1000
+
+
+def extractive_answer(knowledge_snippets):
+    """The first retrieved chunks, shortened, for when Gemini doesn't answer in time."""
+    if not knowledge_snippets:
+        return UNAVAILABLE_ANSWER
+    excerpts = '\n\n'.join(
+        textwrap.shorten(snippet, EXTRACTIVE_SNIPPET_CHARS, placeholder=' …')
+        for snippet in knowledge_snippets[:EXTRACTIVE_SNIPPETS])
+    return f"{EXTRACTIVE_INTRO}\n\n{excerpts}\n\n{CLOSING}"
+
+
+def generate_answer(user_question, knowledge_snippets, summary='', history=(), extractive_fallback=True,
+                    deadline=None):
+    """
+    Generates an answer using the Gemini model. `summary` and `history` ((question,
+    answer) pairs, oldest first) carry the conversation so far (see knowledge_base/conversations.py).
+    Hedged and bounded by settings.GEMINI_ANSWER_DEADLINE_MS, or the earlier `deadline`
+    (see answer_deadline), by HedgedGenerator; an
+    extract of the knowledge snippets is returned when Gemini doesn't answer in time,
+    or None without `extractive_fallback` (answers generated offline, see knowledge_base/faq.py).
+    """
+    with span('prompt_build'):
+        prompt = build_prompt(user_question, knowledge_snippets, summary, history)
+
+    with span('gemini_call'):
+        answer, source = get_answer_generator().generate(
+            prompt, extractive_answer(knowledge_snippets) if extractive_fallback else None, deadline)
+    logger.debug(f"Answer from {source}: {answer}")
+    return answer
+
+
+def condense_question(user_question, summary, history, deadline=None):
+    """
+    Rewrites a follow-up question ("Et à Bouaké ?") as a standalone question using the
+    conversation, so retrieval searches for what is actually asked. The call is abandoned
+    at `deadline` (see answer_deadline), the answer getting the rest of the budget.
+    Returns None on error or timeout.
+    """
     prompt = f"""
+    Réécris la dernière question de l'utilisateur pour qu'elle soit compréhensible seule,
+    sans la conversation : remplace les pronoms et les références implicites par ce qu'ils
+    désignent. Garde la langue de l'utilisateur. Ne réponds pas à la question, écris
+    uniquement la question réécrite, sur une ligne.
+
+    {format_conversation(summary, history)}
+
+    DERNIÈRE QUESTION :
+    {user_question}
+
+    QUESTION RÉÉCRITE :
+    """
+    timeout_ms = ((deadline or answer_deadline()) - time.monotonic()) * 1000
+    if timeout_ms <= 0:
+        return None
+    try:
+        with span('condense'):
+            text = call_model(GEMINI_MODEL, prompt, timeout_ms)
+        return (text or '').strip() or None
+    except Exception as e:
+        logger.warning(f"Could not condense the question, searching for it as asked: {e}")
+        return None
+
+
+def summarize_conversation(summary, history, max_words):
+    """Folds (question, answer) pairs into the running summary of a conversation. Returns None on error."""
+    prompt = f"""
+    Voici le résumé d'une conversation entre un auditeur et FERMAN, l'assistant de FER FM,
+    suivi des derniers échanges. Écris un nouveau résumé, en {max_words} mots au plus, qui
+    intègre ces échanges : garde ce que l'utilisateur a dit de lui (ville, trajets, goûts),
+    ses demandes et les informations déjà données. Écris uniquement le résumé.
+
+    {format_conversation(summary, history)}
+
+    NOUVEAU RÉSUMÉ :
+    """
+    try:
+        with span('summarize_conversation'):
+            text = call_model(GEMINI_MODEL, prompt, getattr(settings, 'GEMINI_ANSWER_DEADLINE_MS', 8000))
+        return (text or '').strip() or None
+    except Exception as e:
+        logger.error(f"Gemini API error while summarising a conversation: {e}")
+        return None
+
+
+def format_conversation(summary, history):
+    parts = []
+    if summary:
+        parts.append(f"RÉSUMÉ DE LA CONVERSATION :\n    {summary}")
+    if history:
+        exchanges = '\n'.join(f"    Utilisateur : {question}\n    FERMAN : {answer}" for question, answer in history)
+        parts.append(f"ÉCHANGES RÉCENTS :\n{exchanges}")
+    return '\n\n    '.join(parts)
+
+
+def build_prompt(user_question, knowledge_snippets, summary='', history=()):
+    """
+    Builds the FERMAN prompt from the question, the retrieved knowledge snippets and
+    the conversation so far (bounded by the caller, see knowledge_base/conversations.py).
+    """
+    conversation = format_conversation(summary, history)
+    return f"""
     INSTRUCTIONS:
     Tu es FERMAN, l'assistant virtuel de FER FM - La radio des routes et autoroutes de Côte d'Ivoire.
 
@@ -47,24 +375,15 @@ def generate_answer(user_question, knowledge_snippets):
     *   Tes réponses doivent être détaillées, utiles et refléter le ton chaleureux et engageant.
     *   Intègre les informations de ta base de connaissances de manière fluide et conversationnelle, comme si tu discutais avec un ami.
 
-    À partir de maintenant, tu es FERMAN. Respecte strictement toutes les instructions ci-dessus pour chaque interaction. Commence par ton message d'accueil standard.
+    À partir de maintenant, tu es FERMAN. Respecte strictement toutes les instructions ci-dessus pour chaque interaction. Commence par ton message d'accueil standard, au premier message de la conversation uniquement.
 
     KNOWLEDGE BASE:
     {' '.join(knowledge_snippets)}
 
+    {conversation or "Début de la conversation."}
+
     USER QUESTION:
     {user_question}
 
     ASSISTANT RESPONSE:
     """
-
-    try:
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt,
-        )
-        print("response from gemini", response)
-        return response.text
-    except Exception as e:
-        print(f"Gemini API error: {e}")
-        return "I'm sorry, I encountered an error while generating the answer."